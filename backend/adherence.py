@@ -0,0 +1,235 @@
+"""
+Daily adherence rollups for MediMinder.
+
+Every reminder log increments one `adherence_daily` document keyed by
+(patient_id, prescription_id, day), so adherence reads touch one small
+document per prescription-day instead of every raw log. A deployment
+that predates the rollups gets them built from the raw logs on its first
+startup (see migrations.py).
+
+Rebuild the rollups from raw `reminder_logs` from the backend directory:
+    python adherence.py --rebuild                 # all patients
+    python adherence.py --rebuild --patient <id>  # one patient
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "adherence_daily"
+DAY_FORMAT = "%Y-%m-%d"
+
+# ============= Rollup Maintenance =============
+
+def day_key(moment: datetime) -> str:
+    """UTC calendar day a log is bucketed under"""
+    return moment.strftime(DAY_FORMAT)
+
+
+async def record_reminder_action(db, log: Dict[str, Any]) -> None:
+    """Atomically add one reminder log to its daily rollup document"""
+    await db[ROLLUP_COLLECTION].update_one(
+        {
+            "patient_id": log["patient_id"],
+            "prescription_id": log["prescription_id"],
+            "day": day_key(log["created_at"]),
+        },
+        {
+            "$inc": {f"counts.{log['action']}": 1, "total": 1},
+            "$set": {"updated_at": datetime.utcnow()},
+        },
+        upsert=True,
+    )
+
+
+async def record_reminder_actions(db, logs: Iterable[Dict[str, Any]], delta: int = 1) -> int:
+    """Add many reminder logs to their rollups with one bulk write
+
+    Logs sharing a (patient, prescription, day) become a single upsert with
+    summed counts. A negative `delta` takes deleted logs back out (without
+    upserting). Returns the number of rollup documents touched.
+    """
+    counts: Dict[tuple, Counter] = {}
+    for log in logs:
+        key = (log["patient_id"], log["prescription_id"], day_key(log["created_at"]))
+        counts.setdefault(key, Counter())[log["action"]] += delta
+    if not counts:
+        return 0
+
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {"patient_id": patient_id, "prescription_id": prescription_id, "day": day},
+            {
+                "$inc": {**{f"counts.{action}": n for action, n in actions.items()},
+                         "total": sum(actions.values())},
+                "$set": {"updated_at": now},
+            },
+            upsert=delta > 0,
+        )
+        for (patient_id, prescription_id, day), actions in counts.items()
+    ]
+    await db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+async def rebuild_adherence_rollups(db, patient_id: Optional[str] = None) -> int:
+    """Regenerate rollups from raw reminder_logs; returns documents written
+
+    Readers never see the rollups emptied mid-rebuild. A full rebuild
+    aggregates into a fresh collection that $out swaps in over the live one
+    (keeping its indexes). A one-patient rebuild replaces that patient's
+    documents in place, then deletes the ones no log backs any more.
+    """
+    scope = {"patient_id": patient_id} if patient_id else {}
+    rebuilt_at = datetime.utcnow()
+
+    pipeline = [
+        {"$match": scope},
+        {"$group": {
+            "_id": {
+                "patient_id": "$patient_id",
+                "prescription_id": "$prescription_id",
+                "day": {"$dateToString": {"format": DAY_FORMAT, "date": "$created_at"}},
+                "action": "$action",
+            },
+            "count": {"$sum": 1},
+        }},
+        {"$group": {
+            "_id": {
+                "patient_id": "$_id.patient_id",
+                "prescription_id": "$_id.prescription_id",
+                "day": "$_id.day",
+            },
+            "counts": {"$push": {"k": "$_id.action", "v": "$count"}},
+            "total": {"$sum": "$count"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "patient_id": "$_id.patient_id",
+            "prescription_id": "$_id.prescription_id",
+            "day": "$_id.day",
+            "counts": {"$arrayToObject": "$counts"},
+            "total": 1,
+            "updated_at": {"$literal": rebuilt_at},
+        }},
+    ]
+    if patient_id:
+        pipeline.append({"$merge": {
+            "into": ROLLUP_COLLECTION,
+            "on": ["patient_id", "prescription_id", "day"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }})
+    else:
+        pipeline.append({"$out": ROLLUP_COLLECTION})
+    await db.reminder_logs.aggregate(pipeline, allowDiskUse=True).to_list(None)
+    if patient_id:
+        # Live increments since rebuilt_at carry a later updated_at and are kept
+        await db[ROLLUP_COLLECTION].delete_many({**scope, "updated_at": {"$lt": rebuilt_at}})
+
+    written = await db[ROLLUP_COLLECTION].count_documents(scope)
+    logger.info(f"Rebuilt {written} adherence rollups" + (f" for patient {patient_id}" if patient_id else ""))
+    return written
+
+
+# ============= Rollup Queries =============
+
+def _sum_counts() -> Dict[str, Any]:
+    return {
+        "took": {"$sum": {"$ifNull": ["$counts.took", 0]}},
+        "missed": {"$sum": {"$ifNull": ["$counts.missed", 0]}},
+        "snoozed": {"$sum": {"$ifNull": ["$counts.snoozed", 0]}},
+        "total": {"$sum": "$total"},
+    }
+
+
+def window_start(now: datetime, days: int) -> str:
+    """First rollup day of a `days`-day window ending today"""
+    return day_key(now - timedelta(days=days - 1))
+
+
+def build_adherence_pipeline(patient_id: str, now: datetime, days: int, windows: List[int]) -> List[Dict]:
+    """Build a single $facet aggregation over the rollups for every requested window
+
+    Windows are whole UTC days ending today: a 7-day window covers today
+    and the six days before it.
+    """
+    all_windows = sorted(set(windows) | {days})
+    since_day = window_start(now, max(all_windows))
+    days_since = window_start(now, days)
+
+    facets = {
+        f"w{w}": [
+            {"$match": {"day": {"$gte": window_start(now, w)}}},
+            {"$group": {"_id": None, **_sum_counts()}},
+        ]
+        for w in all_windows
+    }
+    facets["by_prescription"] = [
+        {"$match": {"day": {"$gte": days_since}}},
+        {"$group": {"_id": "$prescription_id", **_sum_counts()}},
+    ]
+    facets["by_day"] = [
+        {"$match": {"day": {"$gte": days_since}}},
+        {"$group": {"_id": "$day", **_sum_counts()}},
+    ]
+
+    return [
+        {"$match": {"patient_id": patient_id, "day": {"$gte": since_day}}},
+        {"$facet": facets},
+    ]
+
+
+def summarize_counts(row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Turn a summed rollup row into the stats payload"""
+    row = row or {}
+    total = row.get("total", 0)
+    took = row.get("took", 0)
+    adherence_rate = (took / total * 100) if total > 0 else 0
+    return {
+        "total": total,
+        "took": took,
+        "missed": row.get("missed", 0),
+        "snoozed": row.get("snoozed", 0),
+        "adherence_rate": round(adherence_rate, 2)
+    }
+
+
+def summarize_groups(rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Turn grouped rollup rows into {group_key: stats}"""
+    return {row["_id"]: summarize_counts(row) for row in sorted(rows, key=lambda r: r["_id"])}
+
+
+async def _main(patient_id: Optional[str]):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'mediminder_db')]
+    try:
+        from indexes import ensure_indexes
+        await ensure_indexes(db)
+        written = await rebuild_adherence_rollups(db, patient_id)
+        print(f"Rebuilt {written} rollup documents")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if "--rebuild" not in sys.argv:
+        print(__doc__)
+        sys.exit(1)
+    patient = sys.argv[sys.argv.index("--patient") + 1] if "--patient" in sys.argv else None
+    asyncio.run(_main(patient))
@@ -0,0 +1,113 @@
+"""
+Response cache for `/ai/explain`.
+
+The canned query types (summary, interactions, dosage, side_effects) build
+deterministic prompts, so their completions are cached by
+(medication, query type, language, prompt version). Custom queries are
+never cached.
+
+Two tiers:
+- a process-local LRU with per-entry expiry;
+- the `ai_explanations` collection with a TTL index, shared by all workers.
+
+Each entry also stores a hash of the exact prompt sent. An entry whose
+prompt no longer matches, for example after a medication was renamed, is a
+miss. Explicit invalidation drops every entry for a medication.
+
+Configured through environment variables:
+    AI_CACHE_TTL_SECONDS  lifetime in both tiers (default 30 days)
+    AI_CACHE_LRU_SIZE     in-memory entries (default 256)
+"""
+
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the system message or prompt templates change
+PROMPT_VERSION = 1
+
+AI_CACHE_TTL_SECONDS = int(os.environ.get('AI_CACHE_TTL_SECONDS', 30 * 24 * 3600))
+
+
+def prompt_hash(system_message: str, prompt: str) -> str:
+    return hashlib.sha256(f"{system_message}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class ExplanationCache:
+    """Two-tier cache of AI explanations for canned query types"""
+
+    def __init__(self, lru_size: Optional[int] = None):
+        self.lru_size = lru_size or int(os.environ.get('AI_CACHE_LRU_SIZE', 256))
+        self._lru: "OrderedDict[str, Tuple[Dict[str, Any], datetime]]" = OrderedDict()
+        self.hits_memory = 0
+        self.hits_persistent = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(medication_key: str, query_type: str, language: str) -> str:
+        return f"{medication_key}|{query_type}|{language.lower()}|v{PROMPT_VERSION}"
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        self._lru[key] = (entry, datetime.utcnow())
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    async def get(self, db, key: str, expected_hash: str) -> Optional[str]:
+        """Return the cached explanation text, or None on a miss"""
+        cached = self._lru.get(key)
+        if cached is not None:
+            entry, stored_at = cached
+            if (datetime.utcnow() - stored_at).total_seconds() < AI_CACHE_TTL_SECONDS \
+                    and entry["prompt_hash"] == expected_hash:
+                self._lru.move_to_end(key)
+                self.hits_memory += 1
+                return entry["response"]
+            del self._lru[key]
+
+        entry = await db.ai_explanations.find_one(
+            {"key": key}, {"_id": 0, "response": 1, "prompt_hash": 1}
+        )
+        if entry and entry["prompt_hash"] == expected_hash:
+            self._remember(key, entry)
+            self.hits_persistent += 1
+            return entry["response"]
+
+        self.misses += 1
+        return None
+
+    async def put(self, db, key: str, medication_key: str, expected_hash: str, response: str) -> None:
+        entry = {"response": response, "prompt_hash": expected_hash}
+        self._remember(key, entry)
+        await db.ai_explanations.update_one(
+            {"key": key},
+            {"$set": {**entry, "medication_key": medication_key, "created_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def invalidate_medication(self, db, medication_key: str) -> int:
+        """Drop every cached explanation for one medication"""
+        prefix = f"{medication_key}|"
+        for key in [k for k in self._lru if k.startswith(prefix)]:
+            del self._lru[key]
+        result = await db.ai_explanations.delete_many({"medication_key": medication_key})
+        return result.deleted_count
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits_memory + self.hits_persistent + self.misses
+        hits = self.hits_memory + self.hits_persistent
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_persistent": self.hits_persistent,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries_memory": len(self._lru),
+        }
+
+
+explanation_cache = ExplanationCache()
@@ -0,0 +1,210 @@
+"""
+Signed, expiring session tokens verified without touching MongoDB.
+
+`verify_otp` issues an HS256 JWT carrying the user's id (`sub`), role, a
+unique `jti` and an expiry. Checking one is pure CPU: the signature is
+verified once, the decoded claims are kept in a small LRU keyed by the
+token, and later requests only re-check expiry and the revocation set.
+
+Logging out revokes a token by `jti`. Revocations go to the
+`revoked_tokens` collection: a TTL index drops them once the token
+would have expired anyway, which keeps the set small. Every instance
+reloads the set into memory on a timer, so another instance's revocation
+takes effect within AUTH_REVOCATION_REFRESH_SECONDS.
+
+Configured through environment variables:
+    AUTH_TOKEN_SECRET                 HMAC key, required: startup fails without it. Supply it
+                                      from the environment or a secret store, never .env in git
+    AUTH_TOKEN_ALLOW_RANDOM_SECRET    "true" (development only) to run without one on a
+                                      random per-process key; tokens die on restart
+    AUTH_TOKEN_TTL_HOURS              token lifetime (default 720, i.e. 30 days)
+    AUTH_TOKEN_CACHE_SIZE             decoded-claims LRU entries (default 10000)
+    AUTH_REVOCATION_REFRESH_SECONDS   revocation reload interval (default 30)
+"""
+
+import asyncio
+import logging
+import os
+import secrets
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
+
+import jwt
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = "HS256"
+ISSUER = "mediminder"
+
+
+class InvalidTokenError(Exception):
+    """Token is malformed, badly signed, expired or revoked"""
+
+
+class TokenService:
+    """Issues and verifies session tokens; owns the claims LRU and revocation set"""
+
+    def __init__(
+        self,
+        secret: Optional[str],
+        ttl_s: int = 720 * 3600,
+        cache_size: int = 10000,
+        refresh_s: float = 30.0,
+    ):
+        self.secret = secret
+        self.ttl_s = ttl_s
+        self.cache_size = cache_size
+        self.refresh_s = refresh_s
+        self._claims: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._revoked: Set[str] = set()
+        self._revoked_here: Dict[str, int] = {}  # jti -> exp, survives reloads racing the insert
+        self._db = None
+        self._task: Optional[asyncio.Task] = None
+        self.verifications = 0
+        self.cache_hits = 0
+        self.rejected = 0
+        self.verify_ns = 0
+        self.refreshes = 0
+
+    @classmethod
+    def from_env(cls) -> "TokenService":
+        secret = os.environ.get('AUTH_TOKEN_SECRET')
+        if not secret and os.environ.get('AUTH_TOKEN_ALLOW_RANDOM_SECRET', '').lower() in ('1', 'true', 'yes'):
+            logger.warning("AUTH_TOKEN_SECRET is not set; using a random key, tokens won't survive a restart")
+            secret = secrets.token_urlsafe(32)
+        return cls(
+            secret,
+            ttl_s=int(float(os.environ.get('AUTH_TOKEN_TTL_HOURS', 720)) * 3600),
+            cache_size=int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000)),
+            refresh_s=float(os.environ.get('AUTH_REVOCATION_REFRESH_SECONDS', 30)),
+        )
+
+    # ============= Issuing and Verifying =============
+
+    def issue(self, user: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """New token for a user document; returns (token, claims)"""
+        now = int(time.time())
+        claims = {
+            "iss": ISSUER,
+            "sub": user["id"],
+            "role": user.get("role", "patient"),
+            "jti": uuid.uuid4().hex,
+            "iat": now,
+            "exp": now + self.ttl_s,
+        }
+        return jwt.encode(claims, self.secret, algorithm=ALGORITHM), claims
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Claims of a valid token; raises InvalidTokenError otherwise"""
+        started = time.perf_counter_ns()
+        self.verifications += 1
+        try:
+            claims = self._claims.get(token)
+            if claims is not None:
+                self.cache_hits += 1
+                self._claims.move_to_end(token)
+                if claims["exp"] <= time.time():
+                    del self._claims[token]
+                    raise InvalidTokenError("Token expired")
+            else:
+                claims = self._decode(token)
+                self._claims[token] = claims
+                if len(self._claims) > self.cache_size:
+                    self._claims.popitem(last=False)
+            if claims["jti"] in self._revoked:
+                raise InvalidTokenError("Token revoked")
+            return claims
+        except InvalidTokenError:
+            self.rejected += 1
+            raise
+        finally:
+            self.verify_ns += time.perf_counter_ns() - started
+
+    def _decode(self, token: str) -> Dict[str, Any]:
+        try:
+            return jwt.decode(
+                token,
+                self.secret,
+                algorithms=[ALGORITHM],
+                issuer=ISSUER,
+                options={"require": ["exp", "iat", "sub", "jti"]},
+            )
+        except jwt.ExpiredSignatureError:
+            raise InvalidTokenError("Token expired")
+        except jwt.InvalidTokenError as e:
+            raise InvalidTokenError(f"Invalid token: {str(e)}")
+
+    # ============= Revocation =============
+
+    async def revoke(self, db, claims: Dict[str, Any]) -> None:
+        """Revoke one token everywhere; effective here immediately"""
+        self._revoked.add(claims["jti"])
+        self._revoked_here[claims["jti"]] = claims["exp"]
+        try:
+            await db.revoked_tokens.insert_one({
+                "jti": claims["jti"],
+                "user_id": claims["sub"],
+                "expires_at": datetime.utcfromtimestamp(claims["exp"]),
+                "revoked_at": datetime.utcnow(),
+            })
+        except DuplicateKeyError:
+            pass  # already revoked
+
+    async def refresh(self, db) -> int:
+        """Reload the revocation set from the database"""
+        rows = await db.revoked_tokens.find(
+            {"expires_at": {"$gt": datetime.utcnow()}}, {"_id": 0, "jti": 1}
+        ).to_list(None)
+        now = time.time()
+        self._revoked_here = {jti: exp for jti, exp in self._revoked_here.items() if exp > now}
+        self._revoked = {row["jti"] for row in rows} | set(self._revoked_here)
+        self.refreshes += 1
+        return len(self._revoked)
+
+    async def start(self, db) -> None:
+        if not self.secret:
+            # Every instance would sign with its own random key: tokens would
+            # fail on the next instance and die on every restart
+            raise RuntimeError("AUTH_TOKEN_SECRET is not set (AUTH_TOKEN_ALLOW_RANDOM_SECRET=true for development)")
+        self._db = db
+        try:
+            await self.refresh(db)
+        except Exception as e:
+            logger.error(f"Revocation list load failed: {str(e)}")
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_s)
+            try:
+                await self.refresh(self._db)
+            except Exception as e:
+                # Keep serving with the last known set
+                logger.error(f"Revocation list refresh failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "verifications": self.verifications,
+            "cache_hits": self.cache_hits,
+            "cached_claims": len(self._claims),
+            "rejected": self.rejected,
+            "revoked": len(self._revoked),
+            "revocation_refreshes": self.refreshes,
+            "avg_verify_us": round(self.verify_ns / self.verifications / 1000, 2) if self.verifications else None,
+        }
+
+
+token_service = TokenService.from_env()
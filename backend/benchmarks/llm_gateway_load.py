@@ -0,0 +1,80 @@
+"""
+Offline load test of the LLM gateway against the fake provider.
+
+Fires a burst of concurrent completions through `LLMGateway` and reports
+throughput, latency percentiles and how failures were absorbed (retries,
+timeouts, breaker rejections). No server, database or network is needed:
+
+    cd backend
+    python benchmarks/llm_gateway_load.py --requests 500 --concurrency 100 --failure-rate 0.05
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm import FakeLLMProvider, LLMGateway, LLMTimeoutError, LLMUnavailableError  # noqa: E402
+
+
+async def one_call(gateway: LLMGateway, i: int, outcomes: dict, latencies: list):
+    started = time.perf_counter()
+    try:
+        await gateway.complete("gpt-4o-mini", "system", f"question {i}")
+        outcomes["ok"] += 1
+        latencies.append(time.perf_counter() - started)
+    except LLMUnavailableError:
+        outcomes["rejected"] += 1
+    except LLMTimeoutError:
+        outcomes["timeout"] += 1
+    except Exception:
+        outcomes["failed"] += 1
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100, help="callers in flight at once")
+    parser.add_argument("--max-in-flight", type=int, default=8, help="gateway limit per model")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--first-token-ms", type=float, default=50)
+    parser.add_argument("--token-ms", type=float, default=1)
+    args = parser.parse_args()
+    logging.getLogger("llm").setLevel(logging.ERROR)  # retries are reported in the totals
+
+    provider = FakeLLMProvider(first_token_ms=args.first_token_ms, token_ms=args.token_ms,
+                               tokens=20, failure_rate=args.failure_rate)
+    gateway = LLMGateway(provider, max_in_flight=args.max_in_flight, timeout_s=args.timeout,
+                         backoff_base_s=0.05, backoff_cap_s=0.5)
+    await gateway.start()
+
+    outcomes = {"ok": 0, "failed": 0, "timeout": 0, "rejected": 0}
+    latencies = []
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def bounded(i: int):
+        async with gate:
+            await one_call(gateway, i, outcomes, latencies)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(bounded(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    await gateway.close()
+
+    print(f"{args.requests} requests in {elapsed:.2f}s ({args.requests / elapsed:.1f} req/s), "
+          f"upstream calls {provider.calls}")
+    print(f"outcomes {outcomes}")
+    if latencies:
+        ms = sorted(x * 1000 for x in latencies)
+        print(f"latency p50 {statistics.median(ms):.1f} ms   p99 {ms[int(len(ms) * 0.99) - 1]:.1f} ms")
+    print(f"gateway {gateway.stats()['models']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
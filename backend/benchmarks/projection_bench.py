@@ -0,0 +1,136 @@
+"""
+Response size and latency with and without sparse fieldsets.
+
+Builds a catalog of `--medications` medications, a quarter of them with a
+stored photo (~`--photo-kb` KB of base64) and every one with a long
+description and side-effect text, then compares:
+
+- search: whole documents (what /medications/search used to return)
+  versus the default list projection and a `fields=name,strength` pick,
+  encoded the way FastAPI encodes a response. Runs offline.
+- with --mongo: a 100-document list read through find() with `{"_id": 0}`
+  versus the default list projection, so the heavy fields never leave the
+  server. Uses a scratch collection that is dropped afterwards.
+
+    cd backend
+    python benchmarks/projection_bench.py
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/projection_bench.py --mongo
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from projections import Resource  # noqa: E402
+from search_index import MedicationSearchIndex  # noqa: E402
+
+FIELDS = ["id", "name", "name_normalized", "generic_name", "form", "strength", "manufacturer",
+          "image_base64", "description", "common_uses", "side_effects", "created_at"]
+HEAVY = ["image_base64", "description", "side_effects"]
+MEDICATIONS = Resource("medication", FIELDS, heavy=HEAVY)
+SEARCH = Resource("medication", set(FIELDS) - {"image_base64"}, heavy=["description", "side_effects"])
+WORDS = ["para", "ceta", "mol", "ibu", "pro", "fen", "amox", "cillin", "met", "formin", "ator", "vastatin"]
+
+
+def make_medication(i: int, photo_kb: int) -> dict:
+    name = "".join(random.sample(WORDS, 3)).capitalize() + f" {i}"
+    return {
+        "id": str(uuid.uuid4()),
+        "name": name,
+        "name_normalized": name.lower(),
+        "generic_name": name.lower(),
+        "form": "tablet",
+        "strength": f"{random.choice([5, 10, 250, 500])}mg",
+        "manufacturer": "Bench Labs",
+        "image_base64": base64.b64encode(os.urandom(photo_kb * 768)).decode() if i % 4 == 0 else None,
+        "description": "Lorem ipsum dolor sit amet. " * 40,
+        "common_uses": "Pain, fever",
+        "side_effects": "Nausea, dizziness, headache. " * 30,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def encode(payload) -> bytes:
+    return json.dumps(jsonable_encoder(payload)).encode("utf-8")
+
+
+def measure(label: str, build, repeat: int):
+    samples, size = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(encode(build()))
+        samples.append((time.perf_counter() - started) * 1000)
+    print(f"{label:26s} {size / 1024:9.1f} KB   p50 {statistics.median(samples):7.2f} ms")
+
+
+def bench_search(medications, repeat: int):
+    index = MedicationSearchIndex()
+    for med in medications:
+        index.add(med, sort=False)
+    index.flush()
+    by_id = {m["id"]: m for m in medications}
+    query = "ibu"
+    hits = index.search(query, limit=20)
+    print(f"search '{query}': {len(hits)} hits")
+    measure("  whole documents", lambda: {"medications": [by_id[h["id"]] for h in index.search(query, 20)]}, repeat)
+    measure("  default projection", lambda: {"medications": [
+        SEARCH.select(h, None, list_view=True) for h in index.search(query, 20)]}, repeat)
+    measure("  fields=name,strength", lambda: {"medications": [
+        SEARCH.select(h, "name,strength", list_view=True) for h in index.search(query, 20)]}, repeat)
+
+
+async def bench_mongo(medications, repeat: int):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    collection = client[os.environ.get("DB_NAME", "mediminder_db")][f"bench_projection_{uuid.uuid4().hex[:8]}"]
+    try:
+        await collection.insert_many([dict(m) for m in medications])
+
+        async def timed(label, projection):
+            samples, size = [], 0
+            for _ in range(repeat):
+                started = time.perf_counter()
+                docs = await collection.find({}, projection).limit(100).to_list(100)
+                size = len(encode({"medications": docs}))
+                samples.append((time.perf_counter() - started) * 1000)
+            print(f"{label:26s} {size / 1024:9.1f} KB   p50 {statistics.median(samples):7.2f} ms")
+
+        print("list of 100 from MongoDB:")
+        await timed("  {'_id': 0}", {"_id": 0})
+        await timed("  default projection", MEDICATIONS.projection(None, list_view=True))
+        await timed("  fields=name,strength", MEDICATIONS.projection("name,strength"))
+    finally:
+        await collection.drop()
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--medications", type=int, default=2000)
+    parser.add_argument("--photo-kb", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--mongo", action="store_true", help="also measure find() against MONGO_URL")
+    args = parser.parse_args()
+    random.seed(7)
+
+    medications = [make_medication(i, args.photo_kb) for i in range(args.medications)]
+    bench_search(medications, args.repeat)
+    if args.mongo:
+        asyncio.run(bench_mongo(medications, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
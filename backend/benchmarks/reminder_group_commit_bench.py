@@ -0,0 +1,128 @@
+"""
+Reminder-log insert throughput: one insert per request versus group commit.
+
+Simulates a medication peak: `--clients` concurrent clients each log
+`--per-client` doses as fast as acknowledgements come back. Both paths write
+with w="majority", so each write is equally durable when it returns. Needs a
+MongoDB (ideally a replica set, where majority acknowledgement costs a real
+round trip); documents go to a scratch collection that is dropped afterwards:
+
+    cd backend
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/reminder_group_commit_bench.py --clients 1000
+
+Without a MongoDB, --simulate-rtt-ms replaces the collection with a model
+of one: each call holds one of 100 pooled connections (the benchmark's
+maxPoolSize) for a round trip plus --simulate-doc-us per document. That
+measures the writer's batching and overhead, not the database.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from group_commit import GroupCommitWriter  # noqa: E402
+
+
+class SimulatedCollection:
+    """A majority-acknowledged collection reduced to pool slots and round trips"""
+
+    def __init__(self, rtt_ms: float, doc_us: float, pool: int = 100):
+        self.rtt_s = rtt_ms / 1000
+        self.doc_s = doc_us / 1_000_000
+        self._pool = asyncio.Semaphore(pool)
+
+    async def insert_one(self, doc):
+        async with self._pool:
+            await asyncio.sleep(self.rtt_s + self.doc_s)
+
+    async def insert_many(self, docs, ordered=True):
+        async with self._pool:
+            await asyncio.sleep(self.rtt_s + self.doc_s * len(docs))
+
+
+def make_log(client_id: int) -> dict:
+    now = datetime.utcnow()
+    return {
+        "id": str(uuid.uuid4()),
+        "prescription_id": f"bench-rx-{client_id % 50}",
+        "patient_id": f"bench-patient-{client_id % 200}",
+        "scheduled_at": now,
+        "action": "took",
+        "action_at": now,
+        "created_at": now,
+    }
+
+
+async def run_clients(clients: int, per_client: int, write):
+    latencies = []
+
+    async def client(client_id: int):
+        for _ in range(per_client):
+            started = time.perf_counter()
+            await write(make_log(client_id))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    return time.perf_counter() - started, latencies
+
+
+def report(label: str, total: int, elapsed: float, latencies: list):
+    ms = sorted(x * 1000 for x in latencies)
+    print(f"{label:14s} {total / elapsed:9.0f} docs/s   "
+          f"p50 {statistics.median(ms):7.1f} ms   p99 {ms[int(len(ms) * 0.99) - 1]:7.1f} ms")
+
+
+async def compare(collection, total: int, args):
+    elapsed, latencies = await run_clients(args.clients, args.per_client, collection.insert_one)
+    report("per-request", total, elapsed, latencies)
+
+    writer = GroupCommitWriter(collection, max_batch=args.max_batch, max_delay_ms=args.max_delay_ms)
+    writer.start()
+    elapsed, latencies = await run_clients(args.clients, args.per_client, writer.write)
+    await writer.close()
+    report("group commit", total, elapsed, latencies)
+    print(f"group commit stats {writer.stats()}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--per-client", type=int, default=5)
+    parser.add_argument("--max-batch", type=int, default=500)
+    parser.add_argument("--max-delay-ms", type=float, default=5)
+    parser.add_argument("--simulate-rtt-ms", type=float, help="run against a modelled collection instead")
+    parser.add_argument("--simulate-doc-us", type=float, default=20)
+    args = parser.parse_args()
+
+    total = args.clients * args.per_client
+    if args.simulate_rtt_ms is not None:
+        collection = SimulatedCollection(args.simulate_rtt_ms, args.simulate_doc_us)
+        await compare(collection, total, args)
+        return
+
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'), maxPoolSize=100)
+    db = client[os.environ.get('DB_NAME', 'mediminder_bench')]
+    collection = db[f"bench_reminder_logs_{uuid.uuid4().hex[:8]}"].with_options(
+        write_concern=WriteConcern(w="majority")
+    )
+    try:
+        await collection.create_index("id", unique=True)
+        await compare(collection, total, args)
+    finally:
+        await collection.drop()
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Schedule expansion and log join over a synthetic patient.
+
+Expands a year of doses for `--prescriptions` prescriptions (1-4 times a
+day, some on weekdays only, some ending mid-year), then joins them against
+`--logs` reminder logs. Runs offline:
+
+    cd backend
+    python benchmarks/schedule_bench.py --prescriptions 300
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schedule import expand_schedules, log_minutes, match_logs, occurrence_statuses  # noqa: E402
+
+TIMES = ["07:30", "08:00", "12:00", "14:00", "20:00", "9:30 PM"]
+
+
+def make_prescriptions(count: int):
+    return [
+        {
+            "id": f"rx-{i}",
+            "schedule": {
+                "times": random.sample(TIMES, random.randint(1, 4)),
+                "days": random.choice([[], [], ["Mon", "Wed", "Fri"]]),
+            },
+            "start_date": "2026-01-01",
+            "end_date": random.choice([None, None, "2026-09-01"]),
+        }
+        for i in range(count)
+    ]
+
+
+def timed(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prescriptions", type=int, default=300)
+    parser.add_argument("--logs", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    random.seed(7)
+
+    prescriptions = make_prescriptions(args.prescriptions)
+    start, end = datetime(2026, 1, 1), datetime(2027, 1, 1)
+    occurrences, samples = timed(lambda: expand_schedules(prescriptions, start, end, 330), args.repeat)
+    print(f"expand   {len(occurrences.scheduled_at):7d} occurrences   "
+          f"p50 {statistics.median(samples):6.2f} ms   min {min(samples):6.2f} ms")
+
+    picks = random.sample(range(len(occurrences.prescription)), min(args.logs, len(occurrences.prescription)))
+    ids = [occurrences.prescription_ids[occurrences.prescription[i]] for i in picks]
+    moments = [occurrences.scheduled_at[i].astype(datetime) + timedelta(minutes=random.randint(-60, 60))
+               for i in picks]
+    actions = [random.choice(["took", "took", "missed", "snoozed"]) for _ in picks]
+    minutes = log_minutes(moments)
+
+    def join():
+        ranks = match_logs(occurrences, ids, minutes, actions)
+        return occurrence_statuses(occurrences, ranks, datetime(2026, 7, 1))
+
+    _, samples = timed(join, max(args.repeat // 5, 3))
+    print(f"join     {len(picks):7d} logs          "
+          f"p50 {statistics.median(samples):6.2f} ms   min {min(samples):6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark the in-process medication search index.
+
+Builds a synthetic catalog and times autocomplete queries the way the
+add-medication screen issues them (one request per keystroke).
+
+    cd backend && python benchmarks/search_index_bench.py [--entries 100000] [--queries 20000]
+"""
+
+import argparse
+import gc
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from search_index import MedicationSearchIndex  # noqa: E402
+
+SYLLABLES = ["am", "lo", "di", "pine", "met", "for", "min", "par", "ace", "ta", "mol", "ox", "cil",
+             "lin", "sar", "tan", "pra", "zole", "ril", "nol", "ol", "vas", "tin", "ator", "ro", "su",
+             "cef", "dox", "fen", "gab", "hy", "ke", "lev", "nap", "pro", "quin", "ram", "ser", "tra",
+             "val", "war", "xa", "zep", "bu", "clo", "dex", "eso", "flu", "gli", "ibu", "lam", "mon"]
+STRENGTHS = ["5mg", "10mg", "20mg", "50mg", "75mg", "100mg", "250mg", "500mg", "1g", "50mcg"]
+FORMS = ["", " Tablets", " Capsules", " Oral Suspension", " XR", " Dispersible"]
+
+
+def synthetic_name(rng: random.Random) -> str:
+    stem = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+    return f"{stem.capitalize()} {rng.choice(STRENGTHS)}{rng.choice(FORMS)}"
+
+
+def build_catalog(n: int, rng: random.Random):
+    for i in range(n):
+        name = synthetic_name(rng)
+        yield {
+            "id": f"med-{i}",
+            "name": name,
+            "generic_name": name.split()[0],
+            "form": "tablet",
+        }
+
+
+def keystroke_queries(names, count: int, rng: random.Random):
+    queries = []
+    while len(queries) < count:
+        name = rng.choice(names).lower()
+        start = 0 if rng.random() < 0.7 else rng.randint(1, max(1, len(name) - 3))
+        for end in range(start + 1, min(len(name), start + 10) + 1):
+            queries.append(name[start:end])
+    queries.append("".join(rng.choice(string.ascii_lowercase) for _ in range(6)))  # miss
+    return queries[:count]
+
+
+def percentile(sorted_values, pct: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    catalog = list(build_catalog(args.entries, rng))
+
+    index = MedicationSearchIndex()
+    started = time.perf_counter()
+    for doc in catalog:
+        index.add(doc, sort=False)
+    index.flush()
+    build_s = time.perf_counter() - started
+
+    # Long-lived index structures shouldn't be rescanned by the cyclic GC on every query
+    gc.collect()
+    gc.freeze()
+
+    queries = keystroke_queries([d["name"] for d in catalog], args.queries, rng)
+    timings = []
+    for q in queries:
+        t0 = time.perf_counter_ns()
+        index.search(q)
+        timings.append((time.perf_counter_ns() - t0) / 1000)
+    timings.sort()
+
+    print(f"entries:  {len(index)}  (built in {build_s:.2f}s)")
+    print(f"queries:  {len(timings)}")
+    for label, pct in (("p50", 0.50), ("p90", 0.90), ("p99", 0.99), ("max", 1.0)):
+        print(f"{label}:      {percentile(timings, pct):9.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Serialization cost of a `get_reminder_logs` response, before and after.
+
+Builds a response with `--logs` reminder-log documents shaped as they
+come back from Mongo. It then compares FastAPI's stock path
+(jsonable_encoder, then json.dumps in JSONResponse) with the one the API
+now uses (JSONObjectRoute's TypeAdapter, then orjson in APIResponse):
+
+- encode: the body-to-bytes step alone;
+- request: a full GET through two otherwise identical apps, so routing
+  and the ASGI round trip are included.
+
+Runs offline:
+
+    cd backend
+    python benchmarks/serialization_bench.py --logs 1000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi import APIRouter, FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serialization import APIResponse, JSONObject, JSONObjectRoute, dumps  # noqa: E402
+
+
+def make_body(count: int) -> dict:
+    now = datetime.utcnow()
+    logs = []
+    for i in range(count):
+        at = now - timedelta(minutes=37 * i)
+        logs.append({
+            "id": str(uuid.uuid4()),
+            "prescription_id": f"rx-{i % 12}",
+            "patient_id": "bench-patient",
+            "scheduled_at": at - timedelta(minutes=5),
+            "action": ("took", "took", "missed", "snoozed")[i % 4],
+            "action_at": at,
+            "with_food_confirmed": bool(i % 2) if i % 3 else None,
+            "note": "felt dizzy afterwards" if i % 17 == 0 else None,
+            "source": "sweeper" if i % 4 == 2 else None,
+            "created_at": at,
+        })
+    return {"success": True, "logs": logs, "next_cursor": None}
+
+
+def timed(fn, repeat: int):
+    fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def make_app(body: dict, fast: bool) -> TestClient:
+    if fast:
+        app = FastAPI(default_response_class=APIResponse)
+        router = APIRouter(route_class=JSONObjectRoute)
+    else:
+        app = FastAPI()
+        router = APIRouter()
+
+    @router.get("/logs")
+    async def logs():
+        return body
+
+    app.include_router(router)
+    return TestClient(app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logs", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    body = make_body(args.logs)
+    adapter = TypeAdapter(JSONObject)
+
+    def before():
+        return JSONResponse(content=None).render(jsonable_encoder(body))
+
+    def after():
+        return dumps(adapter.dump_python(adapter.validate_python(body), mode="json"))
+
+    assert json.loads(before()) == json.loads(after()), "both paths must produce the same JSON"
+    size = len(after())
+    print(f"{args.logs} logs, {size / 1024:.0f} KB of JSON")
+    print(f"encode    before {timed(before, args.repeat):7.2f} ms   after {timed(after, args.repeat):7.2f} ms")
+
+    slow, fast = make_app(body, fast=False), make_app(body, fast=True)
+    print(f"request   before {timed(lambda: slow.get('/logs'), args.repeat):7.2f} ms   "
+          f"after {timed(lambda: fast.get('/logs'), args.repeat):7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Conditional GET for documents that carry a `revision` counter.
+
+Patients, prescriptions and medications store `revision`, incremented by
+every write (a missing field counts as 0). A response's strong ETag is
+derived from the revision(s) it was built from plus everything else that
+shapes the body (`fields`, paging), so it changes exactly when the bytes
+would.
+
+When a request carries If-None-Match, the route first reads only the
+revision (or only id + revision for a list page). On a match it answers
+304 without loading or serializing the documents.
+"""
+
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from fastapi import Request, Response
+
+from pagination import fetch_page
+
+REVISION = "revision"
+# Patient data: caches must revalidate, and only the client may keep a copy
+CACHE_CONTROL = "private, no-cache"
+
+# Add to update documents of every write route: {"$inc": REVISION_BUMP}
+REVISION_BUMP = {REVISION: 1}
+# The same inside an update pipeline's $set stage
+REVISION_BUMP_PIPELINE = {REVISION: {"$add": [{"$ifNull": ["$" + REVISION, 0]}, 1]}}
+
+
+def _variant(parts: Iterable[Any]) -> str:
+    key = "\x00".join("" if p is None else str(p) for p in parts)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:12] if key.strip("\x00") else ""
+
+
+def document_etag(doc: Dict[str, Any], *variant: Any) -> str:
+    """ETag for one document rendered with `variant` (e.g. the fields selection)"""
+    suffix = _variant(variant)
+    return f'"{doc["id"]}.{doc.get(REVISION, 0)}' + (f'.{suffix}"' if suffix else '"')
+
+
+def list_etag(docs: Iterable[Dict[str, Any]], *variant: Any) -> str:
+    """ETag for a list: changes when any member is added, removed or revised"""
+    digest = hashlib.sha256()
+    for doc in docs:
+        digest.update(f"{doc['id']}:{doc.get(REVISION, 0)};".encode("utf-8"))
+    digest.update(_variant(variant).encode("utf-8"))
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match evaluation (weak comparison, as RFC 9110 requires for it)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (t.strip() for t in if_none_match.split(","))
+    return etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+# ============= Route Helpers =============
+
+async def conditional_find_one(
+    collection, query: Dict[str, Any], projection: Dict[str, Any], request: Request, response: Response
+) -> Union[Dict[str, Any], Response, None]:
+    """find_one() behind an If-None-Match check
+
+    Returns a 304 Response when the client's copy is current, otherwise the
+    document (None if missing) with its ETag set on `response`. The
+    projection must include id and revision.
+    """
+    variant = sorted(projection.items())
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        current = await collection.find_one(query, {"_id": 0, "id": 1, REVISION: 1})
+        if current and etag_matches(if_none_match, document_etag(current, variant)):
+            return not_modified(document_etag(current, variant))
+    doc = await collection.find_one(query, projection)
+    if doc:
+        set_etag(response, document_etag(doc, variant))
+    return doc
+
+
+async def conditional_page(
+    collection,
+    query: Dict[str, Any],
+    projection: Dict[str, Any],
+    limit: int,
+    cursor: Optional[str],
+    request: Request,
+    response: Response,
+    descending: bool = False,
+) -> Union[Tuple[List[Dict[str, Any]], Optional[str]], Response]:
+    """fetch_page() behind an If-None-Match check on the page's ids and revisions"""
+    variant = (sorted(projection.items()), limit, cursor, descending)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        keys, next_cursor = await fetch_page(
+            collection, query, {"_id": 0, "id": 1, "created_at": 1, REVISION: 1}, limit, cursor, descending
+        )
+        etag = list_etag(keys, next_cursor, *variant)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    docs, next_cursor = await fetch_page(collection, query, projection, limit, cursor, descending)
+    set_etag(response, list_etag(docs, next_cursor, *variant))
+    return docs, next_cursor
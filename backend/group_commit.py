@@ -0,0 +1,143 @@
+"""
+Group-commit writer for high-rate inserts.
+
+At medication peaks many `/reminders/log` calls arrive within a few
+milliseconds of each other. Instead of each request paying its own write
+round trip, requests enqueue their document and await a future; one
+background task drains the queue with `insert_many` whenever `max_batch`
+documents are waiting or `max_delay_ms` has passed since the first one
+arrived, whichever comes first. Futures resolve only after the batch is
+acknowledged with the collection's write concern (use w="majority" for
+durability), so responses keep the per-request guarantees.
+
+Configured through environment variables:
+    REMINDER_GROUP_COMMIT      "true" to route reminder logs through the writer (default false)
+    REMINDER_GROUP_COMMIT_MS   longest a document waits for its batch (default 5)
+    REMINDER_GROUP_COMMIT_MAX  documents per insert_many (default 500)
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+
+logger = logging.getLogger(__name__)
+
+
+def group_commit_enabled() -> bool:
+    return os.environ.get('REMINDER_GROUP_COMMIT', '').lower() in ('1', 'true', 'yes')
+
+
+class GroupCommitWriter:
+    """Batches concurrent single-document inserts into insert_many calls"""
+
+    def __init__(self, collection, max_batch: Optional[int] = None, max_delay_ms: Optional[float] = None,
+                 after_flush: Optional[Callable[[List[Dict[str, Any]]], Awaitable[Any]]] = None):
+        self.collection = collection
+        self.max_batch = max_batch or int(os.environ.get('REMINDER_GROUP_COMMIT_MAX', 500))
+        self.max_delay_s = (max_delay_ms if max_delay_ms is not None
+                            else float(os.environ.get('REMINDER_GROUP_COMMIT_MS', 5))) / 1000
+        self.after_flush = after_flush
+        self._queue: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._pending = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.flushes = 0
+        self.documents = 0
+        self.failures = 0
+        self.largest_batch = 0
+
+    def start(self):
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run(), name="group-commit")
+
+    async def close(self):
+        """Flush whatever is queued, then stop"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._pending.set()
+        self._full.set()
+        await self._task
+        self._task = None
+
+    async def write(self, doc: Dict[str, Any]) -> None:
+        """Insert one document as part of the next batch; returns once it is acknowledged"""
+        if self._task is None or self._closing:
+            raise RuntimeError("Group-commit writer is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((doc, future))
+        self._pending.set()
+        if len(self._queue) >= self.max_batch:
+            self._full.set()
+        await future
+
+    async def _run(self):
+        while True:
+            await self._pending.wait()
+            if not self._closing and len(self._queue) < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.max_delay_s)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            if len(self._queue) < self.max_batch and not self._closing:
+                self._full.clear()
+            if not self._queue and not self._closing:
+                self._pending.clear()
+
+            if batch:
+                await self._flush(batch)
+            elif self._closing:
+                return
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        docs = [doc for doc, _ in batch]
+        errors: Dict[int, Exception] = {}
+        try:
+            await self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                cls = DuplicateKeyError if error.get("code") == 11000 else WriteError
+                errors[error["index"]] = cls(error.get("errmsg"), error.get("code"), error)
+        except Exception as e:
+            errors = {i: e for i in range(len(batch))}
+
+        written = [doc for i, doc in enumerate(docs) if i not in errors]
+        if written and self.after_flush is not None:
+            try:
+                await self.after_flush(written)
+            except Exception as e:
+                logger.error(f"Group-commit after_flush failed: {str(e)}")
+                errors.update({i: e for i in range(len(batch)) if i not in errors})
+
+        self.flushes += 1
+        self.documents += len(batch)
+        self.failures += len(errors)
+        self.largest_batch = max(self.largest_batch, len(batch))
+
+        for i, (_, future) in enumerate(batch):
+            if future.done():
+                continue  # caller went away; the document was still written
+            if i in errors:
+                future.set_exception(errors[i])
+            else:
+                future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "flushes": self.flushes,
+            "documents": self.documents,
+            "failures": self.failures,
+            "average_batch": round(self.documents / self.flushes, 2) if self.flushes else 0.0,
+            "largest_batch": self.largest_batch,
+            "queued": len(self._queue),
+            "max_batch": self.max_batch,
+            "max_delay_ms": self.max_delay_s * 1000,
+        }
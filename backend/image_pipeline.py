@@ -0,0 +1,150 @@
+"""
+Image preprocessing for `/ocr/recognize`.
+
+Camera photos arrive as multi-megabyte base64 JPEGs. Before they are sent
+to the vision model they are decoded, auto-oriented from EXIF, downscaled
+to a bounded long edge, optionally converted to grayscale, perceptually
+hashed and re-encoded as a quality-tuned JPEG. The work is CPU-bound, so it runs in a dedicated
+thread pool instead of on the event loop.
+
+Configured through environment variables:
+    OCR_MAX_EDGE          longest edge in pixels after resizing (default 1568)
+    OCR_GRAYSCALE         "true" to drop colour before encoding (default false)
+    OCR_JPEG_QUALITY      JPEG quality 1-95 (default 80)
+    OCR_PREPROCESS_WORKERS  thread pool size (default 2)
+"""
+
+import asyncio
+import base64
+import binascii
+import io
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from pydantic import BaseModel
+
+from ocr_cache import dhash
+
+logger = logging.getLogger(__name__)
+
+
+class PreprocessConfig(BaseModel):
+    max_edge: int = 1568
+    grayscale: bool = False
+    jpeg_quality: int = 80
+
+    @classmethod
+    def from_env(cls) -> "PreprocessConfig":
+        return cls(
+            max_edge=int(os.environ.get('OCR_MAX_EDGE', 1568)),
+            grayscale=os.environ.get('OCR_GRAYSCALE', '').lower() in ('1', 'true', 'yes'),
+            jpeg_quality=int(os.environ.get('OCR_JPEG_QUALITY', 80)),
+        )
+
+
+class PreprocessedImage(BaseModel):
+    image_base64: str
+    width: int
+    height: int
+    bytes_in: int
+    bytes_out: int
+    phash: str  # 64-bit dHash, hex; keys the OCR result cache
+    stage_ms: Dict[str, float]
+
+
+class InvalidImageError(ValueError):
+    """Raised when the upload cannot be decoded as an image"""
+
+
+# Everything decoding untrusted upload bytes may raise; DecompressionBombError
+# (dimensions over twice Image.MAX_IMAGE_PIXELS) is not an OSError
+DECODE_ERRORS = (binascii.Error, UnidentifiedImageError, Image.DecompressionBombError, OSError)
+
+
+def strip_data_url(image_base64: str) -> str:
+    if image_base64.startswith("data:") and "," in image_base64:
+        return image_base64.split(",", 1)[1]
+    return image_base64
+
+
+def preprocess_image(image_base64: str, config: PreprocessConfig) -> PreprocessedImage:
+    """Decode, orient, resize and re-encode one image (blocking)"""
+    stage_ms: Dict[str, float] = {}
+    mark = time.perf_counter()
+
+    def lap(stage: str):
+        nonlocal mark
+        now = time.perf_counter()
+        stage_ms[stage] = round((now - mark) * 1000, 2)
+        mark = now
+
+    try:
+        raw = base64.b64decode(strip_data_url(image_base64), validate=False)
+        img = Image.open(io.BytesIO(raw))
+        # Let the JPEG decoder skip detail we'd throw away (DCT scaling)
+        scale = config.max_edge / max(img.size)
+        if scale < 1:
+            img.draft("RGB", (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+        img.load()
+    except DECODE_ERRORS as e:
+        raise InvalidImageError(f"Could not decode image: {str(e)}")
+    lap("decode")
+
+    ImageOps.exif_transpose(img, in_place=True)
+    lap("orient")
+
+    if max(img.size) > config.max_edge:
+        img.thumbnail((config.max_edge, config.max_edge), Image.Resampling.LANCZOS)
+    lap("resize")
+
+    img = img.convert("L" if config.grayscale else "RGB")
+    lap("convert")
+
+    phash = dhash(img)
+    lap("hash")
+
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=config.jpeg_quality, optimize=True)
+    encoded = out.getvalue()
+    lap("encode")
+
+    return PreprocessedImage(
+        image_base64=base64.b64encode(encoded).decode("ascii"),
+        width=img.width,
+        height=img.height,
+        bytes_in=len(raw),
+        bytes_out=len(encoded),
+        phash=f"{phash:016x}",
+        stage_ms=stage_ms,
+    )
+
+
+class ImagePreprocessor:
+    """Runs preprocess_image on a bounded thread pool"""
+
+    def __init__(self, config: Optional[PreprocessConfig] = None, workers: Optional[int] = None):
+        self.config = config or PreprocessConfig.from_env()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or int(os.environ.get('OCR_PREPROCESS_WORKERS', 2)),
+            thread_name_prefix="ocr-preprocess",
+        )
+
+    async def run(self, image_base64: str) -> PreprocessedImage:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._executor, preprocess_image, image_base64, self.config)
+        logger.info(
+            f"OCR preprocess {result.bytes_in} -> {result.bytes_out} bytes "
+            f"({result.width}x{result.height}) stages_ms={result.stage_ms}"
+        )
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+image_preprocessor = ImagePreprocessor()
@@ -0,0 +1,280 @@
+"""
+MongoDB index management for MediMinder.
+
+Declares every index the API's hot queries depend on, creates them
+idempotently at startup, and can verify with explain() that each route's
+query shape is served by an index rather than a collection scan.
+
+Run standalone from the backend directory:
+    python indexes.py            # create indexes
+    python indexes.py --verify   # create indexes, then check query plans
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from ocr_cache import OCR_CACHE_TTL_SECONDS
+from ai_cache import AI_CACHE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# ============= Index Declarations =============
+
+# collection -> indexes required by the routes in server.py
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # verify_otp finds or creates the user by phone
+        IndexModel(
+            [("phone", ASCENDING)],
+            name="phone_unique",
+            unique=True,
+            partialFilterExpression={"phone": {"$type": "string"}},
+        ),
+    ],
+    "otp_challenges": [
+        # login upserts and verify_otp consumes the phone's pending challenge
+        IndexModel([("phone", ASCENDING)], name="phone_unique", unique=True),
+        # unverified challenges go away once they expire
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "patients": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "medications": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # add_prescription / explain_medicine resolve names by normalized key
+        IndexModel(
+            [("name_normalized", ASCENDING)],
+            name="name_normalized_unique",
+            unique=True,
+            partialFilterExpression={"name_normalized": {"$type": "string"}},
+        ),
+    ],
+    "prescriptions": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # get_patient_prescriptions: keyset pages over (created_at, id); the
+        # patient_id prefix also serves the unpaginated per-patient reads
+        IndexModel(
+            [("patient_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="patient_created_at_id",
+        ),
+    ],
+    "reminder_logs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # get_reminder_logs: patient + time window, keyset pages newest first
+        IndexModel(
+            [("patient_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="patient_created_at_id",
+        ),
+        # get_schedule: logs joined to dose occurrences by scheduled time
+        IndexModel(
+            [("patient_id", ASCENDING), ("scheduled_at", ASCENDING)],
+            name="patient_scheduled_at",
+        ),
+    ],
+    "adherence_daily": [
+        # one rollup per prescription-day; also the $merge key for rebuilds
+        IndexModel(
+            [("patient_id", ASCENDING), ("prescription_id", ASCENDING), ("day", ASCENDING)],
+            name="patient_prescription_day_unique",
+            unique=True,
+        ),
+        IndexModel([("patient_id", ASCENDING), ("day", ASCENDING)], name="patient_day"),
+    ],
+    "revoked_tokens": [
+        IndexModel([("jti", ASCENDING)], name="jti_unique", unique=True),
+        # a revocation is moot once the token has expired
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "ocr_cache": [
+        IndexModel([("hash", ASCENDING)], name="hash_unique", unique=True),
+        # multikey: near-duplicate lookup matches any shared hash band
+        IndexModel([("bands", ASCENDING)], name="bands"),
+        IndexModel(
+            [("created_at", ASCENDING)],
+            name="created_at_ttl",
+            expireAfterSeconds=OCR_CACHE_TTL_SECONDS,
+        ),
+    ],
+    "ai_explanations": [
+        IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+        IndexModel([("medication_key", ASCENDING)], name="medication_key"),
+        IndexModel(
+            [("created_at", ASCENDING)],
+            name="created_at_ttl",
+            expireAfterSeconds=AI_CACHE_TTL_SECONDS,
+        ),
+    ],
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Query shapes issued by the routes, checked by verify_query_plans().
+# Each entry: (route, collection, filter, sort)
+QUERY_SHAPES: List[tuple] = [
+    ("login", "otp_challenges", {"phone": "+10000000000"}, None),
+    (
+        "verify_otp",
+        "otp_challenges",
+        {"phone": "+10000000000", "expires_at": {"$gt": _EPOCH}, "attempts": {"$not": {"$gte": 5}}},
+        None,
+    ),
+    ("verify_otp", "users", {"phone": "+10000000000"}, None),
+    ("update_dark_mode", "users", {"id": "probe"}, None),
+    ("get_patient", "patients", {"id": "probe"}, None),
+    ("get_medication", "medications", {"id": "probe"}, None),
+    ("add_prescription", "medications", {"name_normalized": "probe"}, None),
+    ("explain_medicine", "medications", {"name_normalized": "probe"}, None),
+    ("explain_medicine", "ai_explanations", {"key": "probe"}, None),
+    ("recognize_medicine", "ocr_cache", {"bands": {"$in": ["0:00", "1:00"]}}, None),
+    ("get_prescription", "prescriptions", {"id": "probe"}, None),
+    (
+        "get_patient_prescriptions",
+        "prescriptions",
+        {"patient_id": "probe",
+         "$or": [{"created_at": {"$gt": _EPOCH}}, {"created_at": _EPOCH, "id": {"$gt": "probe"}}]},
+        [("created_at", ASCENDING), ("id", ASCENDING)],
+    ),
+    ("log_reminder_action", "prescriptions", {"id": "probe"}, None),
+    (
+        "get_reminder_logs",
+        "reminder_logs",
+        {"patient_id": "probe", "created_at": {"$gte": _EPOCH}},
+        [("created_at", DESCENDING), ("id", DESCENDING)],
+    ),
+    (
+        "get_reminder_logs",
+        "reminder_logs",
+        {"patient_id": "probe", "created_at": {"$gte": _EPOCH},
+         "$or": [{"created_at": {"$lt": _EPOCH}}, {"created_at": _EPOCH, "id": {"$lt": "probe"}}]},
+        [("created_at", DESCENDING), ("id", DESCENDING)],
+    ),
+    ("get_schedule", "prescriptions", {"patient_id": "probe"}, None),
+    (
+        "get_schedule",
+        "reminder_logs",
+        {"patient_id": "probe", "scheduled_at": {"$gte": _EPOCH, "$lt": _EPOCH}},
+        None,
+    ),
+    (
+        "missed_dose_sweeper",
+        "reminder_logs",
+        {"patient_id": {"$in": ["probe"]}, "prescription_id": {"$in": ["probe"]},
+         "scheduled_at": {"$gte": _EPOCH, "$lt": _EPOCH}},
+        None,
+    ),
+    ("token_service.refresh", "revoked_tokens", {"expires_at": {"$gt": _EPOCH}}, None),
+    ("get_adherence_stats", "adherence_daily", {"patient_id": "probe", "day": {"$gte": "1970-01-01"}}, None),
+    (
+        "log_reminder_action",
+        "adherence_daily",
+        {"patient_id": "probe", "prescription_id": "probe", "day": "1970-01-01"},
+        None,
+    ),
+]
+
+
+class QueryPlanError(RuntimeError):
+    """Raised when a declared query shape is planned as a collection scan"""
+
+
+class IndexBuildError(RuntimeError):
+    """Raised when existing duplicates keep a unique index from building"""
+
+
+# ============= Index Creation =============
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create all declared indexes; safe to call on every startup
+
+    Raises IndexBuildError when duplicate data blocks a unique index.
+    """
+    created: Dict[str, List[str]] = {}
+    for collection, models in INDEX_SPECS.items():
+        try:
+            created[collection] = await db[collection].create_indexes(models)
+        except OperationFailure as e:
+            if e.code == 11000:
+                # Duplicates blocking a unique index: serving on would let the
+                # upserts keyed on it create more. Migrations must clean them up.
+                raise IndexBuildError(f"Unique index on {collection} blocked by duplicates: {str(e)}") from e
+            # An existing index with the same name but different options. Keep
+            # the API serving and surface it loudly; verify_query_plans() will
+            # catch the fallout.
+            logger.error(f"Index creation failed on {collection}: {str(e)}")
+    logger.info(f"Ensured indexes on {len(created)} collections")
+    return created
+
+
+# ============= Query Plan Verification =============
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """Flatten the stage names of a (possibly nested) explain plan"""
+    stages = [plan.get("stage", "")]
+    if "inputStage" in plan:
+        stages.extend(_plan_stages(plan["inputStage"]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    if "queryPlan" in plan:
+        # slot-based execution engine nests the classic plan under queryPlan
+        stages.extend(_plan_stages(plan["queryPlan"]))
+    return stages
+
+
+async def explain_stages(db, collection: str, query: Dict, sort=None) -> List[str]:
+    """Return the winning plan's stage names for a find() query shape"""
+    cursor = db[collection].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    explanation = await cursor.explain()
+    winning = explanation.get("queryPlanner", {}).get("winningPlan", {})
+    return _plan_stages(winning)
+
+
+async def verify_query_plans(db) -> Dict[str, List[str]]:
+    """Explain every declared query shape; raise QueryPlanError on any COLLSCAN"""
+    plans: Dict[str, List[str]] = {}
+    offenders = []
+    for route, collection, query, sort in QUERY_SHAPES:
+        label = f"{route} ({collection})"
+        stages = await explain_stages(db, collection, query, sort)
+        plans[label] = stages
+        if "COLLSCAN" in stages:
+            offenders.append(label)
+
+    if offenders:
+        raise QueryPlanError(f"Collection scan planned for: {', '.join(offenders)}")
+    logger.info(f"Verified {len(plans)} query plans, no collection scans")
+    return plans
+
+
+async def _main(verify: bool):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'mediminder_db')]
+    try:
+        await ensure_indexes(db)
+        if verify:
+            plans = await verify_query_plans(db)
+            for route, stages in plans.items():
+                print(f"{route}: {' <- '.join(stages)}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(verify="--verify" in sys.argv))
@@ -0,0 +1,429 @@
+"""
+LLM access for MediMinder.
+
+Routes call the shared `LLMGateway`, which wraps a provider with a pooled
+HTTP client, per-model concurrency limits, per-call deadlines, jittered
+retries and a circuit breaker. The provider can be swapped for a local
+fake when testing or benchmarking.
+
+    LLM_PROVIDER=emergent   default; Emergent universal key via emergentintegrations.
+                            Its chat API returns whole completions, so streamed
+                            explanations arrive as a single chunk.
+    LLM_PROVIDER=litellm    OpenAI-compatible endpoint through litellm, streamed token
+                            by token:
+        LLM_API_KEY              key for the endpoint (required)
+        LLM_API_BASE             endpoint URL (default: OpenAI)
+    LLM_PROVIDER=fake       offline stub that emits tokens with configurable delays:
+        FAKE_LLM_FIRST_TOKEN_MS  delay before the first token (default 400)
+        FAKE_LLM_TOKEN_MS        delay between tokens (default 30)
+        FAKE_LLM_TOKENS          tokens per completion (default 60)
+        FAKE_LLM_FAILURE_RATE    fraction of calls that fail (default 0)
+
+Gateway settings:
+    LLM_MAX_IN_FLIGHT           concurrent upstream calls per model (default 8)
+    LLM_TIMEOUT_SECONDS         deadline per call, including queueing and retries (default 30)
+    LLM_MAX_RETRIES             retries after the first attempt (default 2)
+    LLM_BREAKER_THRESHOLD       consecutive failures that open the breaker (default 5)
+    LLM_BREAKER_COOLDOWN_SECONDS  how long an open breaker fails fast (default 30)
+    LLM_POOL_CONNECTIONS        pooled upstream HTTP connections (default 20)
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+T = TypeVar("T")
+
+
+class LLMConfigurationError(RuntimeError):
+    """Raised when the configured provider cannot be used"""
+
+
+class LLMUnavailableError(RuntimeError):
+    """Raised without calling upstream while a model's circuit breaker is open"""
+
+
+class LLMTimeoutError(RuntimeError):
+    """Raised when a call misses its deadline"""
+
+
+class LLMProvider:
+    """Interface every provider implements"""
+
+    name = "base"
+
+    async def complete(self, model: str, system_message: str, prompt: str,
+                       image_base64: Optional[str] = None) -> str:
+        raise NotImplementedError
+
+    async def stream(self, model: str, system_message: str, prompt: str) -> AsyncIterator[str]:
+        """Yield the completion in chunks; providers without streaming yield it whole"""
+        yield await self.complete(model, system_message, prompt)
+
+
+class EmergentLLMProvider(LLMProvider):
+    """OpenAI models through the Emergent universal key"""
+
+    name = "emergent"
+
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key or os.environ.get('EMERGENT_LLM_KEY')
+
+    def _chat(self, model: str, system_message: str):
+        from emergentintegrations.llm.chat import LlmChat
+
+        if not self.api_key:
+            raise LLMConfigurationError("LLM key not configured")
+        return LlmChat(
+            api_key=self.api_key,
+            session_id=f"{self.name}_{uuid.uuid4()}",
+            system_message=system_message
+        ).with_model("openai", model)
+
+    async def complete(self, model: str, system_message: str, prompt: str,
+                       image_base64: Optional[str] = None) -> str:
+        from emergentintegrations.llm.chat import UserMessage, ImageContent
+
+        chat = self._chat(model, system_message)
+        file_contents = [ImageContent(image_base64=image_base64)] if image_base64 else None
+        message = UserMessage(text=prompt, file_contents=file_contents) if file_contents \
+            else UserMessage(text=prompt)
+        return await chat.send_message(message)
+
+
+class LiteLLMProvider(LLMProvider):
+    """OpenAI models called through litellm directly, which can stream"""
+
+    name = "litellm"
+
+    def __init__(self, api_key: Optional[str] = None, api_base: Optional[str] = None):
+        self.api_key = api_key or os.environ.get('LLM_API_KEY')
+        self.api_base = api_base or os.environ.get('LLM_API_BASE')
+
+    async def _completion(self, model: str, system_message: str, content: Any, **kwargs):
+        import litellm
+
+        if not self.api_key:
+            raise LLMConfigurationError("LLM_API_KEY not configured")
+        return await litellm.acompletion(
+            model=f"openai/{model}",
+            messages=[{"role": "system", "content": system_message}, {"role": "user", "content": content}],
+            api_key=self.api_key,
+            base_url=self.api_base,
+            **kwargs
+        )
+
+    async def complete(self, model: str, system_message: str, prompt: str,
+                       image_base64: Optional[str] = None) -> str:
+        content: Any = prompt
+        if image_base64:
+            content = [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}},
+            ]
+        response = await self._completion(model, system_message, content)
+        return response.choices[0].message.content or ""
+
+    async def stream(self, model: str, system_message: str, prompt: str) -> AsyncIterator[str]:
+        response = await self._completion(model, system_message, prompt, stream=True)
+        async for chunk in response:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                yield text
+
+
+class FakeLLMProvider(LLMProvider):
+    """Deterministic offline provider for tests and latency benchmarks"""
+
+    name = "fake"
+
+    def __init__(self, first_token_ms: Optional[float] = None, token_ms: Optional[float] = None,
+                 tokens: Optional[int] = None, failure_rate: Optional[float] = None):
+        self.first_token_ms = first_token_ms if first_token_ms is not None \
+            else float(os.environ.get('FAKE_LLM_FIRST_TOKEN_MS', 400))
+        self.token_ms = token_ms if token_ms is not None else float(os.environ.get('FAKE_LLM_TOKEN_MS', 30))
+        self.tokens = tokens or int(os.environ.get('FAKE_LLM_TOKENS', 60))
+        self.failure_rate = failure_rate if failure_rate is not None \
+            else float(os.environ.get('FAKE_LLM_FAILURE_RATE', 0))
+        self.calls = 0
+
+    def _tokens(self, prompt: str):
+        words = (prompt.split() or ["ok"])
+        return [f"{words[i % len(words)]} " for i in range(self.tokens)]
+
+    async def complete(self, model: str, system_message: str, prompt: str,
+                       image_base64: Optional[str] = None) -> str:
+        chunks = [chunk async for chunk in self.stream(model, system_message, prompt)]
+        if image_base64:
+            return '{"medicine_name": "Paracetamol 500mg", "strength": "500mg", "form": "tablet", "confidence": 0.9}'
+        return "".join(chunks)
+
+    async def stream(self, model: str, system_message: str, prompt: str) -> AsyncIterator[str]:
+        self.calls += 1
+        await asyncio.sleep(self.first_token_ms / 1000)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ConnectionError("fake upstream failure")
+        for i, token in enumerate(self._tokens(prompt)):
+            if i:
+                await asyncio.sleep(self.token_ms / 1000)
+            yield token
+
+
+def get_llm_provider() -> LLMProvider:
+    """Provider selected by LLM_PROVIDER"""
+    name = os.environ.get('LLM_PROVIDER', 'emergent').lower()
+    if name == "fake":
+        logger.warning("Using fake LLM provider")
+        return FakeLLMProvider()
+    if name == "emergent":
+        return EmergentLLMProvider()
+    if name == "litellm":
+        return LiteLLMProvider()
+    raise LLMConfigurationError(f"Unknown LLM_PROVIDER '{name}'")
+
+
+# ============= Gateway =============
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one trial call)"""
+
+    def __init__(self, threshold: int, cooldown_s: float):
+        self.threshold = threshold
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown_s:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def release_trial(self):
+        """Give back a half-open trial that never reached upstream"""
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.threshold:
+            if self.opened_at is None or self.trial_in_flight:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+
+class ModelLane:
+    """Concurrency bound, breaker and counters for one model"""
+
+    def __init__(self, max_in_flight: int, breaker: CircuitBreaker):
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.max_in_flight = max_in_flight
+        self.breaker = breaker
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_in_flight": self.max_in_flight,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+        }
+
+
+class LLMGateway:
+    """Shared, bounded access to the upstream LLM provider"""
+
+    def __init__(self, provider: LLMProvider, max_in_flight: Optional[int] = None,
+                 timeout_s: Optional[float] = None, max_retries: Optional[int] = None,
+                 breaker_threshold: Optional[int] = None, breaker_cooldown_s: Optional[float] = None,
+                 backoff_base_s: float = 0.25, backoff_cap_s: float = 4.0):
+        self.provider = provider
+        self.max_in_flight = max_in_flight or int(os.environ.get('LLM_MAX_IN_FLIGHT', 8))
+        self.timeout_s = timeout_s or float(os.environ.get('LLM_TIMEOUT_SECONDS', 30))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get('LLM_MAX_RETRIES', 2))
+        self.breaker_threshold = breaker_threshold or int(os.environ.get('LLM_BREAKER_THRESHOLD', 5))
+        self.breaker_cooldown_s = breaker_cooldown_s if breaker_cooldown_s is not None \
+            else float(os.environ.get('LLM_BREAKER_COOLDOWN_SECONDS', 30))
+        self.backoff_base_s = backoff_base_s
+        self.backoff_cap_s = backoff_cap_s
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self._lanes: Dict[str, ModelLane] = {}
+
+    # ============= Lifecycle =============
+
+    async def start(self):
+        """Open the pooled upstream HTTP client and hand it to litellm, if present"""
+        connections = int(os.environ.get('LLM_POOL_CONNECTIONS', 20))
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+            timeout=httpx.Timeout(self.timeout_s, connect=5.0),
+        )
+        try:
+            # emergentintegrations drives OpenAI through litellm, which reuses this session
+            import litellm
+            litellm.aclient_session = self.http_client
+        except ImportError:
+            pass
+        logger.info(f"LLM gateway started ({self.provider.name}, {self.max_in_flight} in flight per model)")
+
+    async def close(self):
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    # ============= Calls =============
+
+    def _lane(self, model: str) -> ModelLane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            lane = ModelLane(self.max_in_flight, CircuitBreaker(self.breaker_threshold, self.breaker_cooldown_s))
+            self._lanes[model] = lane
+        return lane
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_cap_s, self.backoff_base_s * (2 ** attempt)))
+
+    async def _acquire(self, model: str, lane: ModelLane, timeout: float):
+        """Wait for a slot; running out of time in our own queue says nothing about upstream"""
+        lane.waiting += 1
+        try:
+            await asyncio.wait_for(lane.semaphore.acquire(), timeout=max(timeout, 0))
+        except asyncio.TimeoutError:
+            lane.timeouts += 1
+            lane.breaker.release_trial()
+            raise LLMTimeoutError(f"{model} call exceeded its deadline waiting for a slot")
+        finally:
+            lane.waiting -= 1
+
+    async def _call(self, model: str, fn: Callable[[], Awaitable[T]], timeout_s: Optional[float]) -> T:
+        lane = self._lane(model)
+        deadline = time.monotonic() + (timeout_s or self.timeout_s)
+        attempt = 0
+        while True:
+            if not lane.breaker.allow():
+                lane.rejected += 1
+                raise LLMUnavailableError(f"{model} is temporarily unavailable")
+            lane.calls += 1
+            await self._acquire(model, lane, deadline - time.monotonic())
+            try:
+                lane.in_flight += 1
+                try:
+                    result = await asyncio.wait_for(fn(), timeout=max(deadline - time.monotonic(), 0))
+                finally:
+                    lane.in_flight -= 1
+                    lane.semaphore.release()
+                lane.breaker.record_success()
+                return result
+            except asyncio.TimeoutError:
+                lane.timeouts += 1
+                lane.failures += 1
+                lane.breaker.record_failure()
+                raise LLMTimeoutError(f"{model} call exceeded its deadline")
+            except (LLMConfigurationError, asyncio.CancelledError):
+                lane.breaker.release_trial()
+                raise
+            except Exception as e:
+                lane.failures += 1
+                lane.breaker.record_failure()
+                delay = self._backoff(attempt)
+                if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                attempt += 1
+                lane.retries += 1
+                logger.warning(f"{model} call failed ({str(e)}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def complete(self, model: str, system_message: str, prompt: str,
+                       image_base64: Optional[str] = None, timeout_s: Optional[float] = None) -> str:
+        return await self._call(
+            model,
+            lambda: self.provider.complete(model, system_message, prompt, image_base64=image_base64),
+            timeout_s
+        )
+
+    async def stream(self, model: str, system_message: str, prompt: str,
+                     timeout_s: Optional[float] = None) -> AsyncIterator[str]:
+        """Stream a completion under the model's concurrency bound and breaker
+
+        The deadline applies to each wait for the next chunk. There are no
+        retries once a chunk has been delivered.
+        """
+        lane = self._lane(model)
+        if not lane.breaker.allow():
+            lane.rejected += 1
+            raise LLMUnavailableError(f"{model} is temporarily unavailable")
+        timeout = timeout_s or self.timeout_s
+        lane.calls += 1
+        await self._acquire(model, lane, timeout)
+        lane.in_flight += 1
+        chunks = self.provider.stream(model, system_message, prompt).__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                except StopAsyncIteration:
+                    break
+                yield chunk
+            lane.breaker.record_success()
+        except asyncio.TimeoutError:
+            lane.timeouts += 1
+            lane.failures += 1
+            lane.breaker.record_failure()
+            raise LLMTimeoutError(f"{model} stream stalled past its deadline")
+        except (GeneratorExit, asyncio.CancelledError):
+            # Client went away; not the upstream's fault
+            lane.breaker.release_trial()
+            raise
+        except Exception:
+            lane.failures += 1
+            lane.breaker.record_failure()
+            raise
+        finally:
+            lane.in_flight -= 1
+            lane.semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider.name,
+            "models": {model: lane.stats() for model, lane in self._lanes.items()},
+        }
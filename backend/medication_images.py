@@ -0,0 +1,219 @@
+"""
+Medication photos stored outside the medication documents.
+
+An uploaded photo is decoded once, oriented from EXIF and re-encoded as a
+fixed set of JPEG variants (see IMAGE_SIZES). Variants are addressed by
+the SHA-256 of the normalized full-size image, so a stored blob never
+changes: its name doubles as a strong ETag, and a URL that pins the hash
+(`?v=<hash>`) can be cached forever. The medication document only keeps a
+small `image` summary ({hash, sizes: {name: {width, height, bytes}}}).
+
+Blobs live in GridFS by default, or on local disk:
+    MEDICATION_IMAGE_STORE     "gridfs" (default) or "local"
+    MEDICATION_IMAGE_DIR       root directory for the local store
+    MEDICATION_IMAGE_BUCKET    GridFS bucket name (default medication_images)
+    MEDICATION_IMAGE_WORKERS   thread pool size for resizing (default 2)
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+import math
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from PIL import Image, ImageOps
+
+from image_pipeline import DECODE_ERRORS, InvalidImageError, strip_data_url
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> longest edge in pixels
+IMAGE_SIZES: Dict[str, int] = {"thumb": 128, "medium": 512, "full": 2048}
+IMAGE_JPEG_QUALITY = 85
+IMAGE_CONTENT_TYPE = "image/jpeg"
+
+
+class ImageNotFoundError(LookupError):
+    """No stored variant under that name"""
+
+
+class InvalidRangeError(ValueError):
+    """Range header that can't be satisfied for the blob's length"""
+
+
+def blob_name(digest: str, size: str) -> str:
+    return f"{digest}/{size}.jpg"
+
+
+def render_variants(image_base64: str) -> Tuple[str, Dict[str, bytes], Dict[str, Dict[str, int]]]:
+    """Decode an upload into (hash, {size: jpeg bytes}, {size: metadata}) (blocking)"""
+    try:
+        raw = base64.b64decode(strip_data_url(image_base64), validate=False)
+        img = Image.open(io.BytesIO(raw))
+        # Let the JPEG decoder skip detail the largest variant would throw away
+        scale = IMAGE_SIZES["full"] / max(img.size)
+        if scale < 1:
+            img.draft("RGB", (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+        img.load()
+    except DECODE_ERRORS as e:
+        raise InvalidImageError(f"Could not decode image: {str(e)}")
+    img = ImageOps.exif_transpose(img).convert("RGB")
+
+    blobs: Dict[str, bytes] = {}
+    sizes: Dict[str, Dict[str, int]] = {}
+    # Largest first, each variant downscaled from the previous one
+    for size, edge in sorted(IMAGE_SIZES.items(), key=lambda item: -item[1]):
+        if max(img.size) > edge:
+            img = img.copy()
+            img.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True, progressive=True)
+        blobs[size] = out.getvalue()
+        sizes[size] = {"width": img.width, "height": img.height, "bytes": len(blobs[size])}
+    digest = hashlib.sha256(blobs["full"]).hexdigest()
+    return digest, blobs, sizes
+
+
+def parse_range(header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) for a single `bytes=` range; None to send everything
+
+    Multi-range and non-byte requests fall back to the full body, which
+    RFC 9110 allows.
+    """
+    if not header:
+        return None
+    match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", header)
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    first, last = match.groups()
+    if not first:
+        # suffix range: the last N bytes
+        suffix = int(last)
+        if suffix == 0:
+            raise InvalidRangeError(header)
+        return max(length - suffix, 0), length - 1
+    start = int(first)
+    end = min(int(last), length - 1) if last else length - 1
+    if start >= length or end < start:
+        raise InvalidRangeError(header)
+    return start, end
+
+
+# ============= Blob Stores =============
+
+class GridFSImageStore:
+    """Variants as GridFS files named `<hash>/<size>.jpg`"""
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+
+    def _bucket(self, db):
+        return AsyncIOMotorGridFSBucket(db, bucket_name=self.bucket)
+
+    async def exists(self, db, name: str) -> bool:
+        return await db[f"{self.bucket}.files"].find_one({"filename": name}, {"_id": 1}) is not None
+
+    async def put(self, db, name: str, data: bytes) -> None:
+        if await self.exists(db, name):
+            return  # content-addressed: same name, same bytes
+        await self._bucket(db).upload_from_stream(name, data, metadata={"contentType": IMAGE_CONTENT_TYPE})
+
+    async def get(self, db, name: str) -> bytes:
+        try:
+            stream = await self._bucket(db).open_download_stream_by_name(name)
+        except NoFile:
+            raise ImageNotFoundError(name)
+        return await stream.read()
+
+
+class LocalImageStore:
+    """Variants as files under a root directory"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, name: str) -> Path:
+        return self.root / name[:2] / name
+
+    def _put(self, name: str, data: bytes) -> None:
+        path = self._path(name)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so a reader never sees half a file
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _get(self, name: str) -> bytes:
+        try:
+            return self._path(name).read_bytes()
+        except FileNotFoundError:
+            raise ImageNotFoundError(name)
+
+    async def exists(self, db, name: str) -> bool:
+        return self._path(name).exists()
+
+    async def put(self, db, name: str, data: bytes) -> None:
+        await asyncio.to_thread(self._put, name, data)
+
+    async def get(self, db, name: str) -> bytes:
+        return await asyncio.to_thread(self._get, name)
+
+
+def get_image_store():
+    kind = os.environ.get('MEDICATION_IMAGE_STORE', 'gridfs').lower()
+    if kind == "local":
+        root = os.environ.get('MEDICATION_IMAGE_DIR', str(Path(__file__).parent / "media" / "medications"))
+        return LocalImageStore(root)
+    if kind != "gridfs":
+        raise ValueError(f"Unknown MEDICATION_IMAGE_STORE: {kind}")
+    return GridFSImageStore(os.environ.get('MEDICATION_IMAGE_BUCKET', 'medication_images'))
+
+
+# ============= Service =============
+
+class MedicationImages:
+    """Renders uploads into variants and reads them back from the blob store"""
+
+    def __init__(self, store=None, workers: Optional[int] = None):
+        self.store = store or get_image_store()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or int(os.environ.get('MEDICATION_IMAGE_WORKERS', 2)),
+            thread_name_prefix="medication-images",
+        )
+        self.stored = 0
+        self.served = 0
+
+    async def save(self, db, image_base64: str) -> Dict[str, Any]:
+        """Store every variant of an upload; returns the document's `image` summary"""
+        loop = asyncio.get_running_loop()
+        digest, blobs, sizes = await loop.run_in_executor(self._executor, render_variants, image_base64)
+        await asyncio.gather(*(self.store.put(db, blob_name(digest, size), data) for size, data in blobs.items()))
+        self.stored += 1
+        logger.info(f"Stored medication image {digest[:12]} ({sizes['full']['bytes']} bytes full size)")
+        return {"hash": digest, "sizes": sizes}
+
+    async def load(self, db, digest: str, size: str) -> bytes:
+        data = await self.store.get(db, blob_name(digest, size))
+        self.served += 1
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        return {"store": type(self.store).__name__, "stored": self.stored, "served": self.served}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+medication_images = MedicationImages()
@@ -0,0 +1,249 @@
+"""
+Data migrations for MediMinder.
+
+Each migration is idempotent and safe to run on every startup; they only
+touch documents that still need migrating.
+
+Run standalone from the backend directory:
+    python migrations.py
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+
+from pymongo.errors import DuplicateKeyError
+
+from adherence import ROLLUP_COLLECTION, rebuild_adherence_rollups
+from ai_cache import explanation_cache
+from conditional import REVISION_BUMP
+from image_pipeline import InvalidImageError
+from medication_images import medication_images
+from search_index import normalize
+
+logger = logging.getLogger(__name__)
+
+# ============= Medications =============
+
+async def backfill_name_normalized(db) -> int:
+    """Populate `name_normalized` on medications created before the field existed.
+
+    Oldest documents claim a normalized name first. Later duplicates (left by
+    the old find-then-insert race) are skipped and keep resolving by `id`.
+    """
+    migrated = 0
+    cursor = db.medications.find(
+        {"name_normalized": {"$exists": False}}, {"_id": 0, "id": 1, "name": 1}
+    ).sort("created_at", 1)
+    async for med in cursor:
+        key = normalize(med.get("name"))
+        if not key:
+            continue
+        try:
+            await db.medications.update_one(
+                {"id": med["id"]}, {"$set": {"name_normalized": key}, "$inc": REVISION_BUMP}
+            )
+            migrated += 1
+        except DuplicateKeyError:
+            logger.warning(f"Medication {med['id']} duplicates normalized name '{key}', skipping")
+    if migrated:
+        logger.info(f"Backfilled name_normalized on {migrated} medications")
+    return migrated
+
+
+async def renormalize_names(db) -> int:
+    """Re-key medications whose `name_normalized` predates Unicode-aware normalize().
+
+    The old ASCII-only key was "" for every non-Latin name, so all of them
+    resolved to one shared record with one set of cached explanations. That
+    record takes the key of its own name and loses its explanations; names
+    that still key to "" lose the field, so nothing matches them.
+    """
+    rekeyed = 0
+    cursor = db.medications.find(
+        {"name_normalized": {"$type": "string"}}, {"_id": 0, "id": 1, "name": 1, "name_normalized": 1}
+    ).sort("created_at", 1)
+    async for med in cursor:
+        key = normalize(med.get("name"))
+        if key == med["name_normalized"]:
+            continue
+        if not med["name_normalized"]:
+            await explanation_cache.invalidate_medication(db, med["id"])
+        update = {"$set": {"name_normalized": key}} if key else {"$unset": {"name_normalized": ""}}
+        try:
+            await db.medications.update_one({"id": med["id"]}, {**update, "$inc": REVISION_BUMP})
+            rekeyed += 1
+        except DuplicateKeyError:
+            logger.warning(f"Medication {med['id']} duplicates normalized name '{key}', keeping its old key")
+    # Explanations cached under the empty name key (a no-op once cleared)
+    await explanation_cache.invalidate_medication(db, "name:")
+    if rekeyed:
+        logger.info(f"Re-keyed name_normalized on {rekeyed} medications")
+    return rekeyed
+
+
+async def drain_inline_images(db) -> int:
+    """Move inline `image_base64` photos on medications into the image store.
+
+    Each photo becomes a stored variant set plus an `image` summary. The
+    inline field is only removed if it still holds the bytes that were
+    stored. Photos that don't decode are left in place and logged.
+    """
+    drained = 0
+    cursor = db.medications.find(
+        {"image_base64": {"$type": "string"}}, {"_id": 0, "id": 1, "image_base64": 1}
+    ).batch_size(20)
+    async for med in cursor:
+        try:
+            image = await medication_images.save(db, med["image_base64"])
+        except InvalidImageError as e:
+            logger.warning(f"Medication {med['id']} has an undecodable inline image, leaving it: {str(e)}")
+            continue
+        result = await db.medications.update_one(
+            {"id": med["id"], "image_base64": med["image_base64"]},
+            {"$set": {"image": image}, "$unset": {"image_base64": ""}, "$inc": REVISION_BUMP}
+        )
+        drained += result.modified_count
+    # Older documents also carry an explicit null
+    await db.medications.update_many(
+        {"image_base64": {"$type": "null"}}, {"$unset": {"image_base64": ""}, "$inc": REVISION_BUMP}
+    )
+    if drained:
+        logger.info(f"Moved {drained} inline medication images to {medication_images.stats()['store']}")
+    return drained
+
+# ============= Users =============
+
+async def strip_user_otps(db) -> int:
+    """Remove OTP fields left on users from before `otp_challenges`.
+
+    Codes still pending there are dropped, so those users have to request
+    a new one.
+    """
+    result = await db.users.update_many(
+        {"$or": [{"otp": {"$exists": True}}, {"otp_expires_at": {"$exists": True}}]},
+        {"$unset": {"otp": "", "otp_expires_at": ""}}
+    )
+    if result.modified_count:
+        logger.info(f"Removed OTP fields from {result.modified_count} users")
+    return result.modified_count
+
+
+async def merge_duplicate_phone_users(db) -> int:
+    """Merge users sharing a phone number, so the unique phone index can build.
+
+    The old find-then-insert login could create a second user for a phone.
+    The oldest user is kept (it is the one login resolved to); patients of
+    the others move to it before they are deleted. Runs before
+    ensure_indexes(), which would otherwise fail on the duplicates.
+    """
+    groups = await db.users.aggregate([
+        {"$match": {"phone": {"$type": "string"}}},
+        {"$sort": {"created_at": 1}},
+        {"$group": {"_id": "$phone", "ids": {"$push": "$id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]).to_list(None)
+    merged = 0
+    for group in groups:
+        keeper, duplicates = group["ids"][0], group["ids"][1:]
+        await db.patients.update_many({"user_id": {"$in": duplicates}}, {"$set": {"user_id": keeper}})
+        result = await db.users.delete_many({"id": {"$in": duplicates}})
+        merged += result.deleted_count
+        logger.warning(f"Merged {len(duplicates)} duplicate users for one phone into {keeper}")
+    return merged
+
+# ============= Patients =============
+
+async def unset_default_utc_offsets(db) -> int:
+    """Forget the `utc_offset_minutes: 0` every patient used to be created with.
+
+    No client ever sent an offset, so a stored 0 means "unknown", not UTC;
+    the missed-dose sweeper skips patients without one until the app reports
+    it. Runs once (recorded in `applied_migrations`), since after that a 0
+    is a real offset.
+    """
+    try:
+        await db.applied_migrations.insert_one({"_id": "unset_default_utc_offsets", "applied_at": datetime.utcnow()})
+    except DuplicateKeyError:
+        return 0
+    result = await db.patients.update_many(
+        {"utc_offset_minutes": 0}, {"$unset": {"utc_offset_minutes": ""}, "$inc": REVISION_BUMP}
+    )
+    if result.modified_count:
+        logger.info(f"Cleared the default UTC offset on {result.modified_count} patients")
+    return result.modified_count
+
+# ============= Adherence =============
+
+async def backfill_adherence_rollups(db) -> int:
+    """Build the daily rollups from raw logs when none exist yet.
+
+    Deployments that predate `adherence_daily` would otherwise report zero
+    adherence until someone ran `adherence.py --rebuild`.
+    """
+    if await db[ROLLUP_COLLECTION].find_one({}, {"_id": 1}):
+        return 0
+    if not await db.reminder_logs.find_one({}, {"_id": 1}):
+        return 0
+    return await rebuild_adherence_rollups(db)
+
+# ============= Superseded Indexes =============
+
+# (collection, index name) pairs replaced by a wider index in indexes.py whose
+# prefix serves the same queries; keeping them only slows down writes
+SUPERSEDED_INDEXES = [
+    ("prescriptions", "patient_id"),
+    ("reminder_logs", "patient_created_at"),
+]
+
+
+async def drop_superseded_indexes(db) -> int:
+    """Drop indexes that a keyset-pagination index now covers"""
+    dropped = 0
+    for collection, name in SUPERSEDED_INDEXES:
+        existing = await db[collection].index_information()
+        if name in existing:
+            await db[collection].drop_index(name)
+            logger.info(f"Dropped superseded index {collection}.{name}")
+            dropped += 1
+    return dropped
+
+
+async def run_pre_index_migrations(db) -> None:
+    """Fix data that would stop ensure_indexes() from building a unique index"""
+    await merge_duplicate_phone_users(db)
+
+
+async def run_migrations(db) -> None:
+    """Apply all pending data migrations"""
+    await renormalize_names(db)
+    await backfill_name_normalized(db)
+    await drop_superseded_indexes(db)
+    await drain_inline_images(db)
+    await strip_user_otps(db)
+    await unset_default_utc_offsets(db)
+    await backfill_adherence_rollups(db)
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from indexes import ensure_indexes
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'mediminder_db')]
+    try:
+        await run_pre_index_migrations(db)
+        await ensure_indexes(db)
+        await run_migrations(db)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,362 @@
+"""
+Background sweeper that records doses nobody answered as missed.
+
+Without it a dose only counts as missed when the phone posts `missed`, so
+ignoring reminders inflates adherence. The sweeper keeps a min-heap of dose
+deadlines (occurrence time + grace period) for every active prescription,
+covering a rolling horizon. When deadlines pass it checks the due doses
+against `reminder_logs` in one query and writes a synthetic `missed` log
+for each unanswered one, in one unordered bulk write.
+
+Doses are placed with the patient's `utc_offset_minutes`, which the app
+reports; patients that never reported one are skipped rather than swept
+as if they lived in UTC (and planned once the offset arrives).
+
+Only one worker sweeps at a time: each cycle a worker takes or renews a
+lease document in `sweeper_state` (expiring after LEASE_SECONDS), and the
+others just retry the lease. The leader re-reads the active prescriptions
+and patient offsets every cycle and rebuilds the heap from the checkpoint,
+so inserts, deletes and time-zone changes made through any worker are
+picked up; API handlers only call `changed()` to wake the local loop early.
+Progress is checkpointed in `sweeper_state` as the instant up to which every
+deadline was handled, so a new leader or a restart resumes from there.
+Synthetic logs get deterministic ids, so re-sweeping after a crash or a
+lease handover is harmless: the unique `id` index drops repeats.
+
+Configured through environment variables:
+    MISSED_DOSE_SWEEPER          "true" to enable (default disabled)
+    MISSED_DOSE_HORIZON_HOURS    how far ahead each reload plans (default 1)
+    MISSED_DOSE_MAX_CATCHUP_DAYS furthest back a resume looks (default 7)
+    MISSED_DOSE_BATCH            most logs written per bulk write (default 1000)
+Grace period and log matching come from schedule.py.
+
+A synthetic miss is written at the end of the grace period, but a real log
+may still answer the dose up to the match window later (or much later, when
+the app syncs a batch). `retract_superseded_misses` deletes the synthetic
+log such a late answer replaces and takes it back out of the rollups.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from pymongo import InsertOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from adherence import record_reminder_actions
+from schedule import (
+    ACTION_RANK, GRACE_MINUTES, MATCH_WINDOW_MINUTES, MISSED, DoseOccurrences, expand_schedules, match_logs
+)
+
+logger = logging.getLogger(__name__)
+
+STATE_ID = "missed_dose_sweeper"
+LEASE_ID = "missed_dose_sweeper_lease"
+_EPOCH = datetime(1970, 1, 1)
+MAX_SLEEP_SECONDS = 60
+LEASE_SECONDS = 3 * MAX_SLEEP_SECONDS  # outlives a couple of missed renewals
+
+
+def sweeper_enabled() -> bool:
+    return os.environ.get('MISSED_DOSE_SWEEPER', '').lower() in ('1', 'true', 'yes')
+
+
+async def retract_superseded_misses(db, logs: List[Dict[str, Any]]) -> int:
+    """Delete the sweeper's missed logs that newly written took/missed logs answer
+
+    Each answering log claims the nearest synthetic miss of its prescription
+    within the match window. Returns the number of misses retracted.
+    """
+    answers = [log for log in logs if log.get("source") != "sweeper" and ACTION_RANK.get(log["action"], 0) >= MISSED]
+    if not answers:
+        return 0
+    window = timedelta(minutes=MATCH_WINDOW_MINUTES)
+    candidates = await db.reminder_logs.find(
+        {
+            "patient_id": {"$in": list({log["patient_id"] for log in answers})},
+            "prescription_id": {"$in": list({log["prescription_id"] for log in answers})},
+            "scheduled_at": {"$gte": min(log["scheduled_at"] for log in answers) - window,
+                             "$lte": max(log["scheduled_at"] for log in answers) + window},
+            "source": "sweeper",
+        },
+        {"_id": 0, "id": 1, "patient_id": 1, "prescription_id": 1, "scheduled_at": 1, "action": 1, "created_at": 1}
+    ).to_list(None)
+
+    retracted = []
+    for log in answers:
+        nearby = [
+            miss for miss in candidates
+            if (miss["patient_id"], miss["prescription_id"]) == (log["patient_id"], log["prescription_id"])
+            and abs(miss["scheduled_at"] - log["scheduled_at"]) <= window
+        ]
+        if not nearby:
+            continue
+        miss = min(nearby, key=lambda miss: abs(miss["scheduled_at"] - log["scheduled_at"]))
+        candidates.remove(miss)
+        # Only whoever actually deletes it takes it out of the rollups
+        result = await db.reminder_logs.delete_one({"id": miss["id"], "source": "sweeper"})
+        if result.deleted_count:
+            retracted.append(miss)
+    await record_reminder_actions(db, retracted, delta=-1)
+    if retracted:
+        logger.info(f"Retracted {len(retracted)} missed doses answered late")
+    return len(retracted)
+
+
+def to_minute(moment: datetime) -> int:
+    return (moment - _EPOCH) // timedelta(minutes=1)
+
+
+def from_minute(minute: int) -> datetime:
+    return _EPOCH + timedelta(minutes=minute)
+
+
+class MissedDoseSweeper:
+    """Min-heap of dose deadlines, drained into synthetic missed logs"""
+
+    def __init__(self, db, make_log: Callable[..., Dict[str, Any]], grace_minutes: int = GRACE_MINUTES,
+                 horizon_hours: Optional[float] = None, max_catchup_days: Optional[float] = None,
+                 batch_size: Optional[int] = None, worker_id: Optional[str] = None):
+        self.db = db
+        self.make_log = make_log
+        self.grace = grace_minutes
+        self.horizon = int((horizon_hours or float(os.environ.get('MISSED_DOSE_HORIZON_HOURS', 1))) * 60)
+        self.max_catchup = int((max_catchup_days or float(os.environ.get('MISSED_DOSE_MAX_CATCHUP_DAYS', 7))) * 1440)
+        self.batch_size = batch_size or int(os.environ.get('MISSED_DOSE_BATCH', 1000))
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # (deadline, scheduled, prescription_id), all times in epoch minutes
+        self._heap: List[Tuple[int, int, str]] = []
+        self._prescriptions: Dict[str, Dict[str, Any]] = {}
+        self._offsets: Dict[str, Optional[int]] = {}  # patient -> offset, None while unknown
+        self._swept_until = 0
+        self._leader = False
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.sweeps = 0
+        self.missed_written = 0
+        self.last_sweep_ms = 0.0
+
+    # ============= Lifecycle =============
+
+    async def start(self):
+        """Run in the background; each cycle only sweeps if this worker holds the lease"""
+        self._task = asyncio.create_task(self._run(), name="missed-dose-sweeper")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._leader:
+            # Hand over now instead of making the next sweeper wait out the lease
+            await self.db.sweeper_state.delete_one({"_id": LEASE_ID, "holder": self.worker_id})
+            self._leader = False
+
+    def changed(self):
+        """Prescriptions or a patient's time zone changed: reload on the next cycle, now"""
+        self._wake.set()
+
+    # ============= Leadership =============
+
+    async def acquire_lease(self, now: Optional[datetime] = None) -> bool:
+        """Take or renew the sweeper lease; False while another live worker holds it"""
+        now = now or datetime.utcnow()
+        try:
+            lease = await self.db.sweeper_state.find_one_and_update(
+                {"_id": LEASE_ID, "$or": [{"holder": self.worker_id}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"holder": self.worker_id, "expires_at": now + timedelta(seconds=LEASE_SECONDS)}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            lease = None  # the lease exists and is someone else's: the upsert collided on _id
+        leader = lease is not None
+        if leader != self._leader:
+            logger.info(f"Missed-dose sweeper {self.worker_id} {'acquired' if leader else 'lost'} the lease")
+        self._leader = leader
+        return leader
+
+    # ============= Planning =============
+
+    async def load(self, now: int):
+        """Re-read the checkpoint, active prescriptions and offsets, and rebuild the heap
+
+        Doses are planned from `swept_until - grace`, so ones still inside their
+        grace period at the checkpoint are kept whatever changed since.
+        """
+        state = await self.db.sweeper_state.find_one({"_id": STATE_ID})
+        if state is None:
+            # First run: start from now, and persist it so the next reload doesn't move it
+            await self.db.sweeper_state.update_one(
+                {"_id": STATE_ID}, {"$setOnInsert": {"swept_until": from_minute(now)}}, upsert=True
+            )
+        swept_until = to_minute(state["swept_until"]) if state else now
+        self._swept_until = max(swept_until, now - self.max_catchup)
+
+        today = from_minute(now).strftime("%Y-%m-%d")
+        prescriptions = await self.db.prescriptions.find(
+            {"$or": [{"end_date": None}, {"end_date": {"$gte": today}}]},
+            {"_id": 0, "id": 1, "patient_id": 1, "schedule": 1, "start_date": 1, "end_date": 1}
+        ).to_list(None)
+        patient_ids = list({p["patient_id"] for p in prescriptions})
+        patients = await self.db.patients.find(
+            {"id": {"$in": patient_ids}}, {"_id": 0, "id": 1, "utc_offset_minutes": 1}
+        ).to_list(None)
+        self._offsets = {p["id"]: p.get("utc_offset_minutes") for p in patients}
+        self._prescriptions = {p["id"]: p for p in prescriptions}
+
+        self._heap = []
+        self._expand(prescriptions, self._swept_until - self.grace, now + self.horizon,
+                     not_before_deadline=self._swept_until)
+
+    def _expand(self, prescriptions: List[Dict[str, Any]], start: int, end: int, not_before_deadline: int):
+        """Push the deadlines of doses scheduled in [start, end)"""
+        if end <= start or not prescriptions:
+            return
+        by_offset: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        for prescription in prescriptions:
+            offset = self._offsets.get(prescription["patient_id"])
+            if offset is not None:  # unknown: planned by a later reload once reported
+                by_offset[offset].append(prescription)
+        for offset, group in by_offset.items():
+            occurrences = expand_schedules(group, from_minute(start), from_minute(end), offset)
+            scheduled = occurrences.scheduled_at.astype(np.int64).tolist()
+            for p, minute in zip(occurrences.prescription.tolist(), scheduled):
+                deadline = minute + self.grace
+                if deadline > not_before_deadline:
+                    self._heap.append((deadline, minute, occurrences.prescription_ids[p]))
+        heapq.heapify(self._heap)
+
+    # ============= Sweeping =============
+
+    async def _run(self):
+        while True:
+            wait = MAX_SLEEP_SECONDS
+            try:
+                if await self.acquire_lease():
+                    now = to_minute(datetime.utcnow())
+                    await self.load(now)
+                    await self.sweep(now)
+                    if self._heap:
+                        wait = min(wait, max((self._heap[0][0] - now) * 60, 1))
+            except Exception as e:
+                logger.error(f"Missed-dose sweep failed: {str(e)}")
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def sweep(self, now: int) -> int:
+        """Handle every deadline up to `now` (epoch minutes); returns missed logs written"""
+        started = time.perf_counter()
+        entries: List[Tuple[int, int, str]] = []
+        while self._heap and self._heap[0][0] <= now:
+            entries.append(heapq.heappop(self._heap))
+        due = [(scheduled, prescription_id) for _, scheduled, prescription_id in entries]
+
+        written = 0
+        for i in range(0, len(due), self.batch_size):
+            try:
+                written += await self._record_missed(due[i:i + self.batch_size])
+            except Exception:
+                # Put back what wasn't written and keep the checkpoint, so the next sweep retries it
+                for entry in entries[i:]:
+                    heapq.heappush(self._heap, entry)
+                self.missed_written += written
+                raise
+
+        # Everything with a deadline up to now is handled: persist the checkpoint
+        # ($max, so a deposed leader finishing late can't move it back)
+        if now > self._swept_until:
+            self._swept_until = now
+            await self.db.sweeper_state.update_one(
+                {"_id": STATE_ID}, {"$max": {"swept_until": from_minute(now)}}, upsert=True
+            )
+        self.sweeps += 1
+        self.missed_written += written
+        self.last_sweep_ms = round((time.perf_counter() - started) * 1000, 2)
+        if written:
+            logger.info(f"Recorded {written} missed doses")
+        return written
+
+    async def _record_missed(self, due: List[Tuple[int, str]]) -> int:
+        """Write missed logs for the due doses no log answers; `due` is in time order"""
+        ids = sorted({prescription_id for _, prescription_id in due})
+        index = {prescription_id: i for i, prescription_id in enumerate(ids)}
+        occurrences = DoseOccurrences(
+            ids,
+            np.array([index[prescription_id] for _, prescription_id in due], dtype=np.int64),
+            np.array([scheduled for scheduled, _ in due], dtype=np.int64).view("datetime64[m]"),
+        )
+
+        patients = list({self._prescriptions[p]["patient_id"] for p in ids})
+        window = MATCH_WINDOW_MINUTES
+        logs = await self.db.reminder_logs.aggregate([
+            {"$match": {
+                "patient_id": {"$in": patients},
+                "prescription_id": {"$in": ids},
+                "scheduled_at": {"$gte": from_minute(due[0][0] - window), "$lt": from_minute(due[-1][0] + window + 1)},
+            }},
+            {"$project": {"_id": 0, "prescription_id": 1, "action": 1, "ms": {"$toLong": "$scheduled_at"}}},
+        ]).to_list(None)
+        ranks = match_logs(
+            occurrences,
+            [log["prescription_id"] for log in logs],
+            [log["ms"] // 60000 for log in logs],
+            [log["action"] for log in logs]
+        )
+
+        missed = []
+        for (scheduled, prescription_id), rank in zip(due, ranks.tolist()):
+            if rank >= MISSED:
+                continue
+            scheduled_at = from_minute(scheduled)
+            missed.append(self.make_log(
+                id=f"missed:{prescription_id}:{scheduled}",
+                prescription_id=prescription_id,
+                patient_id=self._prescriptions[prescription_id]["patient_id"],
+                scheduled_at=scheduled_at,
+                action="missed",
+                note="No response within the grace period",
+                source="sweeper",
+                created_at=scheduled_at,
+            ))
+        if not missed:
+            return 0
+
+        rejected = set()
+        try:
+            await self.db.reminder_logs.bulk_write([InsertOne(log) for log in missed], ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            rejected = {error["index"] for error in errors}  # already written by an earlier sweep
+        inserted = [log for i, log in enumerate(missed) if i not in rejected]
+        await record_reminder_actions(self.db, inserted)
+        return len(inserted)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "leader": self._leader,
+            "prescriptions": len(self._prescriptions),
+            "patients_without_offset": sum(1 for offset in self._offsets.values() if offset is None),
+            "heap_size": len(self._heap),
+            "next_deadline": from_minute(self._heap[0][0]) if self._heap else None,
+            "swept_until": from_minute(self._swept_until) if self._swept_until else None,
+            "sweeps": self.sweeps,
+            "missed_written": self.missed_written,
+            "last_sweep_ms": self.last_sweep_ms,
+        }
@@ -0,0 +1,142 @@
+"""
+Perceptual-hash cache for OCR recognitions.
+
+Re-scanning the same medicine box yields a slightly different photo each
+time, so results are keyed by a 64-bit difference hash (dHash) of the
+preprocessed image and looked up by Hamming distance rather than equality.
+
+Two tiers:
+- a process-local LRU, scanned linearly (popcount over a few hundred ints);
+- the `ocr_cache` collection with a TTL index. Hashes are stored split into
+  eight 8-bit bands; two hashes within distance d differ in at most d bands,
+  so they share at least 8 - d (pigeonhole). A multikey index on the bands
+  finds documents sharing any band, and the server keeps only those sharing
+  enough of them, which leaves few enough to compare exactly without a cap.
+
+Configured through environment variables:
+    OCR_CACHE_MAX_DISTANCE  Hamming distance treated as "same image" (default 6, max 7)
+    OCR_CACHE_TTL_SECONDS   persistent tier lifetime (default 7 days)
+    OCR_CACHE_LRU_SIZE      in-memory entries (default 512)
+"""
+
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+BANDS = 8
+BAND_BITS = HASH_BITS // BANDS
+MAX_SUPPORTED_DISTANCE = BANDS - 1
+
+OCR_CACHE_TTL_SECONDS = int(os.environ.get('OCR_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+
+
+def dhash(img: Image.Image) -> int:
+    """64-bit difference hash: brightness gradient of a 9x8 grayscale thumbnail"""
+    small = img.convert("L").resize((9, 8), Image.Resampling.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def hash_bands(value: int) -> List[str]:
+    """Split a hash into position-tagged bands, e.g. ["0:a3", "1:07", ...]"""
+    mask = (1 << BAND_BITS) - 1
+    return [f"{i}:{(value >> (i * BAND_BITS)) & mask:02x}" for i in range(BANDS)]
+
+
+class OCRResultCache:
+    """Near-duplicate image cache with an in-memory LRU in front of MongoDB"""
+
+    def __init__(self, max_distance: Optional[int] = None, lru_size: Optional[int] = None):
+        distance = max_distance if max_distance is not None else int(os.environ.get('OCR_CACHE_MAX_DISTANCE', 6))
+        self.max_distance = min(distance, MAX_SUPPORTED_DISTANCE)
+        self.lru_size = lru_size or int(os.environ.get('OCR_CACHE_LRU_SIZE', 512))
+        self._lru: "OrderedDict[int, Tuple[Dict[str, Any], datetime]]" = OrderedDict()
+        self.hits_memory = 0
+        self.hits_persistent = 0
+        self.misses = 0
+
+    def _remember(self, value: int, payload: Dict[str, Any], created_at: datetime):
+        self._lru[value] = (payload, created_at)
+        self._lru.move_to_end(value)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _lookup_memory(self, value: int) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        best, best_distance = None, self.max_distance + 1
+        for key, (payload, created_at) in self._lru.items():
+            distance = hamming(key, value)
+            if distance < best_distance and (now - created_at).total_seconds() < OCR_CACHE_TTL_SECONDS:
+                best, best_distance = key, distance
+                if distance == 0:
+                    break
+        if best is None:
+            return None
+        self._lru.move_to_end(best)
+        return self._lru[best][0]
+
+    async def get(self, db, value: int) -> Optional[Dict[str, Any]]:
+        """Return the cached payload for the nearest image within max_distance"""
+        payload = self._lookup_memory(value)
+        if payload is not None:
+            self.hits_memory += 1
+            return payload
+
+        bands = hash_bands(value)
+        candidates = await db.ocr_cache.aggregate([
+            {"$match": {"bands": {"$in": bands}}},
+            {"$match": {"$expr": {"$gte": [
+                {"$size": {"$setIntersection": ["$bands", bands]}}, BANDS - self.max_distance
+            ]}}},
+            {"$project": {"_id": 0, "hash": 1, "payload": 1, "created_at": 1}},
+        ]).to_list(None)
+        nearest = min(candidates, key=lambda c: hamming(int(c["hash"], 16), value), default=None)
+        if nearest and hamming(int(nearest["hash"], 16), value) <= self.max_distance:
+            self.hits_persistent += 1
+            self._remember(value, nearest["payload"], nearest["created_at"])
+            return nearest["payload"]
+
+        self.misses += 1
+        return None
+
+    async def put(self, db, value: int, payload: Dict[str, Any]) -> None:
+        """Store a payload in both tiers"""
+        created_at = datetime.utcnow()
+        self._remember(value, payload, created_at)
+        await db.ocr_cache.update_one(
+            {"hash": f"{value:016x}"},
+            {"$set": {"bands": hash_bands(value), "payload": payload, "created_at": created_at}},
+            upsert=True
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits_memory + self.hits_persistent + self.misses
+        hits = self.hits_memory + self.hits_persistent
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_persistent": self.hits_persistent,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries_memory": len(self._lru),
+            "max_distance": self.max_distance,
+        }
+
+
+ocr_cache = OCRResultCache()
@@ -0,0 +1,82 @@
+"""
+Keyset pagination over (created_at, id).
+
+List routes return one page plus an opaque `next_cursor`. The cursor
+encodes the sort key of the last document on the page; the next page
+starts strictly after it. Each page is therefore a bounded index range
+scan on (<filter>, created_at, id), the same cost at page 1 or page
+1000, unlike skip() which walks every earlier document.
+
+`id` breaks ties between documents created in the same millisecond, so
+no document is skipped or repeated across pages.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class InvalidCursorError(ValueError):
+    """Cursor was not produced by encode_cursor()"""
+
+
+def _to_ms(value: datetime) -> int:
+    # BSON dates have millisecond precision; anything finer never reaches the db
+    return (value - _EPOCH) // timedelta(milliseconds=1)
+
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    """Cursor pointing just past `doc`"""
+    payload = json.dumps([_to_ms(doc["created_at"]), doc["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of encode_cursor(); raises InvalidCursorError on anything else"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ms, doc_id = json.loads(raw)
+        if not isinstance(ms, int) or not isinstance(doc_id, str):
+            raise ValueError
+        return _EPOCH + timedelta(milliseconds=ms), doc_id
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, OverflowError):
+        raise InvalidCursorError("Invalid cursor")
+
+
+def sort_spec(descending: bool) -> List[Tuple[str, int]]:
+    direction = -1 if descending else 1
+    return [("created_at", direction), ("id", direction)]
+
+
+def keyset_query(query: Dict[str, Any], cursor: Optional[str], descending: bool) -> Dict[str, Any]:
+    """Restrict `query` to documents after `cursor` in sort_spec() order"""
+    if not cursor:
+        return query
+    created_at, doc_id = decode_cursor(cursor)
+    op = "$lt" if descending else "$gt"
+    after = {"$or": [
+        {"created_at": {op: created_at}},
+        {"created_at": created_at, "id": {op: doc_id}},
+    ]}
+    return {"$and": [query, after]} if query else after
+
+
+async def fetch_page(
+    collection,
+    query: Dict[str, Any],
+    projection: Dict[str, Any],
+    limit: int,
+    cursor: Optional[str] = None,
+    descending: bool = False,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of `collection` plus the cursor for the next (None on the last page)"""
+    docs = await collection.find(keyset_query(query, cursor, descending), projection) \
+        .sort(sort_spec(descending)).limit(limit + 1).to_list(limit + 1)
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1])
@@ -0,0 +1,65 @@
+"""
+Sparse fieldsets for read routes.
+
+Clients pass `fields=name,strength,...` to get only those fields back; the
+selection is pushed down into the Mongo projection, so unrequested fields
+never leave the database. Without `fields`, list routes still leave out
+the heavy fields (stored photos, long free text) that a list screen never
+shows; detail routes return whole documents.
+"""
+
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+
+class InvalidFieldsError(ValueError):
+    """`fields` names something the resource doesn't have"""
+
+
+class Resource:
+    """Selectable fields of one collection"""
+
+    def __init__(
+        self, name: str, fields: Iterable[str], heavy: Iterable[str] = (), required: Iterable[str] = ("id",)
+    ):
+        self.name = name
+        self.fields: FrozenSet[str] = frozenset(fields)
+        # left out of list responses unless asked for
+        self.heavy: FrozenSet[str] = frozenset(heavy)
+        # always returned, e.g. keys that pagination cursors are built from
+        self.required = tuple(required)
+
+    def parse(self, fields: Optional[str]) -> Optional[List[str]]:
+        """Validated field list from a `fields` query value; None when absent"""
+        if fields is None or not fields.strip():
+            return None
+        selected = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+        unknown = [f for f in selected if f not in self.fields]
+        if unknown:
+            raise InvalidFieldsError(
+                f"Unknown {self.name} field(s): {', '.join(unknown)}; "
+                f"choose from {', '.join(sorted(self.fields))}"
+            )
+        return selected
+
+    def projection(self, fields: Optional[str], list_view: bool = False) -> Dict[str, Any]:
+        """Mongo projection for a `fields` query value"""
+        selected = self.parse(fields)
+        if selected is not None:
+            projection: Dict[str, Any] = {"_id": 0}
+            projection.update((f, 1) for f in (*self.required, *selected))
+            return projection
+        projection = {"_id": 0}
+        if list_view:
+            projection.update((f, 0) for f in sorted(self.heavy))
+        return projection
+
+    def select(self, doc: Dict[str, Any], fields: Optional[str], list_view: bool = False) -> Dict[str, Any]:
+        """Apply projection() to a document that is already in memory"""
+        selected = self.parse(fields)
+        if selected is not None:
+            keep = (*self.required, *selected)
+            return {k: doc[k] for k in keep if k in doc}
+        if list_view:
+            return {k: v for k, v in doc.items() if k not in self.heavy}
+        return doc
+
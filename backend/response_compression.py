@@ -0,0 +1,296 @@
+"""
+Negotiated response compression.
+
+An ASGI middleware that compresses response bodies with the best coding
+the client accepts: zstd, then br, then gzip. q-values in Accept-Encoding
+are honoured; server preference breaks ties. Codecs whose optional
+package (zstandard, brotli) isn't installed are simply never offered.
+
+Bodies are left alone when compressing can't pay off:
+- below the size threshold (a sub-MTU body gains nothing);
+- already-encoded, partial (206) or bodiless (204/304) responses;
+- media types that are compressed already (images, archives, video);
+- event streams, which have to reach the client chunk by chunk.
+
+Small bodies are compressed inline. Large ones go to a small thread pool
+so a 300 KB history page doesn't stall the event loop. A compressed
+response carries `Vary: Accept-Encoding`, and any strong ETag on it is
+weakened, because the bytes no longer match the identity representation.
+If-None-Match still compares weakly, so 304s keep working.
+
+Per-route compression ratio and CPU time are exposed through stats().
+
+Configured through environment variables:
+    RESPONSE_COMPRESSION                "false" disables the middleware (default true)
+    RESPONSE_COMPRESSION_MIN_BYTES      smallest body worth compressing (default 1024)
+    RESPONSE_COMPRESSION_OFFLOAD_BYTES  bodies at least this big compress off-loop (default 65536)
+    RESPONSE_COMPRESSION_WORKERS        thread pool size (default 2)
+    RESPONSE_COMPRESSION_GZIP_LEVEL     1-9 (default 6)
+    RESPONSE_COMPRESSION_BR_QUALITY     0-11 (default 5)
+    RESPONSE_COMPRESSION_ZSTD_LEVEL     1-22 (default 3)
+"""
+
+import asyncio
+import gzip
+import logging
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:  # optional: br is not offered
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional: zstd is not offered
+    zstandard = None
+
+# Server preference when the client rates several codings equally
+PREFERENCE = ("zstd", "br", "gzip")
+
+# Media types whose bodies are already compressed
+INCOMPRESSIBLE_PREFIXES = ("image/", "audio/", "video/", "font/woff")
+INCOMPRESSIBLE_TYPES = {
+    "application/zip", "application/gzip", "application/x-gzip", "application/zstd",
+    "application/pdf", "application/octet-stream", "text/event-stream",
+}
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """{coding: q} from an Accept-Encoding header"""
+    accepted: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header: Optional[str], available: Tuple[str, ...]) -> Optional[str]:
+    """Best available coding the client accepts, or None for identity"""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compressible(content_type: Optional[str]) -> bool:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if not media_type:
+        return False
+    return media_type not in INCOMPRESSIBLE_TYPES and not media_type.startswith(INCOMPRESSIBLE_PREFIXES)
+
+
+class RouteStats:
+    __slots__ = ("responses", "compressed", "bytes_in", "bytes_out", "cpu_ms", "encodings")
+
+    def __init__(self):
+        self.responses = 0
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_ms = 0.0
+        self.encodings: Dict[str, int] = defaultdict(int)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "responses": self.responses,
+            "compressed": self.compressed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_in / self.bytes_out, 2) if self.bytes_out else None,
+            "cpu_ms": round(self.cpu_ms, 2),
+            "encodings": dict(self.encodings),
+        }
+
+
+class ResponseCompressor:
+    """Codecs, thresholds, the off-loop pool and per-route counters"""
+
+    def __init__(
+        self,
+        min_bytes: int = 1024,
+        offload_bytes: int = 65536,
+        workers: int = 2,
+        gzip_level: int = 6,
+        br_quality: int = 5,
+        zstd_level: int = 3,
+        enabled: bool = True,
+    ):
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        self.offload_bytes = offload_bytes
+        self._codecs: Dict[str, Callable[[bytes], bytes]] = {
+            "gzip": lambda body: gzip.compress(body, compresslevel=gzip_level, mtime=0),
+        }
+        if brotli is not None:
+            self._codecs["br"] = lambda body: brotli.compress(body, quality=br_quality)
+        if zstandard is not None:
+            # ZstdCompressor instances aren't thread-safe; they're cheap to make
+            self._codecs["zstd"] = lambda body: zstandard.ZstdCompressor(level=zstd_level).compress(body)
+        self.available = tuple(coding for coding in PREFERENCE if coding in self._codecs)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compression")
+        self._routes: Dict[str, RouteStats] = defaultdict(RouteStats)
+        self.offloaded = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCompressor":
+        return cls(
+            min_bytes=int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', 1024)),
+            offload_bytes=int(os.environ.get('RESPONSE_COMPRESSION_OFFLOAD_BYTES', 65536)),
+            workers=int(os.environ.get('RESPONSE_COMPRESSION_WORKERS', 2)),
+            gzip_level=int(os.environ.get('RESPONSE_COMPRESSION_GZIP_LEVEL', 6)),
+            br_quality=int(os.environ.get('RESPONSE_COMPRESSION_BR_QUALITY', 5)),
+            zstd_level=int(os.environ.get('RESPONSE_COMPRESSION_ZSTD_LEVEL', 3)),
+            enabled=os.environ.get('RESPONSE_COMPRESSION', 'true').lower() not in ('0', 'false', 'no'),
+        )
+
+    def _encode(self, coding: str, body: bytes) -> Tuple[bytes, float]:
+        started = time.thread_time()
+        encoded = self._codecs[coding](body)
+        return encoded, (time.thread_time() - started) * 1000
+
+    async def compress(self, route: str, coding: str, body: bytes) -> Optional[bytes]:
+        """Encoded body, or None when encoding didn't make it smaller"""
+        if len(body) >= self.offload_bytes:
+            self.offloaded += 1
+            loop = asyncio.get_running_loop()
+            encoded, cpu_ms = await loop.run_in_executor(self._executor, self._encode, coding, body)
+        else:
+            encoded, cpu_ms = self._encode(coding, body)
+        stats = self._routes[route]
+        stats.cpu_ms += cpu_ms
+        if len(encoded) >= len(body):
+            return None
+        stats.compressed += 1
+        stats.bytes_in += len(body)
+        stats.bytes_out += len(encoded)
+        stats.encodings[coding] += 1
+        return encoded
+
+    def count(self, route: str) -> None:
+        self._routes[route].responses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "encodings": list(self.available),
+            "min_bytes": self.min_bytes,
+            "offload_bytes": self.offload_bytes,
+            "offloaded": self.offloaded,
+            "routes": {route: stats.snapshot() for route, stats in sorted(self._routes.items())},
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def _route_name(scope) -> str:
+    # FastAPI records the matched route in the scope; raw paths would carry ids
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class CompressionMiddleware:
+    """ASGI middleware applying a ResponseCompressor"""
+
+    def __init__(self, app, compressor: ResponseCompressor):
+        self.app = app
+        self.compressor = compressor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.compressor.enabled:
+            await self.app(scope, receive, send)
+            return
+        accept = None
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        coding = choose_encoding(accept, self.compressor.available)
+
+        start: Optional[Dict[str, Any]] = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                if (
+                    coding is None
+                    or message["status"] in (204, 206, 304)
+                    or b"content-encoding" in headers
+                    or not compressible(headers.get(b"content-type", b"").decode("latin-1"))
+                ):
+                    passthrough = True
+                    self.compressor.count(_route_name(scope))
+                    await send(message)
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            await self._finish(scope, send, start, b"".join(chunks), coding)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _finish(self, scope, send, start, body: bytes, coding: str):
+        route = _route_name(scope)
+        self.compressor.count(route)
+        encoded = None
+        if len(body) >= self.compressor.min_bytes:
+            encoded = await self.compressor.compress(route, coding, body)
+        if encoded is None:
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        headers = []
+        vary = []
+        for name, value in start.get("headers", []):
+            lower = name.lower()
+            if lower == b"content-length":
+                continue
+            if lower == b"vary":
+                vary.append(value)
+                continue
+            if lower == b"etag" and not value.startswith(b"W/"):
+                value = b"W/" + value
+            headers.append((name, value))
+        if not any(b"accept-encoding" in v.lower() for v in vary):
+            vary.append(b"Accept-Encoding")
+        headers.append((b"vary", b", ".join(vary)))
+        headers.append((b"content-encoding", coding.encode("ascii")))
+        headers.append((b"content-length", str(len(encoded)).encode("ascii")))
+        await send({**start, "headers": headers})
+        await send({"type": "http.response.body", "body": encoded})
+
+
+response_compressor = ResponseCompressor.from_env()
@@ -0,0 +1,253 @@
+"""
+Dose-occurrence calendar for MediMinder.
+
+A prescription's `schedule` ({times: ["08:00", "20:00"], days: ["Mon", ...]})
+together with `start_date`/`end_date` defines when doses are due. This
+module expands any number of prescriptions into every occurrence in a date
+range with NumPy datetime64 arithmetic instead of per-day Python loops: the
+(prescription x day x time) grid is built as one boolean array and its true
+cells become occurrences. Reminder logs are then joined to the nearest
+occurrence of the same prescription with a sorted search.
+
+Schedule times are the patient's wall-clock times; occurrences are returned
+in UTC using the patient's fixed `utc_offset_minutes`.
+
+Configured through environment variables:
+    SCHEDULE_GRACE_MINUTES         how long after its time an unlogged dose stays pending (default 120)
+    SCHEDULE_MATCH_WINDOW_MINUTES  furthest a log may be from the dose it answers (default 180)
+    SCHEDULE_MAX_DAYS              longest range one expansion may cover (default 366)
+"""
+
+import os
+import re
+from functools import lru_cache
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+GRACE_MINUTES = int(os.environ.get('SCHEDULE_GRACE_MINUTES', 120))
+MATCH_WINDOW_MINUTES = int(os.environ.get('SCHEDULE_MATCH_WINDOW_MINUTES', 180))
+MAX_DAYS = int(os.environ.get('SCHEDULE_MAX_DAYS', 366))
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+MINUTES_PER_DAY = 24 * 60
+
+# Statuses, also the rank a matching log gives an occurrence (the highest wins)
+PENDING, SNOOZED, MISSED, TAKEN = 0, 1, 2, 3
+ACTION_RANK = {"snoozed": SNOOZED, "missed": MISSED, "took": TAKEN}
+STATUS_NAMES = {PENDING: "pending", SNOOZED: "pending", MISSED: "missed", TAKEN: "taken"}
+
+_TIME = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*([ap]\.?m\.?)?\s*$", re.IGNORECASE)
+_KEY_STRIDE = np.int64(1) << 32  # separates prescriptions in joined sort keys
+_EPOCH = datetime(1970, 1, 1)
+_MINUTE = timedelta(minutes=1)
+
+
+class ScheduleRangeError(ValueError):
+    """Raised when a requested range is malformed, empty or too long"""
+
+
+class DoseOccurrences(NamedTuple):
+    """Occurrences sorted by time; `prescription` indexes `prescription_ids`"""
+    prescription_ids: List[str]
+    prescription: np.ndarray  # int64
+    scheduled_at: np.ndarray  # datetime64[m], UTC
+
+
+@lru_cache(maxsize=4096)
+def parse_time(value: str) -> Optional[int]:
+    """Minutes after midnight for "08:00", "8:00 PM" and the like; None if unparseable"""
+    match = _TIME.match(str(value))
+    if not match:
+        return None
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2)), match.group(3)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem[0].lower() == "p" else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return hour * 60 + minute
+
+
+def weekday_mask(days: Iterable[str]) -> Tuple[bool, ...]:
+    """Monday-first boolean mask; an empty or unrecognised list means every day"""
+    return _weekday_mask(tuple(days or ()))
+
+
+@lru_cache(maxsize=1024)
+def _weekday_mask(days: Tuple[str, ...]) -> Tuple[bool, ...]:
+    wanted = {str(day).strip().lower()[:3] for day in days}
+    mask = tuple(day in wanted for day in WEEKDAYS)
+    return mask if any(mask) else (True,) * 7
+
+
+@lru_cache(maxsize=4096)
+def _parse_day(value: Optional[str]) -> Optional[np.datetime64]:
+    if not value:
+        return None
+    try:
+        return np.datetime64(str(value)[:10], "D")
+    except ValueError:
+        return None
+
+
+def parse_bound(value: str, utc_offset_minutes: int, end: bool) -> datetime:
+    """Naive UTC instant for a range bound
+
+    A date (YYYY-MM-DD) is a whole local day: its midnight as a start, the
+    following midnight as an end. Anything else is read as an ISO datetime,
+    UTC unless it carries an offset.
+    """
+    try:
+        if len(value) == 10:
+            local = datetime.strptime(value, "%Y-%m-%d") + timedelta(days=1 if end else 0)
+            return local - timedelta(minutes=utc_offset_minutes)
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ScheduleRangeError(f"Invalid date or datetime '{value}'")
+    if moment.tzinfo is not None:
+        moment = (moment - moment.utcoffset()).replace(tzinfo=None)
+    return moment
+
+
+def expand_schedules(prescriptions: List[Dict[str, Any]], start: datetime, end: datetime,
+                     utc_offset_minutes: int = 0) -> DoseOccurrences:
+    """Every dose due in [start, end) (naive UTC) for the given prescriptions"""
+    if end <= start:
+        raise ScheduleRangeError("Range end must be after its start")
+    if end - start > timedelta(days=MAX_DAYS):
+        raise ScheduleRangeError(f"Range may cover at most {MAX_DAYS} days")
+
+    offset = np.timedelta64(utc_offset_minutes, "m")
+    start_m = np.datetime64(start, "m")
+    end_m = np.datetime64(end, "m")
+    # Local calendar days touched by the range
+    days = np.arange((start_m + offset).astype("datetime64[D]"),
+                     (end_m + offset).astype("datetime64[D]") + 1, dtype="datetime64[D]")
+    day_weekday = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+
+    ids: List[str] = []
+    first_day, last_day, masks, times = [], [], [], []
+    for prescription in prescriptions:
+        schedule = prescription.get("schedule") or {}
+        minutes = {m for m in map(parse_time, schedule.get("times") or []) if m is not None}
+        start_day = _parse_day(prescription.get("start_date"))
+        if not minutes or start_day is None:
+            continue
+        ids.append(prescription["id"])
+        first_day.append(start_day)
+        last_day.append(_parse_day(prescription.get("end_date")) or days[-1])
+        masks.append(weekday_mask(schedule.get("days")))
+        times.append(sorted(minutes))
+
+    if not ids:
+        return DoseOccurrences(ids, np.empty(0, np.int64), np.empty(0, "datetime64[m]"))
+
+    # One column per (time of day, prescription) pair, ordered by time, so the
+    # day-major grid enumerates occurrences already in chronological order
+    pair_minute = np.array([m for minutes in times for m in minutes], dtype=np.int64)
+    pair_prescription = np.repeat(np.arange(len(ids), dtype=np.int64), [len(m) for m in times])
+    by_time = np.argsort(pair_minute, kind="stable")
+    pair_minute, pair_prescription = pair_minute[by_time], pair_prescription[by_time]
+
+    first_day = np.array(first_day, dtype="datetime64[D]")
+    last_day = np.array(last_day, dtype="datetime64[D]")
+    active = (
+        (days[:, None] >= first_day[None, :])
+        & (days[:, None] <= last_day[None, :])
+        & np.array(masks).T[day_weekday]
+    )  # day x prescription
+    grid = active[:, pair_prescription]
+    per_day = np.count_nonzero(grid, axis=1)
+    # Split flat cell numbers into (day, pair) with a repeat instead of a division
+    pair = np.flatnonzero(grid) - np.repeat(np.arange(len(days), dtype=np.int64) * len(pair_minute), per_day)
+
+    # Integer minutes since the epoch, UTC
+    day_start = days.astype(np.int64) * MINUTES_PER_DAY - utc_offset_minutes
+    scheduled_at = np.repeat(day_start, per_day) + pair_minute[pair]
+    lo, hi = np.searchsorted(scheduled_at, [start_m.astype(np.int64), end_m.astype(np.int64)])
+    return DoseOccurrences(ids, pair_prescription[pair[lo:hi]], scheduled_at[lo:hi].view("datetime64[m]"))
+
+
+def log_minutes(moments: Iterable[datetime]) -> np.ndarray:
+    """Minutes since the epoch for naive UTC datetimes (much faster than np.array(..., "datetime64[m]"))"""
+    return np.fromiter(((moment - _EPOCH) // _MINUTE for moment in moments), dtype=np.int64)
+
+
+def match_logs(occurrences: DoseOccurrences, prescription_ids: Sequence[str], minutes: np.ndarray,
+               actions: Sequence[str], window_minutes: int = MATCH_WINDOW_MINUTES) -> np.ndarray:
+    """Rank of the strongest log answering each occurrence (PENDING when none)
+
+    Logs are given column-wise: prescription id, `scheduled_at` as minutes
+    since the epoch (see log_minutes) and action. Each log answers the
+    nearest occurrence of its prescription if it is within `window_minutes`.
+    """
+    ranks = np.zeros(len(occurrences.prescription), dtype=np.int8)
+    index = {prescription_id: i for i, prescription_id in enumerate(occurrences.prescription_ids)}
+    log_p = np.fromiter((index.get(p, -1) for p in prescription_ids), dtype=np.int64, count=len(prescription_ids))
+    log_rank = np.fromiter((ACTION_RANK.get(a, PENDING) for a in actions), dtype=np.int8, count=len(actions))
+    usable = (log_p >= 0) & (log_rank > PENDING)
+    if not usable.any() or not len(ranks):
+        return ranks
+    log_p, log_rank = log_p[usable], log_rank[usable]
+    log_keys = log_p * _KEY_STRIDE + np.asarray(minutes, dtype=np.int64)[usable]
+
+    # Occurrences are already in time order, so a stable sort on prescription
+    # alone orders them by (prescription, time); small ints get a radix sort
+    narrow = np.int16 if len(occurrences.prescription_ids) <= np.iinfo(np.int16).max else np.int32
+    order = np.argsort(occurrences.prescription.astype(narrow), kind="stable")
+    occ_keys = occurrences.prescription[order] * _KEY_STRIDE + occurrences.scheduled_at[order].astype(np.int64)
+
+    right = np.clip(np.searchsorted(occ_keys, log_keys), 0, len(occ_keys) - 1)
+    left = np.clip(right - 1, 0, len(occ_keys) - 1)
+    left_distance = np.abs(occ_keys[left] - log_keys)
+    right_distance = np.abs(occ_keys[right] - log_keys)
+    nearest = np.where(left_distance <= right_distance, left, right)
+    within = np.minimum(left_distance, right_distance) <= window_minutes
+
+    np.maximum.at(ranks, order[nearest[within]], log_rank[within])
+    return ranks
+
+
+def occurrence_statuses(occurrences: DoseOccurrences, ranks: np.ndarray, now: datetime,
+                        grace_minutes: int = GRACE_MINUTES) -> np.ndarray:
+    """Final status per occurrence: logged outcome, else missed once the grace period lapsed"""
+    overdue = occurrences.scheduled_at + np.timedelta64(grace_minutes, "m") < np.datetime64(now, "m")
+    statuses = ranks.copy()
+    statuses[(ranks < MISSED) & overdue] = MISSED
+    return statuses
+
+
+def schedule_entries(occurrences: DoseOccurrences, statuses: np.ndarray,
+                     prescriptions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Response rows for an expanded schedule"""
+    by_id = {prescription["id"]: prescription for prescription in prescriptions}
+    details = [by_id[prescription_id] for prescription_id in occurrences.prescription_ids]
+    names = [STATUS_NAMES[s] for s in range(TAKEN + 1)]
+    return [
+        {
+            "prescription_id": details[p]["id"],
+            "medication_name": details[p].get("medication_name"),
+            "dosage": details[p].get("dosage"),
+            "with_food": details[p].get("with_food", False),
+            "scheduled_at": scheduled_at,
+            "status": names[status],
+        }
+        for p, scheduled_at, status in zip(
+            occurrences.prescription.tolist(),
+            occurrences.scheduled_at.astype("datetime64[us]").tolist(),
+            statuses.tolist(),
+        )
+    ]
+
+
+def summarize_statuses(statuses: np.ndarray) -> Dict[str, int]:
+    counts = np.bincount(statuses, minlength=TAKEN + 1)
+    return {
+        "total": int(len(statuses)),
+        "taken": int(counts[TAKEN]),
+        "missed": int(counts[MISSED]),
+        "pending": int(counts[PENDING] + counts[SNOOZED]),
+    }
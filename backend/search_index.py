@@ -0,0 +1,200 @@
+"""
+In-process medication catalog search index.
+
+Serves `/medications/search` autocomplete without touching MongoDB. Names
+and generic names are normalized (case, Latin accents, punctuation) in any
+script and indexed two ways:
+
+- sorted key arrays searched with bisect, which act as a flattened prefix
+  trie over each field and over every word start within it;
+- trigram postings sets, intersected rarest-first and verified, for
+  substring matches anywhere in a name.
+
+Results are ranked exact > prefix > word prefix > substring.
+"""
+
+import bisect
+import logging
+import re
+import unicodedata
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELDS = ("name", "generic_name")
+# Never held in memory: inline photos the image migration hasn't drained yet
+UNINDEXED_FIELDS = ("_id", "image_base64")
+
+def normalize(text: Optional[str]) -> str:
+    """Casefold, strip accents from Latin letters and collapse everything but
+    letters, digits and marks to single spaces
+
+    Works in every script: "Парацетамол" and "पैरासिटामोल" keep their letters
+    (Devanagari vowel signs are marks, which a bare \\W would split on). An
+    empty result means the text has nothing to key on.
+    """
+    if not text:
+        return ""
+    chars = []
+    latin_base = False
+    for c in unicodedata.normalize("NFKD", text.casefold()):
+        if unicodedata.combining(c):
+            if latin_base:
+                continue  # é -> e; marks in other scripts are part of the letter
+        else:
+            latin_base = c.isascii()
+        chars.append(c if unicodedata.category(c)[0] in "LMN" else " ")
+    return " ".join(unicodedata.normalize("NFC", "".join(chars)).split())
+
+
+def trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _search_keys(fields: Tuple[str, ...]) -> Iterator[Tuple[int, str]]:
+    """(tier, key) for each field: tier 0 is the whole field, tier 1 each word start after the first"""
+    for field in fields:
+        if not field:
+            continue
+        yield 0, field
+        for match in re.finditer(" ", field):
+            yield 1, field[match.end():]
+
+
+class MedicationSearchIndex:
+    """Prefix + trigram index over the medications catalog"""
+
+    def __init__(self):
+        self._docs: List[Dict[str, Any]] = []  # slot -> document
+        self._fields: List[Tuple[str, ...]] = []  # slot -> normalized search fields
+        self._slots: Dict[str, int] = {}  # medication id -> slot
+        # Sorted (key, slot) arrays in rank order: whole-field keys, then word-start keys
+        self._keys: Tuple[List, List] = ([], [])
+        self._pending: Tuple[List, List] = ([], [])  # keys added since the last flush
+        self._postings: Dict[str, set] = {}  # trigram -> slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    # ============= Building =============
+
+    async def load(self, db) -> int:
+        """(Re)build the index from the medications collection"""
+        fresh = MedicationSearchIndex()
+        async for doc in db.medications.find({}, {f: 0 for f in UNINDEXED_FIELDS}):
+            fresh.add(doc, sort=False)
+        fresh.flush()
+        self.__dict__.update(fresh.__dict__)
+        logger.info(f"Medication search index loaded with {len(self)} entries")
+        return len(self)
+
+    def add(self, doc: Dict[str, Any], sort: bool = True) -> None:
+        """Index (or re-index) one medication document
+
+        Re-indexing reuses the document's slot after removing its old keys and
+        postings, so updates never grow the index. Bulk loaders pass
+        sort=False and call flush() once at the end.
+        """
+        slot = self._slots.get(doc["id"])
+        if slot is None:
+            slot = len(self._docs)
+            self._docs.append({})
+            self._fields.append(())
+            self._slots[doc["id"]] = slot
+        else:
+            self._unindex(slot)
+
+        fields = tuple(normalize(doc.get(f)) for f in SEARCH_FIELDS)
+        self._docs[slot] = {k: v for k, v in doc.items() if k not in UNINDEXED_FIELDS}
+        self._fields[slot] = fields
+
+        grams = set()
+        for tier, key in _search_keys(fields):
+            self._pending[tier].append((key, slot))
+        for field in fields:
+            grams |= trigrams(field)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(slot)
+
+        if sort:
+            self.flush()
+
+    def _unindex(self, slot: int) -> None:
+        """Remove a slot's sorted keys and trigram postings"""
+        for tier, key in _search_keys(self._fields[slot]):
+            entry = (key, slot)
+            keys = self._keys[tier]
+            i = bisect.bisect_left(keys, entry)
+            if i < len(keys) and keys[i] == entry:
+                del keys[i]
+            else:
+                self._pending[tier].remove(entry)  # added since the last flush
+        for gram in set().union(*(trigrams(field) for field in self._fields[slot])):
+            posting = self._postings[gram]
+            posting.discard(slot)
+            if not posting:
+                del self._postings[gram]
+
+    def flush(self) -> None:
+        """Merge pending keys into the sorted arrays"""
+        for keys, pending in zip(self._keys, self._pending):
+            if len(pending) <= 32:
+                for key in pending:
+                    bisect.insort(keys, key)
+            else:
+                keys.extend(pending)
+                keys.sort()
+            pending.clear()
+
+    # ============= Querying =============
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Return up to `limit` documents ranked exact > prefix > word prefix > substring
+
+        Within the prefix tiers results come back in key order, which puts an
+        exact match first and shorter completions ahead of their extensions.
+        Each tier is only consulted while the page is still short, so a query
+        costs O(log n + limit) however broad the prefix is.
+        """
+        q = normalize(query)
+        if not q:
+            return self._docs[:limit]
+
+        seen = set()
+        results: List[Dict[str, Any]] = []
+
+        def take(slot: int) -> bool:
+            if slot not in seen:
+                seen.add(slot)
+                results.append(self._docs[slot])
+            return len(results) >= limit
+
+        for keys in self._keys:
+            i = bisect.bisect_left(keys, (q,))
+            while i < len(keys) and keys[i][0].startswith(q):
+                if take(keys[i][1]):
+                    return results
+                i += 1
+
+        if len(q) >= 3:
+            for slot in self._substring_candidates(q):
+                if any(q in field for field in self._fields[slot]) and take(slot):
+                    break
+        return results
+
+    def _substring_candidates(self, q: str) -> Iterator[int]:
+        """Lazily yield slots containing every trigram of q, rarest posting first"""
+        postings = []
+        for gram in trigrams(q):
+            posting = self._postings.get(gram)
+            if not posting:
+                return
+            postings.append(posting)
+        postings.sort(key=len)
+        rarest, rest = postings[0], postings[1:]
+        for slot in rarest:
+            if all(slot in posting for posting in rest):
+                yield slot
+
+
+medication_index = MedicationSearchIndex()
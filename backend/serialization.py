@@ -0,0 +1,57 @@
+"""
+JSON responses without jsonable_encoder.
+
+Route handlers return plain dicts built straight from Mongo documents and
+model_dump(). FastAPI's default path then walks every value twice: once
+in the pure-Python jsonable_encoder, again in json.dumps. Instead:
+
+- JSONObjectRoute gives every route that declares no response model a
+  `Dict[str, Any]` one. FastAPI then converts the body with a pydantic-core
+  TypeAdapter (compiled code; datetimes, UUIDs and sets handled natively)
+  and never calls jsonable_encoder. Routes that return a Response (304s,
+  streams, images) are passed through untouched as before.
+- APIResponse renders with orjson. Its `default` hook falls back to
+  jsonable_encoder for anything neither pydantic nor orjson knows, so
+  responses built by hand never fail where they used to succeed.
+
+See benchmarks/serialization_bench.py for the cost of each path.
+"""
+
+from typing import Any, Dict
+
+import orjson
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.dependencies.utils import get_typed_return_annotation
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute
+
+JSONObject = Dict[str, Any]
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _fallback(value: Any) -> Any:
+    return jsonable_encoder(value)
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_fallback, option=ORJSON_OPTIONS)
+
+
+class APIResponse(ORJSONResponse):
+    """Default response class: orjson with a jsonable_encoder fallback"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class JSONObjectRoute(APIRoute):
+    """APIRoute whose unannotated endpoints serialize through a TypeAdapter"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        # An explicit response_model (None included) or return annotation wins
+        response_model = kwargs.get("response_model", DefaultPlaceholder(None))
+        if isinstance(response_model, DefaultPlaceholder) and get_typed_return_annotation(endpoint) is None:
+            kwargs["response_model"] = JSONObject
+        super().__init__(path, endpoint, **kwargs)
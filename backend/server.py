@@ -1,33 +1,67 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Depends, Body
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Depends, Body, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from collections import Counter
+import asyncio
 import json
 import base64
-from PIL import Image
 import io
+import secrets
 
+# Before the local imports: several of them read their settings at import time
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+from indexes import ensure_indexes, verify_query_plans
+from search_index import medication_index, normalize
+from migrations import run_migrations, run_pre_index_migrations
+from image_pipeline import image_preprocessor, InvalidImageError
+from medication_images import (
+    IMAGE_CONTENT_TYPE, IMAGE_SIZES, ImageNotFoundError, InvalidRangeError, medication_images, parse_range
+)
+from ocr_cache import ocr_cache
+from ai_cache import explanation_cache, prompt_hash
+from single_flight import llm_flight, fingerprint
+from missed_doses import MissedDoseSweeper, retract_superseded_misses, sweeper_enabled
+from pagination import InvalidCursorError, fetch_page
+from serialization import APIResponse, JSONObjectRoute
+from response_compression import CompressionMiddleware, response_compressor
+from auth_tokens import InvalidTokenError, token_service
+from conditional import REVISION_BUMP, REVISION_BUMP_PIPELINE, conditional_find_one, conditional_page
+from projections import InvalidFieldsError, Resource
+from group_commit import GroupCommitWriter, group_commit_enabled
+from llm import LLMGateway, LLMTimeoutError, LLMUnavailableError, get_llm_provider
+from schedule import (
+    MATCH_WINDOW_MINUTES, ScheduleRangeError, expand_schedules, match_logs, occurrence_statuses,
+    parse_bound, schedule_entries, summarize_statuses
+)
+from adherence import (
+    build_adherence_pipeline, record_reminder_action, record_reminder_actions,
+    summarize_counts, summarize_groups
+)
+
 # MongoDB connection
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ.get('DB_NAME', 'mediminder_db')]
 
 # Create the main app
-app = FastAPI(title="MediMinder API", version="1.0.0")
+app = FastAPI(title="MediMinder API", version="1.0.0", default_response_class=APIResponse)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=JSONObjectRoute)
 
 security = HTTPBearer(auto_error=False)
 
@@ -38,6 +72,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def retract_answered_misses(logs: List[Dict[str, Any]]) -> None:
+    """With the sweeper on, late took/missed logs replace the misses it recorded"""
+    if missed_dose_sweeper is not None:
+        await retract_superseded_misses(db, logs)
+
+async def record_new_reminder_logs(logs: List[Dict[str, Any]]) -> None:
+    """Roll up freshly inserted reminder logs"""
+    await record_reminder_actions(db, logs)
+    await retract_answered_misses(logs)
+
+# Optional group commit for reminder-log inserts (REMINDER_GROUP_COMMIT=true); batches
+# are acknowledged by a majority before any request in them returns
+reminder_log_writer = GroupCommitWriter(
+    db.reminder_logs.with_options(write_concern=WriteConcern(w="majority")),
+    after_flush=record_new_reminder_logs
+) if group_commit_enabled() else None
+
+# Background sweeper recording unanswered doses as missed (MISSED_DOSE_SWEEPER=true enables)
+missed_dose_sweeper = MissedDoseSweeper(
+    db, make_log=lambda **fields: ReminderLog(**fields).model_dump()
+) if sweeper_enabled() else None
+
+# Upstream LLM behind a bounded gateway (LLM_PROVIDER=fake for offline testing);
+# its connection pool is opened on startup and closed on shutdown
+llm_gateway = LLMGateway(get_llm_provider())
+
+def llm_http_error(e: Exception) -> HTTPException:
+    """Map gateway failures to 503 (breaker open) or 504 (deadline)"""
+    if isinstance(e, LLMUnavailableError):
+        return HTTPException(
+            status_code=503, detail=str(e),
+            headers={"Retry-After": str(int(llm_gateway.breaker_cooldown_s))}
+        )
+    return HTTPException(status_code=504, detail=str(e))
+
 # ============= Models =============
 
 class User(BaseModel):
@@ -49,8 +118,6 @@ class User(BaseModel):
     password_hash: Optional[str] = None
     dark_mode: bool = False
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    otp: Optional[str] = None
-    otp_expires_at: Optional[datetime] = None
 
 class Patient(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -63,20 +130,24 @@ class Patient(BaseModel):
     primary_doctor_id: Optional[str] = None
     emergency_contact: Optional[Dict[str, str]] = None
     preferred_language: str = "en"
+    utc_offset_minutes: Optional[int] = None  # patient's wall clock, reported by the app; None until then
     caregiver_ids: List[str] = []
+    revision: int = 0  # bumped by every write; keys the ETag (see conditional.py)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Medication(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
+    name_normalized: Optional[str] = None  # unique lookup key, see search_index.normalize
     generic_name: Optional[str] = None
     form: str = "tablet"  # tablet, capsule, syrup, injection, etc.
     strength: Optional[str] = None
     manufacturer: Optional[str] = None
-    image_base64: Optional[str] = None
+    image: Optional[Dict[str, Any]] = None  # {hash, sizes}; bytes live in medication_images
     description: Optional[str] = None
     common_uses: Optional[str] = None
     side_effects: Optional[str] = None
+    revision: int = 0
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Prescription(BaseModel):
@@ -95,6 +166,7 @@ class Prescription(BaseModel):
     current_stock: int = 0
     total_per_refill: int = 0
     with_food: bool = False
+    revision: int = 0
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class ReminderLog(BaseModel):
@@ -106,12 +178,26 @@ class ReminderLog(BaseModel):
     action_at: Optional[datetime] = None
     with_food_confirmed: Optional[bool] = None
     note: Optional[str] = None
+    source: Optional[str] = None  # "sweeper" for missed doses recorded automatically
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+# Fields selectable with `fields=`; heavy ones are left out of list responses by default
+MEDICATION_FIELDS = Resource(
+    "medication", Medication.model_fields, heavy=["description", "side_effects"], required=("id", "revision")
+)
+PRESCRIPTION_FIELDS = Resource(
+    "prescription", Prescription.model_fields, heavy=["description"], required=("id", "created_at", "revision")
+)
+PATIENT_FIELDS = Resource("patient", Patient.model_fields, required=("id", "revision"))
+REMINDER_LOG_FIELDS = Resource("reminder log", ReminderLog.model_fields, required=("id", "created_at"))
+
 class OCRRequest(BaseModel):
     image_base64: str
     patient_id: Optional[str] = None
 
+class MedicationImageRequest(BaseModel):
+    image_base64: str
+
 class AIQuery(BaseModel):
     patient_id: Optional[str] = None
     medication_id: Optional[str] = None
@@ -137,6 +223,7 @@ class CreatePatientRequest(BaseModel):
     conditions: List[str] = []
     emergency_contact: Optional[Dict[str, str]] = None
     preferred_language: str = "en"
+    utc_offset_minutes: Optional[int] = None
 
 class AddMedicationRequest(BaseModel):
     patient_id: str
@@ -155,7 +242,8 @@ class AddMedicationRequest(BaseModel):
 
 class UpdateStockRequest(BaseModel):
     prescription_id: str
-    new_stock: int
+    new_stock: Optional[int] = None  # absolute stock level
+    adjustment: Optional[int] = None  # relative change, e.g. -1 or +30 on refill
 
 class LogReminderRequest(BaseModel):
     prescription_id: str
@@ -164,6 +252,19 @@ class LogReminderRequest(BaseModel):
     with_food_confirmed: Optional[bool] = None
     note: Optional[str] = None
 
+class BatchReminderItem(BaseModel):
+    id: Optional[str] = None  # client-generated; makes re-sent items idempotent
+    prescription_id: str
+    patient_id: str
+    action: str  # took, missed, snoozed
+    scheduled_at: Optional[datetime] = None
+    action_at: Optional[datetime] = None  # when the phone recorded it, possibly offline
+    with_food_confirmed: Optional[bool] = None
+    note: Optional[str] = None
+
+class BatchLogReminderRequest(BaseModel):
+    items: List[BatchReminderItem]
+
 class UpdateDarkModeRequest(BaseModel):
     dark_mode: bool
 
@@ -178,8 +279,89 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     """Get current authenticated user (simplified for MVP)"""
     if not credentials:
         return None
-    # In production, verify JWT token here
-    return {"user_id": credentials.credentials}
+    # Signature, expiry and revocation are all checked in-process: no database round trip
+    try:
+        claims = token_service.verify(credentials.credentials)
+    except InvalidTokenError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+    return {"user_id": claims["sub"], "role": claims["role"], "claims": claims}
+
+async def adjust_stock(prescription_id: str, delta: int) -> Optional[int]:
+    """Atomically add `delta` to a prescription's stock in one round trip.
+
+    Decrements only apply while enough stock remains, so concurrent doses can
+    never drive it negative. Returns the post-update stock, or None if the
+    prescription is missing or the stock is insufficient.
+    """
+    query: Dict[str, Any] = {"id": prescription_id}
+    if delta < 0:
+        query["current_stock"] = {"$gte": -delta}
+    updated = await db.prescriptions.find_one_and_update(
+        query,
+        {"$inc": {"current_stock": delta, **REVISION_BUMP}},
+        projection={"_id": 0, "current_stock": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return updated["current_stock"] if updated else None
+
+async def consume_stock(doses: Dict[str, int]) -> Dict[str, Optional[int]]:
+    """Take `doses[prescription_id]` units from each prescription in one bulk write.
+
+    Like adjust_stock, stock never goes below zero: a prescription with less
+    left than was taken ends at zero. Returns the post-update stock per
+    prescription (None when it doesn't exist).
+    """
+    if not doses:
+        return {}
+    await db.prescriptions.bulk_write([
+        UpdateOne(
+            {"id": prescription_id},
+            [{"$set": {
+                "current_stock": {"$max": [0, {"$subtract": ["$current_stock", count]}]},
+                **REVISION_BUMP_PIPELINE
+            }}]
+        )
+        for prescription_id, count in doses.items()
+    ], ordered=False)
+    rows = await db.prescriptions.find(
+        {"id": {"$in": list(doses)}}, {"_id": 0, "id": 1, "current_stock": 1}
+    ).to_list(None)
+    stock = {row["id"]: row.get("current_stock") for row in rows}
+    return {prescription_id: stock.get(prescription_id) for prescription_id in doses}
+
+def as_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    """Naive UTC, as stored everywhere else, for client-supplied timestamps"""
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+async def resolve_medication(name: str, description: Optional[str] = None) -> Dict:
+    """Find a medication by normalized name, creating it if missing, in one upsert"""
+    key = normalize(name)
+    if not key:
+        # An empty key would merge every such name into one shared record
+        raise ValueError(f"Medication name {name!r} has no letters or digits")
+    new_medication = Medication(name=name, name_normalized=key, form="tablet", description=description)
+    on_insert = new_medication.model_dump(exclude={"name_normalized"})
+    for attempt in range(2):
+        try:
+            medication = await db.medications.find_one_and_update(
+                {"name_normalized": key},
+                {"$setOnInsert": on_insert},
+                projection={"_id": 0},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            break
+        except DuplicateKeyError:
+            # A concurrent request inserted the same name first; the retry matches it
+            if attempt:
+                raise
+    if medication["id"] == new_medication.id:
+        medication_index.add(medication)
+        # Explanations generated for this name before it had a record are stale
+        await explanation_cache.invalidate_medication(db, f"name:{key}")
+    return medication
 
 # ============= Seed Medicine Database =============
 
@@ -303,37 +485,31 @@ async def seed_medicine_database():
         }
     ]
     
+    for med in common_medicines:
+        med["name_normalized"] = normalize(med["name"])
     await db.medications.insert_many(common_medicines)
     logger.info(f"Seeded {len(common_medicines)} medicines to database")
 
 # ============= Auth Routes =============
 
+# One pending challenge per phone in `otp_challenges`; a TTL index on
+# expires_at removes the ones never verified. Each challenge allows
+# OTP_MAX_ATTEMPTS guesses, then only a new login issues another code.
+OTP_TTL = timedelta(minutes=10)
+OTP_MAX_ATTEMPTS = 5
+
 @api_router.post("/auth/login")
 async def login(request: LoginRequest):
     """Initiate login with phone number"""
     try:
-        # Generate OTP
         otp = generate_otp()
-        expires_at = datetime.utcnow() + timedelta(minutes=10)
-        
-        # Check if user exists
-        user = await db.users.find_one({"phone": request.phone}, {"_id": 0})
-        
-        if user:
-            # Update existing user with new OTP
-            await db.users.update_one(
-                {"phone": request.phone},
-                {"$set": {"otp": otp, "otp_expires_at": expires_at}}
-            )
-        else:
-            # Create new user
-            new_user = User(
-                phone=request.phone,
-                name="User",  # Will be updated after verification
-                otp=otp,
-                otp_expires_at=expires_at
-            )
-            await db.users.insert_one(new_user.dict())
+        now = datetime.utcnow()
+        # A new login replaces any pending challenge for the phone
+        await db.otp_challenges.update_one(
+            {"phone": request.phone},
+            {"$set": {"otp": otp, "expires_at": now + OTP_TTL, "created_at": now, "attempts": 0}},
+            upsert=True
+        )
         
         logger.info(f"OTP generated for {request.phone}: {otp}")
         
@@ -346,31 +522,50 @@ async def login(request: LoginRequest):
         logger.error(f"Login error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def upsert_user_by_phone(phone: str) -> Dict:
+    """The user with this phone, created on first verified login"""
+    on_insert = User(phone=phone, name="User").model_dump()  # name is set after verification
+    for attempt in range(2):
+        try:
+            return await db.users.find_one_and_update(
+                {"phone": phone},
+                {"$setOnInsert": on_insert},
+                projection={"_id": 0},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # A concurrent verify for the same phone inserted first; the retry matches it
+            if attempt:
+                raise
+
 @api_router.post("/auth/verify")
 async def verify_otp(request: VerifyOTPRequest):
     """Verify OTP and return user token"""
     try:
-        user = await db.users.find_one({"phone": request.phone}, {"_id": 0})
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        if user.get("otp") != request.otp:
-            raise HTTPException(status_code=400, detail="Invalid OTP")
-        
-        if user.get("otp_expires_at") and datetime.fromisoformat(str(user["otp_expires_at"])) < datetime.utcnow():
-            raise HTTPException(status_code=400, detail="OTP expired")
-        
-        # Clear OTP
-        await db.users.update_one(
-            {"phone": request.phone},
-            {"$unset": {"otp": "", "otp_expires_at": ""}}
+        # Count the attempt before comparing, so concurrent guesses can't
+        # exceed the limit
+        challenge = await db.otp_challenges.find_one_and_update(
+            {"phone": request.phone, "expires_at": {"$gt": datetime.utcnow()},
+             "attempts": {"$not": {"$gte": OTP_MAX_ATTEMPTS}}},
+            {"$inc": {"attempts": 1}},
+            projection={"_id": 1, "otp": 1},
+            return_document=ReturnDocument.AFTER
         )
+        if not challenge or not secrets.compare_digest(challenge["otp"].encode(), request.otp.encode()):
+            raise HTTPException(status_code=400, detail="Invalid or expired OTP")
+        # Consume it; of two requests with the right code only one deletes it
+        consumed = await db.otp_challenges.delete_one({"_id": challenge["_id"], "otp": challenge["otp"]})
+        if not consumed.deleted_count:
+            raise HTTPException(status_code=400, detail="Invalid or expired OTP")
         
-        # Return user token (simplified - use JWT in production)
+        user = await upsert_user_by_phone(request.phone)
+        
+        token, claims = token_service.issue(user)
         return {
             "success": True,
-            "token": user["id"],
+            "token": token,
+            "token_expires_at": datetime.utcfromtimestamp(claims["exp"]),
             "user": {
                 "id": user["id"],
                 "phone": user["phone"],
@@ -385,6 +580,18 @@ async def verify_otp(request: VerifyOTPRequest):
         logger.error(f"Verify OTP error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/auth/logout")
+async def logout(current_user: Optional[Dict] = Depends(get_current_user)):
+    """Revoke the bearer token on every instance"""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        await token_service.revoke(db, current_user["claims"])
+        return {"success": True, "message": "Logged out"}
+    except Exception as e:
+        logger.error(f"Logout error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ============= User Settings =============
 
 @api_router.put("/users/{user_id}/dark-mode")
@@ -410,37 +617,59 @@ async def update_dark_mode(user_id: str, request: UpdateDarkModeRequest):
 async def create_patient(request: CreatePatientRequest):
     """Create a patient profile"""
     try:
-        patient = Patient(**request.dict())
-        await db.patients.insert_one(patient.dict())
-        return {"success": True, "patient": patient.dict()}
+        patient = Patient(**request.model_dump()).model_dump()
+        await db.patients.insert_one(dict(patient))  # a copy: insert_one adds _id
+        return {"success": True, "patient": patient}
     except Exception as e:
         logger.error(f"Create patient error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/patients/{patient_id}")
-async def get_patient(patient_id: str):
-    """Get patient details"""
+async def get_patient(patient_id: str, request: Request, response: Response, fields: Optional[str] = None):
+    """Get patient details, optionally only the comma-separated `fields`
+
+    Answers If-None-Match with 304 when the patient's revision is unchanged.
+    """
     try:
-        patient = await db.patients.find_one({"id": patient_id}, {"_id": 0})
+        patient = await conditional_find_one(
+            db.patients, {"id": patient_id}, PATIENT_FIELDS.projection(fields), request, response
+        )
+        if isinstance(patient, Response):
+            return patient
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
         return {"success": True, "patient": patient}
     except HTTPException:
         raise
+    except InvalidFieldsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Get patient error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# UTC offsets in use worldwide: UTC-12:00 to UTC+14:00, in minutes
+UTC_OFFSET_MIN, UTC_OFFSET_MAX = -720, 840
+
 @api_router.put("/patients/{patient_id}")
 async def update_patient(patient_id: str, updates: Dict[str, Any] = Body(...)):
     """Update patient details"""
     try:
+        updates.pop("revision", None)
+        if "utc_offset_minutes" in updates:
+            offset = updates["utc_offset_minutes"]
+            if not isinstance(offset, int) or isinstance(offset, bool) or not UTC_OFFSET_MIN <= offset <= UTC_OFFSET_MAX:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"utc_offset_minutes must be whole minutes between {UTC_OFFSET_MIN} and {UTC_OFFSET_MAX}"
+                )
         result = await db.patients.update_one(
             {"id": patient_id},
-            {"$set": updates}
+            {"$set": updates, "$inc": REVISION_BUMP}
         )
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Patient not found")
+        if missed_dose_sweeper is not None and "utc_offset_minutes" in updates:
+            missed_dose_sweeper.changed()
         return {"success": True, "message": "Patient updated"}
     except HTTPException:
         raise
@@ -451,59 +680,131 @@ async def update_patient(patient_id: str, updates: Dict[str, Any] = Body(...)):
 # ============= Medication Routes =============
 
 @api_router.get("/medications/search")
-async def search_medications(q: str = ""):
-    """Search medications by name"""
+async def search_medications(q: str = "", fields: Optional[str] = None):
+    """Search medications by name (served from the in-memory catalog index)
+
+    Results leave out description and side_effects unless `fields` asks for them.
+    """
     try:
-        query = {"$or": [
-            {"name": {"$regex": q, "$options": "i"}},
-            {"generic_name": {"$regex": q, "$options": "i"}}
-        ]} if q else {}
-        
-        medications = await db.medications.find(query, {"_id": 0}).limit(20).to_list(20)
+        medications = [
+            MEDICATION_FIELDS.select(med, fields, list_view=True)
+            for med in medication_index.search(q, limit=20)
+        ]
         return {"success": True, "medications": medications}
+    except InvalidFieldsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Search medications error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/medications/{medication_id}")
-async def get_medication(medication_id: str):
-    """Get medication details"""
+async def get_medication(medication_id: str, request: Request, response: Response, fields: Optional[str] = None):
+    """Get medication details, optionally only the comma-separated `fields`
+
+    Answers If-None-Match with 304 when the medication's revision is unchanged.
+    """
     try:
-        medication = await db.medications.find_one({"id": medication_id}, {"_id": 0})
+        medication = await conditional_find_one(
+            db.medications, {"id": medication_id}, MEDICATION_FIELDS.projection(fields), request, response
+        )
+        if isinstance(medication, Response):
+            return medication
         if not medication:
             raise HTTPException(status_code=404, detail="Medication not found")
         return {"success": True, "medication": medication}
     except HTTPException:
         raise
+    except InvalidFieldsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Get medication error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+IMAGE_CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+
+@api_router.put("/medications/{medication_id}/image")
+async def upload_medication_image(medication_id: str, request: MedicationImageRequest):
+    """Store a medication photo and its thumbnails outside the medication document"""
+    try:
+        if not await db.medications.find_one({"id": medication_id}, {"_id": 0, "id": 1}):
+            raise HTTPException(status_code=404, detail="Medication not found")
+        image = await medication_images.save(db, request.image_base64)
+        medication = await db.medications.find_one_and_update(
+            {"id": medication_id},
+            {"$set": {"image": image}, "$inc": REVISION_BUMP},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if medication:
+            medication_index.add(medication)
+        return {"success": True, "image": image}
+    except HTTPException:
+        raise
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Upload medication image error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/medications/{medication_id}/image")
+async def get_medication_image(medication_id: str, request: Request, size: str = "medium", v: Optional[str] = None):
+    """Serve one size of a medication photo
+
+    The ETag is the content hash, so revalidation is a 304 without touching
+    the blob store. Pass the medication's `image.hash` as `v` to get an
+    immutable, cache-forever response. Single byte ranges are honoured.
+    """
+    try:
+        if size not in IMAGE_SIZES:
+            raise HTTPException(status_code=400, detail=f"size must be one of {', '.join(IMAGE_SIZES)}")
+        medication = await db.medications.find_one({"id": medication_id}, {"_id": 0, "image.hash": 1})
+        digest = ((medication or {}).get("image") or {}).get("hash")
+        if not digest:
+            raise HTTPException(status_code=404, detail="Medication image not found")
+
+        headers = {
+            "ETag": f'"{digest}-{size}"',
+            "Cache-Control": IMAGE_CACHE_IMMUTABLE if v == digest else "no-cache",
+            "Accept-Ranges": "bytes",
+        }
+        if_none_match = request.headers.get("if-none-match", "")
+        if if_none_match.strip() == "*" or headers["ETag"] in [t.strip() for t in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        data = await medication_images.load(db, digest, size)
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if if_range and if_range.strip() != headers["ETag"]:
+            range_header = None  # the client's partial copy is of another version
+        try:
+            byte_range = parse_range(range_header, len(data))
+        except InvalidRangeError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(data)}"})
+        if byte_range is None:
+            return Response(content=data, media_type=IMAGE_CONTENT_TYPE, headers=headers)
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+        return Response(content=data[start:end + 1], status_code=206, media_type=IMAGE_CONTENT_TYPE, headers=headers)
+    except HTTPException:
+        raise
+    except ImageNotFoundError:
+        raise HTTPException(status_code=404, detail="Medication image not found")
+    except Exception as e:
+        logger.error(f"Get medication image error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ============= Prescription Routes =============
 
 @api_router.post("/prescriptions")
 async def add_prescription(request: AddMedicationRequest):
     """Add a prescription (medication to patient)"""
+    if not normalize(request.medication_name):
+        raise HTTPException(status_code=400, detail="Medication name must contain letters or digits")
     try:
         # Create or find medication
-        medication = await db.medications.find_one(
-            {"name": {"$regex": f"^{request.medication_name}$", "$options": "i"}}, {"_id": 0}
-        )
-        
-        description = request.description
-        if not medication:
-            # Create new medication entry
-            medication = Medication(
-                name=request.medication_name,
-                form="tablet",
-                description=description
-            )
-            await db.medications.insert_one(medication.dict())
-            medication_id = medication.id
-        else:
-            medication_id = medication["id"]
-            if not description:
-                description = medication.get("description", "")
+        medication = await resolve_medication(request.medication_name, request.description)
+        medication_id = medication["id"]
+        description = request.description or medication.get("description", "")
         
         # Create prescription
         prescription = Prescription(
@@ -521,50 +822,109 @@ async def add_prescription(request: AddMedicationRequest):
             current_stock=request.current_stock,
             total_per_refill=request.total_per_refill,
             with_food=request.with_food
-        )
+        ).model_dump()
         
-        await db.prescriptions.insert_one(prescription.dict())
+        await db.prescriptions.insert_one(dict(prescription))  # a copy: insert_one adds _id
+        if missed_dose_sweeper is not None:
+            missed_dose_sweeper.changed()
         
-        return {"success": True, "prescription": prescription.dict()}
+        return {"success": True, "prescription": prescription}
     except Exception as e:
         logger.error(f"Add prescription error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Keyset-paginated list routes: default and maximum page sizes
+PAGE_MAX = 200
+PRESCRIPTION_PAGE_DEFAULT = 100
+REMINDER_LOG_PAGE_DEFAULT = 50
+
 @api_router.get("/prescriptions/patient/{patient_id}")
-async def get_patient_prescriptions(patient_id: str):
-    """Get all prescriptions for a patient"""
+async def get_patient_prescriptions(
+    patient_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(PRESCRIPTION_PAGE_DEFAULT, ge=1, le=PAGE_MAX),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """Get a patient's prescriptions, oldest first
+
+    Pass the returned `next_cursor` back as `cursor` for the next page;
+    it is null on the last page. Description is left out unless `fields`
+    asks for it. Answers If-None-Match with 304 when no prescription on the
+    page was added, removed or changed.
+    """
     try:
-        prescriptions = await db.prescriptions.find({"patient_id": patient_id}, {"_id": 0}).to_list(100)
-        return {"success": True, "prescriptions": prescriptions}
+        page = await conditional_page(
+            db.prescriptions,
+            {"patient_id": patient_id},
+            PRESCRIPTION_FIELDS.projection(fields, list_view=True),
+            limit,
+            cursor,
+            request,
+            response,
+        )
+        if isinstance(page, Response):
+            return page
+        prescriptions, next_cursor = page
+        return {"success": True, "prescriptions": prescriptions, "next_cursor": next_cursor}
+    except (InvalidCursorError, InvalidFieldsError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Get prescriptions error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/prescriptions/{prescription_id}")
-async def get_prescription(prescription_id: str):
-    """Get a specific prescription"""
+async def get_prescription(
+    prescription_id: str, request: Request, response: Response, fields: Optional[str] = None
+):
+    """Get a specific prescription, optionally only the comma-separated `fields`
+
+    Answers If-None-Match with 304 when the prescription's revision is unchanged.
+    """
     try:
-        prescription = await db.prescriptions.find_one({"id": prescription_id}, {"_id": 0})
+        prescription = await conditional_find_one(
+            db.prescriptions, {"id": prescription_id}, PRESCRIPTION_FIELDS.projection(fields), request, response
+        )
+        if isinstance(prescription, Response):
+            return prescription
         if not prescription:
             raise HTTPException(status_code=404, detail="Prescription not found")
         return {"success": True, "prescription": prescription}
     except HTTPException:
         raise
+    except InvalidFieldsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Get prescription error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.put("/prescriptions/{prescription_id}/stock")
 async def update_stock(prescription_id: str, request: UpdateStockRequest):
-    """Update medication stock"""
+    """Update medication stock, either to an absolute level or by a relative adjustment"""
     try:
-        result = await db.prescriptions.update_one(
-            {"id": prescription_id},
-            {"$set": {"current_stock": request.new_stock}}
-        )
-        if result.modified_count == 0:
-            raise HTTPException(status_code=404, detail="Prescription not found")
-        return {"success": True, "message": "Stock updated"}
+        if (request.new_stock is None) == (request.adjustment is None):
+            raise HTTPException(status_code=400, detail="Provide exactly one of new_stock or adjustment")
+
+        if request.adjustment is not None:
+            current_stock = await adjust_stock(prescription_id, request.adjustment)
+            if current_stock is None:
+                exists = await db.prescriptions.find_one({"id": prescription_id}, {"_id": 0, "id": 1})
+                if not exists:
+                    raise HTTPException(status_code=404, detail="Prescription not found")
+                raise HTTPException(status_code=409, detail="Insufficient stock")
+        else:
+            updated = await db.prescriptions.find_one_and_update(
+                {"id": prescription_id},
+                {"$set": {"current_stock": request.new_stock}, "$inc": REVISION_BUMP},
+                projection={"_id": 0, "current_stock": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if not updated:
+                raise HTTPException(status_code=404, detail="Prescription not found")
+            current_stock = updated["current_stock"]
+
+        return {"success": True, "message": "Stock updated", "current_stock": current_stock}
     except HTTPException:
         raise
     except Exception as e:
@@ -578,6 +938,8 @@ async def delete_prescription(prescription_id: str):
         result = await db.prescriptions.delete_one({"id": prescription_id})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Prescription not found")
+        if missed_dose_sweeper is not None:
+            missed_dose_sweeper.changed()
         return {"success": True, "message": "Prescription deleted"}
     except HTTPException:
         raise
@@ -587,9 +949,14 @@ async def delete_prescription(prescription_id: str):
 
 # ============= Reminder Logs =============
 
+# Also the rollup counter names in adherence.py, so nothing else may reach a `$inc` key
+REMINDER_ACTIONS = {"took", "missed", "snoozed"}
+
 @api_router.post("/reminders/log")
 async def log_reminder_action(request: LogReminderRequest):
     """Log reminder action (took, missed, snoozed)"""
+    if request.action not in REMINDER_ACTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown action '{request.action}'")
     try:
         log = ReminderLog(
             prescription_id=request.prescription_id,
@@ -599,96 +966,340 @@ async def log_reminder_action(request: LogReminderRequest):
             action_at=datetime.utcnow(),
             with_food_confirmed=request.with_food_confirmed,
             note=request.note
-        )
+        ).model_dump()
         
-        await db.reminder_logs.insert_one(log.dict())
+        # Inserts get a copy: the driver adds _id to the document it writes
+        if reminder_log_writer is not None:
+            # Log and rollup are written with the rest of this batch
+            await reminder_log_writer.write(dict(log))
+        else:
+            await db.reminder_logs.insert_one(dict(log))
+            await record_reminder_action(db, log)
+            await retract_answered_misses([log])
         
         # Update stock if medication was taken
+        current_stock = None
         if request.action == "took":
-            prescription = await db.prescriptions.find_one({"id": request.prescription_id}, {"_id": 0})
-            if prescription and prescription["current_stock"] > 0:
-                new_stock = prescription["current_stock"] - 1
-                await db.prescriptions.update_one(
-                    {"id": request.prescription_id},
-                    {"$set": {"current_stock": new_stock}}
+            current_stock = await adjust_stock(request.prescription_id, -1)
+            if current_stock is None:
+                # Out of stock (or unknown prescription): report the level as-is
+                prescription = await db.prescriptions.find_one(
+                    {"id": request.prescription_id}, {"_id": 0, "current_stock": 1}
                 )
+                current_stock = prescription.get("current_stock") if prescription else None
         
-        return {"success": True, "log": log.dict()}
+        return {"success": True, "log": log, "current_stock": current_stock}
     except Exception as e:
         logger.error(f"Log reminder error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+REMINDER_BATCH_MAX = int(os.environ.get('REMINDER_BATCH_MAX', 500))
+
+@api_router.post("/reminders/log/batch")
+async def log_reminder_actions_batch(request: BatchLogReminderRequest):
+    """Log many reminder actions at once, e.g. when an offline phone reconnects
+
+    Costs a fixed handful of round trips regardless of batch size: one
+    unordered insert for the logs, one bulk write for the rollups, one for
+    stock and one read of the resulting stock levels. Each item gets a
+    status: `created`, `duplicate` (its `id` was already stored, so nothing
+    changed), `invalid` or `error`.
+    """
+    if len(request.items) > REMINDER_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {REMINDER_BATCH_MAX} items per batch")
+    try:
+        now = datetime.utcnow()
+        results = []
+        logs, positions = [], []
+        for index, item in enumerate(request.items):
+            if item.action not in REMINDER_ACTIONS:
+                results.append({
+                    "index": index, "id": item.id, "status": "invalid",
+                    "detail": f"Unknown action '{item.action}'"
+                })
+                continue
+            action_at = as_utc(item.action_at) or now
+            log = ReminderLog(
+                id=item.id or str(uuid.uuid4()),
+                prescription_id=item.prescription_id,
+                patient_id=item.patient_id,
+                scheduled_at=as_utc(item.scheduled_at) or action_at,
+                action=item.action,
+                action_at=action_at,
+                with_food_confirmed=item.with_food_confirmed,
+                note=item.note,
+                created_at=action_at  # bucket adherence under the day the dose was logged
+            )
+            results.append({"index": index, "id": log.id, "status": "created"})
+            logs.append(log.model_dump())
+            positions.append(index)
+        
+        write_errors = {}
+        if logs:
+            try:
+                await db.reminder_logs.insert_many(logs, ordered=False)
+            except BulkWriteError as e:
+                write_errors = {error["index"]: error for error in e.details.get("writeErrors", [])}
+        
+        inserted = []
+        for i, log in enumerate(logs):
+            error = write_errors.get(i)
+            if error is None:
+                inserted.append(log)
+            elif error.get("code") == 11000:
+                results[positions[i]]["status"] = "duplicate"
+            else:
+                results[positions[i]].update(status="error", detail=error.get("errmsg"))
+        
+        await record_new_reminder_logs(inserted)
+        current_stock = await consume_stock(
+            Counter(log["prescription_id"] for log in inserted if log["action"] == "took")
+        )
+        
+        return {
+            "success": True,
+            "results": results,
+            "summary": dict(Counter(result["status"] for result in results)),
+            "current_stock": current_stock
+        }
+    except Exception as e:
+        logger.error(f"Batch log reminder error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @api_router.get("/reminders/logs/patient/{patient_id}")
-async def get_reminder_logs(patient_id: str, days: int = 30):
-    """Get reminder logs for a patient"""
+async def get_reminder_logs(
+    patient_id: str,
+    days: int = 30,
+    limit: int = Query(REMINDER_LOG_PAGE_DEFAULT, ge=1, le=PAGE_MAX),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """Get a patient's reminder logs from the last `days` days, newest first
+
+    Pass the returned `next_cursor` back as `cursor` for the next page;
+    it is null on the last page.
+    """
     try:
         since = datetime.utcnow() - timedelta(days=days)
-        logs = await db.reminder_logs.find({
-            "patient_id": patient_id,
-            "created_at": {"$gte": since}
-        }, {"_id": 0}).sort("created_at", -1).to_list(1000)
-        
-        return {"success": True, "logs": logs}
+        logs, next_cursor = await fetch_page(
+            db.reminder_logs,
+            {"patient_id": patient_id, "created_at": {"$gte": since}},
+            REMINDER_LOG_FIELDS.projection(fields, list_view=True),
+            limit,
+            cursor,
+            descending=True,
+        )
+        return {"success": True, "logs": logs, "next_cursor": next_cursor}
+    except (InvalidCursorError, InvalidFieldsError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Get reminder logs error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Longest window the adherence stats cover: a year, leap day included
+ADHERENCE_MAX_DAYS = 366
+
 @api_router.get("/reminders/adherence/{patient_id}")
-async def get_adherence_stats(patient_id: str, days: int = 7):
-    """Get adherence statistics for a patient"""
+async def get_adherence_stats(patient_id: str, days: int = 7, windows: Optional[str] = None):
+    """Get adherence statistics for a patient
+
+    Reads the adherence_daily rollups. `windows` is an optional comma-separated
+    list of day counts (e.g. "7,30,90"); stats for every window come back from
+    the same aggregation round trip.
+    """
     try:
-        since = datetime.utcnow() - timedelta(days=days)
-        logs = await db.reminder_logs.find({
+        try:
+            window_days = sorted({int(w) for w in windows.split(",") if w.strip()}) if windows else []
+        except ValueError:
+            raise HTTPException(status_code=400, detail="windows must be comma-separated integers")
+        if any(not 0 < w <= ADHERENCE_MAX_DAYS for w in [days, *window_days]):
+            raise HTTPException(status_code=400, detail=f"days and windows must be between 1 and {ADHERENCE_MAX_DAYS}")
+
+        now = datetime.utcnow()
+        pipeline = build_adherence_pipeline(patient_id, now, days, window_days)
+        result = await db.adherence_daily.aggregate(pipeline).to_list(1)
+        facets = result[0] if result else {}
+
+        def window_stats(w: int) -> Dict[str, Any]:
+            rows = facets.get(f"w{w}", [])
+            return summarize_counts(rows[0] if rows else None)
+
+        response = {
+            "success": True,
+            "stats": window_stats(days),
+            "by_prescription": summarize_groups(facets.get("by_prescription", [])),
+            "by_day": summarize_groups(facets.get("by_day", [])),
+        }
+        if window_days:
+            response["windows"] = {str(w): window_stats(w) for w in window_days}
+        return response
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get adherence stats error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ============= Schedule =============
+
+SCHEDULE_PRESCRIPTION_FIELDS = {
+    "_id": 0, "id": 1, "medication_name": 1, "dosage": 1, "with_food": 1,
+    "schedule": 1, "start_date": 1, "end_date": 1
+}
+
+async def fetch_schedule_logs(patient_id: str, start: datetime, end: datetime) -> List[Dict]:
+    """Logs that may answer doses in [start, end), with scheduled_at as epoch
+    milliseconds so the join never builds Python datetimes"""
+    window = timedelta(minutes=MATCH_WINDOW_MINUTES)
+    return await db.reminder_logs.aggregate([
+        {"$match": {
             "patient_id": patient_id,
-            "created_at": {"$gte": since}
-        }, {"_id": 0}).to_list(1000)
-        
-        total = len(logs)
-        took = len([log for log in logs if log["action"] == "took"])
-        missed = len([log for log in logs if log["action"] == "missed"])
-        snoozed = len([log for log in logs if log["action"] == "snoozed"])
-        
-        adherence_rate = (took / total * 100) if total > 0 else 0
-        
+            "scheduled_at": {"$gte": start - window, "$lt": end + window},
+        }},
+        {"$project": {"_id": 0, "prescription_id": 1, "action": 1, "ms": {"$toLong": "$scheduled_at"}}},
+    ]).to_list(None)
+
+def dose_statuses(occurrences, logs: List[Dict], now: datetime):
+    """Join fetched logs onto expanded occurrences"""
+    ranks = match_logs(
+        occurrences,
+        [log["prescription_id"] for log in logs],
+        [log["ms"] // 60000 for log in logs],
+        [log["action"] for log in logs]
+    )
+    return occurrence_statuses(occurrences, ranks, now)
+
+@api_router.get("/schedule/{patient_id}")
+async def get_schedule(patient_id: str, from_: Optional[str] = Query(None, alias="from"),
+                       to: Optional[str] = None,
+                       tz_offset: Optional[int] = Query(None, ge=UTC_OFFSET_MIN, le=UTC_OFFSET_MAX)):
+    """Every dose due in a range, each marked taken, missed or pending
+
+    `from` and `to` are local dates (YYYY-MM-DD, both days included) or UTC
+    ISO datetimes (`to` exclusive); both default to today. `tz_offset`
+    overrides the patient's `utc_offset_minutes`. A dose is missed when a
+    missed log answers it or its grace period passed without a took log.
+    """
+    try:
+        patient = await db.patients.find_one({"id": patient_id}, {"_id": 0, "id": 1, "utc_offset_minutes": 1})
+        if not patient:
+            raise HTTPException(status_code=404, detail="Patient not found")
+        offset = tz_offset if tz_offset is not None else patient.get("utc_offset_minutes") or 0
+
+        now = datetime.utcnow()
+        today = (now + timedelta(minutes=offset)).strftime("%Y-%m-%d")
+        try:
+            start = parse_bound(from_ or today, offset, end=False)
+            end = parse_bound(to or from_ or today, offset, end=True)
+            prescriptions = await db.prescriptions.find(
+                {"patient_id": patient_id}, SCHEDULE_PRESCRIPTION_FIELDS
+            ).to_list(None)
+            occurrences = expand_schedules(prescriptions, start, end, offset)
+        except ScheduleRangeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        logs = await fetch_schedule_logs(patient_id, start, end)
+        statuses = dose_statuses(occurrences, logs, now)
+
         return {
             "success": True,
-            "stats": {
-                "total": total,
-                "took": took,
-                "missed": missed,
-                "snoozed": snoozed,
-                "adherence_rate": round(adherence_rate, 2)
-            }
+            "from": start,
+            "to": end,
+            "utc_offset_minutes": offset,
+            "summary": summarize_statuses(statuses),
+            "occurrences": schedule_entries(occurrences, statuses, prescriptions)
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Get adherence stats error: {str(e)}")
+        logger.error(f"Get schedule error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# ============= OCR Route =============
+# ============= Dashboard =============
 
-@api_router.post("/ocr/recognize")
-async def recognize_medicine(request: OCRRequest):
-    """Use OCR to recognize medicine from image"""
+LOW_STOCK_THRESHOLD = 10
+
+@api_router.get("/dashboard/{patient_id}")
+async def get_dashboard(patient_id: str,
+                        tz_offset: Optional[int] = Query(None, ge=UTC_OFFSET_MIN, le=UTC_OFFSET_MAX)):
+    """Everything the home screen needs in one round trip
+
+    Today's prescriptions (in the patient's local day) with each dose's
+    status and a low-stock flag, plus the 7-day adherence summary. All reads
+    run concurrently. `tz_offset` overrides the patient's `utc_offset_minutes`.
+    """
     try:
-        from emergentintegrations.llm.chat import LlmChat, UserMessage, ImageContent
-        
-        # Initialize LLM with vision capability
-        llm_key = os.environ.get('EMERGENT_LLM_KEY')
-        if not llm_key:
-            raise HTTPException(status_code=500, detail="LLM key not configured")
-        
-        chat = LlmChat(
-            api_key=llm_key,
-            session_id=f"ocr_{uuid.uuid4()}",
-            system_message="You are an expert at reading medicine labels and extracting information."
-        ).with_model("openai", "gpt-4o")
-        
-        # Create image content
-        image_content = ImageContent(image_base64=request.image_base64)
-        
-        # Query the LLM
-        message = UserMessage(
-            text="""Analyze this medicine image and extract the following information in JSON format:
+        now = datetime.utcnow()
+        # Wide enough to contain "today" at any UTC offset, so logs can be
+        # fetched before the patient's offset is known
+        span = timedelta(hours=38)
+        patient, prescriptions, logs, adherence = await asyncio.gather(
+            db.patients.find_one({"id": patient_id}, {"_id": 0, "id": 1, "utc_offset_minutes": 1}),
+            db.prescriptions.find(
+                {"patient_id": patient_id},
+                {**SCHEDULE_PRESCRIPTION_FIELDS, "frequency": 1, "description": 1,
+                 "expiry_date": 1, "current_stock": 1}
+            ).to_list(None),
+            fetch_schedule_logs(patient_id, now - span, now + span),
+            db.adherence_daily.aggregate(build_adherence_pipeline(patient_id, now, 7, [])).to_list(1),
+        )
+        if not patient:
+            raise HTTPException(status_code=404, detail="Patient not found")
+        offset = tz_offset if tz_offset is not None else patient.get("utc_offset_minutes") or 0
+
+        today = (now + timedelta(minutes=offset)).strftime("%Y-%m-%d")
+        start, end = parse_bound(today, offset, end=False), parse_bound(today, offset, end=True)
+        occurrences = expand_schedules(prescriptions, start, end, offset)
+        statuses = dose_statuses(occurrences, logs, now)
+
+        doses: Dict[str, List[Dict]] = {}
+        for entry in schedule_entries(occurrences, statuses, prescriptions):
+            doses.setdefault(entry["prescription_id"], []).append(
+                {"scheduled_at": entry["scheduled_at"], "status": entry["status"]}
+            )
+        # Prescriptions without parseable times can't be scheduled; keep showing them
+        todays = [
+            p for p in prescriptions
+            if p["id"] in doses or p["id"] not in occurrences.prescription_ids
+        ]
+
+        facets = adherence[0] if adherence else {}
+        week = facets.get("w7", [])
+        return {
+            "success": True,
+            "date": today,
+            "utc_offset_minutes": offset,
+            "patient_utc_offset_minutes": patient.get("utc_offset_minutes"),  # as stored; None if never reported
+            "prescriptions": [
+                {
+                    "id": p["id"],
+                    "medication_name": p.get("medication_name"),
+                    "dosage": p.get("dosage"),
+                    "frequency": p.get("frequency"),
+                    "description": p.get("description"),
+                    "times": (p.get("schedule") or {}).get("times", []),
+                    "with_food": p.get("with_food", False),
+                    "expiry_date": p.get("expiry_date"),
+                    "current_stock": p.get("current_stock"),
+                    "low_stock": (p.get("current_stock") or 0) < LOW_STOCK_THRESHOLD,
+                    "doses": doses.get(p["id"], []),
+                }
+                for p in todays
+            ],
+            "adherence": summarize_counts(week[0] if week else None)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get dashboard error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ============= OCR Route =============
+
+OCR_MODEL = "gpt-4o"
+
+OCR_SYSTEM_MESSAGE = "You are an expert at reading medicine labels and extracting information."
+
+OCR_PROMPT = """Analyze this medicine image and extract the following information in JSON format:
             {
                 "medicine_name": "extracted name",
                 "strength": "dosage like 500mg",
@@ -696,14 +1307,38 @@ async def recognize_medicine(request: OCRRequest):
                 "manufacturer": "company name if visible",
                 "confidence": 0.0-1.0
             }
-            Only respond with valid JSON. If you cannot read the label clearly, set confidence to 0.""",
-            file_contents=[image_content]
-        )
+            Only respond with valid JSON. If you cannot read the label clearly, set confidence to 0."""
+
+@api_router.post("/ocr/recognize")
+async def recognize_medicine(request: OCRRequest):
+    """Use OCR to recognize medicine from image"""
+    try:
+        # Shrink and re-encode the photo off the event loop before upload
+        try:
+            preprocessed = await image_preprocessor.run(request.image_base64)
+        except InvalidImageError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        response = await chat.send_message(message)
+        # Near-duplicate of a recent scan: reuse its result
+        phash = int(preprocessed.phash, 16)
+        cached = await ocr_cache.get(db, phash)
+        if cached is not None:
+            return {
+                "success": True,
+                **cached,
+                "preprocessing": preprocessed.model_dump(exclude={"image_base64"}),
+                "cached": True
+            }
+        
+        # Query the LLM; identical concurrent scans share one upstream call
+        response = await llm_flight.do(
+            fingerprint("ocr", OCR_MODEL, OCR_SYSTEM_MESSAGE, OCR_PROMPT, preprocessed.image_base64),
+            lambda: llm_gateway.complete(
+                OCR_MODEL, OCR_SYSTEM_MESSAGE, OCR_PROMPT, image_base64=preprocessed.image_base64
+            )
+        )
         
         # Parse response
-        import json
         try:
             extracted = json.loads(response)
         except:
@@ -717,9 +1352,7 @@ async def recognize_medicine(request: OCRRequest):
         # Search for matching medications in database
         candidates = []
         if extracted.get("medicine_name") and extracted.get("medicine_name") != "Unknown":
-            meds = await db.medications.find({
-                "name": {"$regex": extracted["medicine_name"], "$options": "i"}
-            }, {"_id": 0}).limit(3).to_list(3)
+            meds = medication_index.search(extracted["medicine_name"], limit=3)
             
             candidates = [
                 {
@@ -733,90 +1366,200 @@ async def recognize_medicine(request: OCRRequest):
                 for med in meds
             ]
         
+        if extracted.get("confidence", 0) > 0:
+            await ocr_cache.put(db, phash, {"extracted": extracted, "candidates": candidates})
+        
         return {
             "success": True,
             "extracted": extracted,
-            "candidates": candidates
+            "candidates": candidates,
+            "preprocessing": preprocessed.model_dump(exclude={"image_base64"})
         }
     
+    except HTTPException:
+        raise
+    except (LLMUnavailableError, LLMTimeoutError) as e:
+        logger.warning(f"OCR recognition unavailable: {str(e)}")
+        raise llm_http_error(e)
     except Exception as e:
         logger.error(f"OCR recognition error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # ============= AI Assistant Route =============
 
+AI_MODEL = "gpt-4o-mini"
+
+AI_SYSTEM_MESSAGE = "You are a helpful medical information assistant. Always provide information in simple, clear language suitable for elderly patients. Always add a disclaimer that patients should consult their doctor."
+
+AI_DISCLAIMER = "\n\n⚠️ This is informational only. Always follow your doctor's prescription and consult them for medical advice."
+
+# Canned prompts are deterministic per medication and therefore cacheable
+AI_PROMPTS = {
+    "summary": "Explain {med_name} ({generic_label}) in simple language suitable for elderly patients. Include: 1) What it's used for, 2) Common dosage, 3) Important warnings. Keep it to 3-4 short bullet points.",
+    "interactions": "What are common drug interactions with {med_name}? Also mention food interactions. Keep it brief and simple.",
+    "dosage": "What is the typical dosage for {med_name}? Explain in simple terms for elderly patients.",
+    "side_effects": "What are the common side effects of {med_name}? List only the most important ones in simple language.",
+}
+
+class ExplainContext(BaseModel):
+    med_name: str
+    generic_name: str = ""
+    query: str
+    medication_key: Optional[str] = None  # set only for cacheable query types
+    cache_key: Optional[str] = None
+    query_hash: Optional[str] = None
+
+    def medication_payload(self) -> Dict[str, str]:
+        return {"name": self.med_name, "generic_name": self.generic_name}
+
+async def build_explain_context(request: AIQuery) -> Optional[ExplainContext]:
+    """Resolve the medication and build the prompt; None if no medication was given"""
+    # Get medication name
+    med_name = request.medication_name or ""
+    generic_name = ""
+    medication = None
+    
+    # Try to get from database first
+    if request.medication_id:
+        medication = await db.medications.find_one({"id": request.medication_id}, {"_id": 0})
+        if medication:
+            med_name = medication["name"]
+            generic_name = medication.get("generic_name", "")
+    elif normalize(request.medication_name):
+        medication = await db.medications.find_one(
+            {"name_normalized": normalize(request.medication_name)}, {"_id": 0}
+        )
+        if medication:
+            generic_name = medication.get("generic_name", "")
+    
+    if not med_name:
+        return None
+    
+    # Prepare query based on type
+    template = AI_PROMPTS.get(request.query_type)
+    if not template:
+        query = request.custom_query or f"Tell me about {med_name}"
+        return ExplainContext(med_name=med_name, generic_name=generic_name or "", query=query)
+    
+    query = template.format(med_name=med_name, generic_label=generic_name or "medication")
+    if medication:
+        medication_key = medication["id"]
+    elif normalize(med_name):
+        medication_key = f"name:{normalize(med_name)}"
+    else:
+        # Nothing to key the cache on: a shared "name:" entry would answer for every such name
+        return ExplainContext(med_name=med_name, generic_name=generic_name or "", query=query)
+    return ExplainContext(
+        med_name=med_name,
+        generic_name=generic_name or "",
+        query=query,
+        medication_key=medication_key,
+        cache_key=explanation_cache.key(medication_key, request.query_type, request.language),
+        query_hash=prompt_hash(AI_SYSTEM_MESSAGE, query)
+    )
+
 @api_router.post("/ai/explain")
 async def explain_medicine(request: AIQuery):
     """AI explanation of medicine"""
     try:
-        from emergentintegrations.llm.chat import LlmChat, UserMessage
-        
-        llm_key = os.environ.get('EMERGENT_LLM_KEY')
-        if not llm_key:
-            raise HTTPException(status_code=500, detail="LLM key not configured")
-        
-        # Get medication name
-        med_name = request.medication_name or ""
-        generic_name = ""
-        
-        # Try to get from database first
-        if request.medication_id:
-            medication = await db.medications.find_one({"id": request.medication_id}, {"_id": 0})
-            if medication:
-                med_name = medication["name"]
-                generic_name = medication.get("generic_name", "")
-        elif request.medication_name:
-            medication = await db.medications.find_one({
-                "name": {"$regex": f"^{request.medication_name}$", "$options": "i"}
-            }, {"_id": 0})
-            if medication:
-                generic_name = medication.get("generic_name", "")
-        
-        # Build context
-        if not med_name:
+        context = await build_explain_context(request)
+        if context is None:
             return {
                 "success": False,
                 "message": "Please provide a medication name"
             }
         
-        # Prepare query based on type
-        if request.query_type == "summary":
-            query = f"Explain {med_name} ({generic_name if generic_name else 'medication'}) in simple language suitable for elderly patients. Include: 1) What it's used for, 2) Common dosage, 3) Important warnings. Keep it to 3-4 short bullet points."
-        elif request.query_type == "interactions":
-            query = f"What are common drug interactions with {med_name}? Also mention food interactions. Keep it brief and simple."
-        elif request.query_type == "dosage":
-            query = f"What is the typical dosage for {med_name}? Explain in simple terms for elderly patients."
-        elif request.query_type == "side_effects":
-            query = f"What are the common side effects of {med_name}? List only the most important ones in simple language."
-        else:
-            query = request.custom_query or f"Tell me about {med_name}"
+        # Canned query types are served from the explanation cache when possible
+        if context.cache_key:
+            response = await explanation_cache.get(db, context.cache_key, context.query_hash)
+            if response is not None:
+                return {
+                    "success": True,
+                    "explanation": response + AI_DISCLAIMER,
+                    "medication": context.medication_payload(),
+                    "cached": True
+                }
         
         # Query LLM
-        chat = LlmChat(
-            api_key=llm_key,
-            session_id=f"ai_{uuid.uuid4()}",
-            system_message="You are a helpful medical information assistant. Always provide information in simple, clear language suitable for elderly patients. Always add a disclaimer that patients should consult their doctor."
-        ).with_model("openai", "gpt-4o-mini")
-        
-        message = UserMessage(text=query)
-        response = await chat.send_message(message)
+        async def explain() -> str:
+            text = await llm_gateway.complete(AI_MODEL, AI_SYSTEM_MESSAGE, context.query)
+            if context.cache_key:
+                await explanation_cache.put(
+                    db, context.cache_key, context.medication_key, context.query_hash, text
+                )
+            return text
         
-        # Add disclaimer
-        disclaimer = "\n\n⚠️ This is informational only. Always follow your doctor's prescription and consult them for medical advice."
+        # Concurrent identical questions share one upstream call
+        response = await llm_flight.do(
+            fingerprint("explain", AI_MODEL, AI_SYSTEM_MESSAGE, context.query), explain
+        )
         
         return {
             "success": True,
-            "explanation": response + disclaimer,
-            "medication": {
-                "name": med_name,
-                "generic_name": generic_name
-            }
+            "explanation": response + AI_DISCLAIMER,
+            "medication": context.medication_payload()
         }
     
+    except HTTPException:
+        raise
+    except (LLMUnavailableError, LLMTimeoutError) as e:
+        logger.warning(f"AI explain unavailable: {str(e)}")
+        raise llm_http_error(e)
     except Exception as e:
         logger.error(f"AI explain error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@api_router.post("/ai/explain/stream")
+async def explain_medicine_stream(request: AIQuery):
+    """AI explanation of medicine, streamed as Server-Sent Events
+
+    Events: `meta` (medication, cached), one `token` per chunk, `disclaimer`,
+    then `done`; `error` replaces the remainder if generation fails.
+
+    Tokens only trickle in with a streaming provider (LLM_PROVIDER=litellm).
+    The default Emergent provider returns whole completions, so there the
+    explanation arrives as one `token` event and time to first token is no
+    better than /ai/explain.
+    """
+    context = await build_explain_context(request)
+    if context is None:
+        raise HTTPException(status_code=400, detail="Please provide a medication name")
+    
+    cached = None
+    if context.cache_key:
+        cached = await explanation_cache.get(db, context.cache_key, context.query_hash)
+    
+    async def events():
+        yield sse_event("meta", {"medication": context.medication_payload(), "cached": cached is not None})
+        if cached is not None:
+            yield sse_event("token", {"text": cached})
+        else:
+            chunks = []
+            try:
+                async for chunk in llm_gateway.stream(AI_MODEL, AI_SYSTEM_MESSAGE, context.query):
+                    chunks.append(chunk)
+                    yield sse_event("token", {"text": chunk})
+            except Exception as e:
+                logger.error(f"AI explain stream error: {str(e)}")
+                yield sse_event("error", {"detail": str(e)})
+                return
+            if context.cache_key:
+                await explanation_cache.put(
+                    db, context.cache_key, context.medication_key, context.query_hash, "".join(chunks)
+                )
+        yield sse_event("disclaimer", {"text": AI_DISCLAIMER})
+        yield sse_event("done", {})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ============= Health Check =============
 
 @api_router.get("/health")
@@ -828,6 +1571,22 @@ async def health_check():
         "version": "1.0.0"
     }
 
+@api_router.get("/metrics")
+async def get_metrics():
+    """In-process cache and performance counters"""
+    return {
+        "success": True,
+        "ocr_cache": ocr_cache.stats(),
+        "ai_explanation_cache": explanation_cache.stats(),
+        "llm_single_flight": llm_flight.stats(),
+        "llm_gateway": llm_gateway.stats(),
+        "medication_images": medication_images.stats(),
+        "response_compression": response_compressor.stats(),
+        "auth_tokens": token_service.stats(),
+        "reminder_group_commit": reminder_log_writer.stats() if reminder_log_writer else None,
+        "missed_dose_sweeper": missed_dose_sweeper.stats() if missed_dose_sweeper else None
+    }
+
 # Include the router
 app.include_router(api_router)
 
@@ -840,13 +1599,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Negotiated br/zstd/gzip for bodies above RESPONSE_COMPRESSION_MIN_BYTES
+app.add_middleware(CompressionMiddleware, compressor=response_compressor)
+
 # Startup event
 @app.on_event("startup")
 async def startup_event():
-    """Seed database on startup"""
+    """Ensure indexes, migrate and seed database on startup"""
+    await llm_gateway.start()
+    if reminder_log_writer is not None:
+        reminder_log_writer.start()
+    await run_pre_index_migrations(db)
+    await ensure_indexes(db)
+    await run_migrations(db)
+    await token_service.start(db)
+    if os.environ.get('VERIFY_QUERY_PLANS', '').lower() in ('1', 'true', 'yes'):
+        await verify_query_plans(db)
     await seed_medicine_database()
+    await medication_index.load(db)
+    if missed_dose_sweeper is not None:
+        await missed_dose_sweeper.start()
     logger.info("MediMinder API started successfully")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    image_preprocessor.shutdown()
+    medication_images.shutdown()
+    response_compressor.shutdown()
+    await token_service.close()
+    if missed_dose_sweeper is not None:
+        await missed_dose_sweeper.close()
+    await llm_gateway.close()
+    if reminder_log_writer is not None:
+        await reminder_log_writer.close()
     client.close()
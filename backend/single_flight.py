@@ -0,0 +1,80 @@
+"""
+Single-flight request coalescing.
+
+Concurrent callers asking for the same key share one in-flight execution:
+the first caller starts it, later callers await the same task, and every
+caller receives the same result or exception. Once the task settles the
+key is forgotten, so later calls start a fresh execution (caching is a
+separate concern, see ai_cache and ocr_cache).
+
+The shared work runs in its own task. A caller that disconnects or is
+cancelled therefore doesn't cancel it for the others.
+"""
+
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable key for a request built from its prompt-defining parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """Collapse concurrent identical async calls into one execution"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self.calls = 0
+        self.executions = 0
+        self.collapsed = 0
+        self.max_waiters = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn() unless an identical call is already in flight, then share its outcome"""
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda t, k=key: self._settle(k, t))
+        else:
+            self.collapsed += 1
+            self._waiters[key] += 1
+            self.max_waiters = max(self.max_waiters, self._waiters[key])
+        return await asyncio.shield(task)
+
+    def _settle(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        self._waiters.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            # Retrieved here so it isn't reported as unhandled when every caller went away
+            logger.debug(f"{self.name} single-flight {key[:12]} failed: {task.exception()}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "collapsed": self.collapsed,
+            "collapse_ratio": round(self.collapsed / self.calls, 4) if self.calls else 0.0,
+            "in_flight": len(self._inflight),
+            "waiters_in_flight": sum(self._waiters.values()),
+            "max_waiters": self.max_waiters,
+        }
+
+
+llm_flight = SingleFlight("llm")
@@ -5,7 +5,6 @@ import { SafeAreaView } from 'react-native-safe-area-context';
 import { Ionicons } from '@expo/vector-icons';
 import { useAuth } from '../contexts/AuthContext';
 import { useTheme } from '../contexts/ThemeContext';
-import { format } from 'date-fns';
 
 const BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
 
@@ -22,12 +21,22 @@ export default function Home() {
   const loadData = useCallback(async () => {
     if (!patient?.id) return;
     try {
-      const presResponse = await fetch(`${BACKEND_URL}/api/prescriptions/patient/${patient.id}`);
-      const presData = await presResponse.json();
-      if (presData.success) setPrescriptions(presData.prescriptions || []);
-      const adhResponse = await fetch(`${BACKEND_URL}/api/reminders/adherence/${patient.id}?days=7`);
-      const adhData = await adhResponse.json();
-      if (adhData.success) setAdherenceStats(adhData.stats);
+      // Today's prescriptions and weekly adherence in one round trip
+      const tzOffset = -new Date().getTimezoneOffset();
+      const response = await fetch(`${BACKEND_URL}/api/dashboard/${patient.id}?tz_offset=${tzOffset}`);
+      const data = await response.json();
+      if (data.success) {
+        setPrescriptions(data.prescriptions || []);
+        setAdherenceStats(data.adherence);
+        // Keep the server's copy current so missed doses are judged on this clock
+        if (data.patient_utc_offset_minutes !== tzOffset) {
+          fetch(`${BACKEND_URL}/api/patients/${patient.id}`, {
+            method: 'PUT',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ utc_offset_minutes: tzOffset }),
+          }).catch((error) => console.error('Update time zone error:', error));
+        }
+      }
     } catch (error) {
       console.error('Load data error:', error);
     }
@@ -62,12 +71,7 @@ export default function Home() {
     } catch (error) { console.error('Log action error:', error); }
   };
 
-  const getTodaysMedications = () => {
-    const today = format(new Date(), 'EEE');
-    return prescriptions.filter((p) => { const days = p.schedule?.days || []; return days.length === 0 || days.includes(today); });
-  };
-
-  const todaysMedications = getTodaysMedications();
+  const todaysMedications = prescriptions;
   const styles = createStyles(colors);
 
   return (
@@ -113,7 +117,7 @@ export default function Home() {
                     <Text style={styles.medicationName}>{prescription.medication_name}</Text>
                     <Text style={styles.medicationDosage}>{prescription.dosage} - {prescription.frequency}</Text>
                     {prescription.description && <Text style={styles.medicationDescription}>{prescription.description}</Text>}
-                    {prescription.schedule?.times && <Text style={styles.medicationTime}>{prescription.schedule.times.join(', ')}</Text>}
+                    {prescription.times?.length > 0 && <Text style={styles.medicationTime}>{prescription.times.join(', ')}</Text>}
                     {prescription.expiry_date && <Text style={styles.expiryDate}>Expires: {prescription.expiry_date}</Text>}
                   </View>
                 </View>
@@ -130,7 +134,7 @@ export default function Home() {
                 {prescription.current_stock !== undefined && (
                   <View style={styles.stockInfo}>
                     <Text style={styles.stockText}>Stock: {prescription.current_stock} remaining</Text>
-                    {prescription.current_stock < 10 && <Text style={styles.lowStockWarning}>Low stock!</Text>}
+                    {prescription.low_stock && <Text style={styles.lowStockWarning}>Low stock!</Text>}
                   </View>
                 )}
               </View>
@@ -25,13 +25,20 @@ export default function Medications() {
     if (!patient?.id) return;
 
     try {
-      const response = await fetch(
-        `${BACKEND_URL}/api/prescriptions/patient/${patient.id}`
-      );
-      const data = await response.json();
-      if (data.success) {
-        setPrescriptions(data.prescriptions || []);
-      }
+      // Follow the cursor so long-term patients see every prescription
+      const all: any[] = [];
+      let cursor: string | null = null;
+      do {
+        const query: string = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const response = await fetch(
+          `${BACKEND_URL}/api/prescriptions/patient/${patient.id}${query}`
+        );
+        const data = await response.json();
+        if (!data.success) return;
+        all.push(...(data.prescriptions || []));
+        cursor = data.next_cursor || null;
+      } while (cursor);
+      setPrescriptions(all);
     } catch (error) {
       console.error('Load prescriptions error:', error);
     }
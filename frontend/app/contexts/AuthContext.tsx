@@ -76,6 +76,13 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
   };
 
   const logout = async () => {
+    if (token) {
+      // Revoke server-side; local sign-out proceeds even if this fails
+      fetch(`${process.env.EXPO_PUBLIC_BACKEND_URL}/api/auth/logout`, {
+        method: 'POST',
+        headers: { Authorization: `Bearer ${token}` },
+      }).catch((error) => console.error('Logout error:', error));
+    }
     setUser(null);
     setToken(null);
     setPatientState(null);
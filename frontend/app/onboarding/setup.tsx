@@ -46,6 +46,7 @@ export default function Setup() {
             ? { name: emergencyName, phone: emergencyPhone }
             : null,
           preferred_language: 'en',
+          utc_offset_minutes: -new Date().getTimezoneOffset(),
         }),
       });
 
@@ -6,6 +6,7 @@ import {
   ScrollView,
   TouchableOpacity,
   RefreshControl,
+  ActivityIndicator,
 } from 'react-native';
 import { useRouter } from 'expo-router';
 import { SafeAreaView } from 'react-native-safe-area-context';
@@ -15,30 +16,64 @@ import { useTheme } from '../contexts/ThemeContext';
 import { format } from 'date-fns';
 
 const BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
+const PAGE_SIZE = 50;
 
 export default function MedicationHistory() {
   const { patient } = useAuth();
   const { colors } = useTheme();
   const [logs, setLogs] = useState<any[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [refreshing, setRefreshing] = useState(false);
   const router = useRouter();
 
+  const fetchPage = async (cursor: string | null) => {
+    const params = new URLSearchParams({ days: '30', limit: String(PAGE_SIZE) });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(
+      `${BACKEND_URL}/api/reminders/logs/patient/${patient!.id}?${params}`
+    );
+    return response.json();
+  };
+
   const loadHistory = async () => {
     if (!patient?.id) return;
 
     try {
-      const response = await fetch(
-        `${BACKEND_URL}/api/reminders/logs/patient/${patient.id}?days=30`
-      );
-      const data = await response.json();
+      const data = await fetchPage(null);
       if (data.success) {
         setLogs(data.logs || []);
+        setNextCursor(data.next_cursor || null);
       }
     } catch (error) {
       console.error('Load history error:', error);
     }
   };
 
+  const loadMore = async () => {
+    if (!patient?.id || !nextCursor || loadingMore) return;
+
+    setLoadingMore(true);
+    try {
+      const data = await fetchPage(nextCursor);
+      if (data.success) {
+        setLogs((current) => [...current, ...(data.logs || [])]);
+        setNextCursor(data.next_cursor || null);
+      }
+    } catch (error) {
+      console.error('Load more history error:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const onScroll = ({ nativeEvent }: any) => {
+    const { layoutMeasurement, contentOffset, contentSize } = nativeEvent;
+    if (layoutMeasurement.height + contentOffset.y >= contentSize.height - 200) {
+      loadMore();
+    }
+  };
+
   useEffect(() => {
     loadHistory();
   }, [patient?.id]);
@@ -84,6 +119,8 @@ export default function MedicationHistory() {
 
       <ScrollView
         contentContainerStyle={styles.content}
+        onScroll={onScroll}
+        scrollEventThrottle={200}
         refreshControl={
           <RefreshControl refreshing={refreshing} onRefresh={onRefresh} />
         }
@@ -145,6 +182,9 @@ export default function MedicationHistory() {
             );
           })
         )}
+        {loadingMore && (
+          <ActivityIndicator style={styles.loadingMore} color={colors.primary} />
+        )}
       </ScrollView>
     </SafeAreaView>
   );
@@ -248,6 +288,9 @@ const createStyles = (colors: any) =>
       fontSize: 14,
       color: colors.textSecondary,
     },
+    loadingMore: {
+      paddingVertical: 16,
+    },
     logNote: {
       fontSize: 14,
       color: colors.text,
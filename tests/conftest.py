@@ -0,0 +1,420 @@
+import copy
+import itertools
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+# backend modules import each other flat, as uvicorn runs them from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne  # noqa: E402
+from pymongo.errors import BulkWriteError, DuplicateKeyError  # noqa: E402
+
+# ============= Fake Motor collections =============
+#
+# In-memory stand-ins for the Motor calls the backend makes. Queries support
+# equality (array fields match on any element), $eq/$ne/$in/$nin/$gt/$gte/
+# $lt/$lte/$exists/$type/$not and $and/$or; updates support $set, $unset,
+# $inc, $max, $setOnInsert and update pipelines built from field paths, $add,
+# $subtract, $max, $min, $ifNull and $literal. aggregate() is a stub that
+# returns `aggregate_result` (a list, or a function of the pipeline).
+
+_MISSING = object()
+_TYPES = {"string": str, "null": type(None), "array": list, "object": dict, "bool": bool, "int": int}
+
+
+def get_path(doc, path, default=_MISSING):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return default
+        value = value[part]
+    return value
+
+
+def set_path(doc, path, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def unset_path(doc, path):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part, {})
+    doc.pop(last, None)
+
+
+def _compare(value, op, operand):
+    if op == "$eq":
+        return value == operand
+    if op == "$ne":
+        return value != operand
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    if value is _MISSING or value is None:
+        return False
+    try:
+        return {"$gt": value > operand, "$gte": value >= operand,
+                "$lt": value < operand, "$lte": value <= operand}[op]
+    except TypeError:
+        return False
+
+
+def _matches_condition(value, condition):
+    if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+        for op, operand in condition.items():
+            if op == "$exists":
+                if (value is not _MISSING) != bool(operand):
+                    return False
+            elif op == "$type":
+                if value is _MISSING or not isinstance(value, _TYPES[operand]):
+                    return False
+            elif op == "$not":
+                if _matches_condition(value, operand):
+                    return False
+            elif op in ("$ne", "$nin"):
+                values = value if isinstance(value, list) else [value]
+                if not all(_compare(v, op, operand) for v in values):
+                    return False
+            else:
+                values = value if isinstance(value, list) else [value]
+                if not any(_compare(v, op, operand) for v in values):
+                    return False
+        return True
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return (None if value is _MISSING else value) == condition
+
+
+def matches(doc, query):
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif not _matches_condition(get_path(doc, key), condition):
+            return False
+    return True
+
+
+def project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v == 1 and k != "_id"}
+    if include:
+        out = {k: copy.deepcopy(doc[k]) for k in include if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    return {k: copy.deepcopy(v) for k, v in doc.items() if projection.get(k, 1) != 0}
+
+
+def evaluate(doc, expression):
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = get_path(doc, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, list):
+        return [evaluate(doc, e) for e in expression]
+    if isinstance(expression, dict) and len(expression) == 1:
+        (op, args), = expression.items()
+        if op == "$literal":
+            return args
+        values = evaluate(doc, args)
+        if op == "$add":
+            return sum(values)
+        if op == "$subtract":
+            return values[0] - values[1]
+        if op == "$max":
+            return max(values)
+        if op == "$min":
+            return min(values)
+        if op == "$ifNull":
+            return next((v for v in values if v is not None), None)
+    return expression
+
+
+def apply_update(doc, update, inserting=False):
+    if isinstance(update, list):
+        for stage in update:
+            for path, expression in stage.get("$set", {}).items():
+                set_path(doc, path, evaluate(doc, expression))
+            for path in stage.get("$unset", []):
+                unset_path(doc, path)
+        return
+    for path, value in update.get("$set", {}).items():
+        set_path(doc, path, copy.deepcopy(value))
+    if inserting:
+        for path, value in update.get("$setOnInsert", {}).items():
+            set_path(doc, path, copy.deepcopy(value))
+    for path, value in update.get("$inc", {}).items():
+        current = get_path(doc, path, 0)
+        set_path(doc, path, current + value)
+    for path, value in update.get("$max", {}).items():
+        current = get_path(doc, path, None)
+        set_path(doc, path, value if current is None else max(current, value))
+    for path in update.get("$unset", {}):
+        unset_path(doc, path)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def sort(self, key_or_list, direction=None):
+        spec = [(key_or_list, direction or 1)] if isinstance(key_or_list, str) else list(key_or_list)
+        for field, order in reversed(spec):
+            self.docs.sort(key=lambda d: (get_path(d, field, None) is not None, get_path(d, field, None)),
+                           reverse=order < 0)
+        return self
+
+    def skip(self, n):
+        self.docs = self.docs[n:]
+        return self
+
+    def limit(self, n):
+        if n:
+            self.docs = self.docs[:n]
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs[:length] if length else list(self.docs)
+
+    async def __aiter__(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    """One in-memory collection; `unique` lists the fields with a unique index"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, docs=(), unique=("id",), aggregate_result=()):
+        self.docs = [copy.deepcopy(d) for d in docs]
+        self.unique = unique
+        self.aggregate_result = aggregate_result
+        self.pipelines = []
+        self.bulk_writes = []
+        self.indexes = {"_id_": {"key": [("_id", 1)]}}
+        for doc in self.docs:
+            doc.setdefault("_id", next(self._ids))
+
+    def with_options(self, **kwargs):
+        return self
+
+    # ============= Reads =============
+
+    def _find(self, query):
+        return [d for d in self.docs if matches(d, query)]
+
+    def find(self, query=None, projection=None, sort=None, limit=0):
+        cursor = FakeCursor(project(d, projection) for d in self._find(query))
+        if sort:
+            cursor.sort(sort)
+        return cursor.limit(limit)
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        docs = self.find(query, projection, sort=sort).docs
+        return docs[0] if docs else None
+
+    async def count_documents(self, query):
+        return len(self._find(query))
+
+    def aggregate(self, pipeline, **kwargs):
+        self.pipelines.append(pipeline)
+        result = self.aggregate_result
+        return FakeCursor(result(pipeline) if callable(result) else copy.deepcopy(list(result)))
+
+    # ============= Writes =============
+
+    def _check_unique(self, doc, ignore=None):
+        for field in ("_id", *self.unique):
+            value = doc.get(field, _MISSING)
+            if value is _MISSING:
+                continue
+            if any(d is not ignore and d.get(field, _MISSING) == value for d in self.docs):
+                raise DuplicateKeyError(f"E11000 duplicate key error {field}: {value!r}", 11000)
+
+    def _insert(self, doc):
+        doc.setdefault("_id", next(self._ids))  # like the driver, on the caller's dict
+        stored = copy.deepcopy(doc)
+        self._check_unique(stored)
+        self.docs.append(stored)
+        return stored
+
+    def _update(self, query, update, upsert=False, many=False):
+        targets = self._find(query)
+        if not many:
+            targets = targets[:1]
+        for doc in targets:
+            before = copy.deepcopy(doc)
+            apply_update(doc, update)
+            try:
+                self._check_unique(doc, ignore=doc)
+            except DuplicateKeyError:
+                doc.clear()
+                doc.update(before)
+                raise
+        modified = sum(1 for _ in targets)
+        if targets or not upsert:
+            return SimpleNamespace(matched_count=len(targets), modified_count=modified, upserted_id=None), targets
+        doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+        apply_update(doc, update, inserting=True)
+        stored = self._insert(doc)
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=stored["_id"]), [stored]
+
+    async def insert_one(self, doc):
+        return SimpleNamespace(inserted_id=self._insert(doc)["_id"])
+
+    async def insert_many(self, docs, ordered=True):
+        errors = []
+        for index, doc in enumerate(docs):
+            try:
+                self._insert(doc)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    async def update_one(self, query, update, upsert=False):
+        return self._update(query, update, upsert)[0]
+
+    async def update_many(self, query, update, upsert=False):
+        return self._update(query, update, upsert, many=True)[0]
+
+    async def replace_one(self, query, replacement, upsert=False):
+        targets = self._find(query)[:1]
+        for doc in targets:
+            _id = doc["_id"]
+            doc.clear()
+            doc.update(copy.deepcopy(replacement), _id=_id)
+        if not targets and upsert:
+            self._insert(dict(replacement))
+        return SimpleNamespace(matched_count=len(targets), modified_count=len(targets))
+
+    async def find_one_and_update(self, query, update, projection=None, sort=None, upsert=False,
+                                  return_document=False):
+        candidates = FakeCursor(self._find(query))
+        if sort:
+            candidates.sort(sort)
+        if not candidates.docs and not upsert:
+            return None
+        before = copy.deepcopy(candidates.docs[0]) if candidates.docs else None
+        query = {"_id": candidates.docs[0]["_id"]} if candidates.docs else query
+        _, (doc,) = self._update(query, update, upsert)
+        if not return_document and before is None:
+            return None
+        return project(doc if return_document else before, projection)
+
+    async def find_one_and_delete(self, query, projection=None, sort=None):
+        candidates = FakeCursor(self._find(query))
+        if sort:
+            candidates.sort(sort)
+        if not candidates.docs:
+            return None
+        doc = candidates.docs[0]
+        self.docs.remove(doc)
+        return project(doc, projection)
+
+    async def delete_one(self, query):
+        targets = self._find(query)[:1]
+        for doc in targets:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=len(targets))
+
+    async def delete_many(self, query):
+        targets = self._find(query)
+        for doc in targets:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=len(targets))
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_writes.append(operations)
+        errors = []
+        for index, op in enumerate(operations):
+            try:
+                if isinstance(op, InsertOne):
+                    self._insert(op._doc)
+                elif isinstance(op, (UpdateOne, UpdateMany)):
+                    self._update(op._filter, op._doc, op._upsert, many=isinstance(op, UpdateMany))
+                elif isinstance(op, ReplaceOne):
+                    await self.replace_one(op._filter, op._doc, op._upsert)
+                elif isinstance(op, (DeleteOne, DeleteMany)):
+                    await (self.delete_one if isinstance(op, DeleteOne) else self.delete_many)(op._filter)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    # ============= Indexes =============
+
+    async def index_information(self):
+        return copy.deepcopy(self.indexes)
+
+    async def create_indexes(self, models):
+        for model in models:
+            document = model.document
+            self.indexes[document["name"]] = {
+                "key": list(document["key"].items()),
+                **{k: v for k, v in document.items() if k not in ("name", "key")},
+            }
+        return [model.document["name"] for model in models]
+
+    async def drop_index(self, name):
+        self.indexes.pop(name)
+
+
+class FakeDB:
+    """Collections by attribute or item, created empty on first use"""
+
+    def __init__(self, **collections):
+        self._collections = dict(collections)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection()
+        return self._collections[name]
+
+    def __setitem__(self, name, collection):
+        self._collections[name] = collection
+
+    async def list_collection_names(self):
+        return list(self._collections)
+
+
+@pytest.fixture
+def fake_db():
+    return FakeDB()
+
+
+@pytest.fixture
+def api(monkeypatch, fake_db):
+    """TestClient for server.app running against `fake_db` (startup hooks don't run)"""
+    from fastapi.testclient import TestClient
+
+    import server
+
+    monkeypatch.setattr(server, "db", fake_db)
+    monkeypatch.setattr(server, "reminder_log_writer", None)
+    monkeypatch.setattr(server, "missed_dose_sweeper", None)
+    return TestClient(server.app)
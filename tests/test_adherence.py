@@ -0,0 +1,91 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from adherence import build_adherence_pipeline, rebuild_adherence_rollups
+from migrations import backfill_adherence_rollups
+from tests.conftest import FakeCollection, FakeDB
+
+
+def db_with(logs=(), rollups=()):
+    return FakeDB(reminder_logs=FakeCollection(logs), adherence_daily=FakeCollection(rollups))
+
+
+def test_seven_day_window_is_today_and_six_days_back():
+    pipeline = build_adherence_pipeline("p1", datetime(2024, 3, 10, 23, 0), 7, [1, 30])
+    facets = pipeline[1]["$facet"]
+    assert pipeline[0]["$match"]["day"] == {"$gte": "2024-02-10"}
+    assert facets["w1"][0]["$match"]["day"] == {"$gte": "2024-03-10"}
+    assert facets["w7"][0]["$match"]["day"] == {"$gte": "2024-03-04"}
+    assert facets["by_day"][0]["$match"]["day"] == {"$gte": "2024-03-04"}
+
+
+def test_full_rebuild_swaps_in_a_new_collection():
+    db = db_with()
+    asyncio.run(rebuild_adherence_rollups(db))
+    pipeline, = db.reminder_logs.pipelines
+    assert pipeline[-1] == {"$out": "adherence_daily"}
+    assert db.adherence_daily.docs == []
+
+
+def test_patient_rebuild_replaces_in_place_then_drops_stale_days():
+    stale = {"patient_id": "p1", "day": "2024-01-01", "updated_at": datetime(2024, 1, 1)}
+    other = {"patient_id": "p2", "day": "2024-01-01", "updated_at": datetime(2024, 1, 1)}
+    db = db_with(rollups=[stale, other])
+    asyncio.run(rebuild_adherence_rollups(db, "p1"))
+    pipeline, = db.reminder_logs.pipelines
+    assert pipeline[0] == {"$match": {"patient_id": "p1"}}
+    assert pipeline[-1]["$merge"]["whenMatched"] == "replace"
+    assert "$literal" in pipeline[-2]["$project"]["updated_at"]
+    # $merge isn't simulated: the p1 day it didn't rewrite is left stale and dropped
+    assert [d["patient_id"] for d in db.adherence_daily.docs] == ["p2"]
+
+
+def test_backfill_runs_only_when_logs_exist_without_rollups():
+    empty, existing, needed = db_with(), db_with(logs=[{"id": "l1"}], rollups=[{"day": "d"}]), db_with(logs=[{"id": "l1"}])
+    for db in (empty, existing, needed):
+        asyncio.run(backfill_adherence_rollups(db))
+    assert empty.reminder_logs.pipelines == existing.reminder_logs.pipelines == []
+    assert len(needed.reminder_logs.pipelines) == 1
+
+
+def counts(took, missed=0):
+    return {"total": took + missed, "took": took, "missed": missed, "snoozed": 0}
+
+
+def test_route_reads_every_window_from_one_facet_round_trip(api, fake_db):
+    fake_db.adherence_daily.aggregate_result = [{
+        "w7": [counts(6, 1)], "w30": [counts(24, 6)], "w90": [],
+        "by_prescription": [{"_id": "rx2", **counts(1)}, {"_id": "rx1", **counts(5, 1)}],
+        "by_day": [{"_id": "2024-03-10", **counts(2)}],
+    }]
+    body = api.get("/api/reminders/adherence/p1?days=7&windows=30,90,7").json()
+
+    (pipeline,) = fake_db.adherence_daily.pipelines
+    assert set(pipeline[1]["$facet"]) == {"w7", "w30", "w90", "by_prescription", "by_day"}
+    assert body["stats"] == {**counts(6, 1), "adherence_rate": 85.71}
+    assert list(body["windows"]) == ["7", "30", "90"]
+    assert body["windows"]["30"]["adherence_rate"] == 80.0
+    assert body["windows"]["90"] == {**counts(0), "adherence_rate": 0}  # no rollups in the window
+    assert list(body["by_prescription"]) == ["rx1", "rx2"]
+    assert body["by_day"]["2024-03-10"]["took"] == 2
+
+
+def test_route_without_windows_or_rollups(api, fake_db):
+    body = api.get("/api/reminders/adherence/p1").json()
+    assert "windows" not in body and body["stats"]["total"] == 0
+    assert set(fake_db.adherence_daily.pipelines[0][1]["$facet"]) == {"w7", "by_prescription", "by_day"}
+
+
+@pytest.mark.parametrize("query", [
+    "days=0", "days=-3", "days=367", "windows=7,abc", "windows=0", "windows=7,367", "windows=99999999999999999999",
+])
+def test_route_rejects_windows_outside_one_to_366_days(api, fake_db, query):
+    response = api.get(f"/api/reminders/adherence/p1?{query}")
+    assert response.status_code == 400
+    assert fake_db.adherence_daily.pipelines == []
+
+
+def test_a_full_leap_year_is_allowed(api):
+    assert api.get("/api/reminders/adherence/p1?days=366&windows=1,366").status_code == 200
@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import ai_cache as ai_cache_module
+import server
+from ai_cache import ExplanationCache, prompt_hash
+from llm import FakeLLMProvider, LLMGateway
+from tests.conftest import FakeDB
+
+KEY = ExplanationCache.key("m1", "summary", "EN")
+HASH = prompt_hash("system", "Tell me about Paracetamol")
+
+
+def test_key_ignores_language_case_and_carries_the_prompt_version():
+    assert KEY == ExplanationCache.key("m1", "summary", "en") == f"m1|summary|en|v{ai_cache_module.PROMPT_VERSION}"
+
+
+def test_memory_tier_hit_skips_the_collection():
+    db = FakeDB()
+    cache = ExplanationCache()
+    asyncio.run(cache.put(db, KEY, "m1", HASH, "It relieves pain."))
+    db.ai_explanations.docs.clear()
+    assert asyncio.run(cache.get(db, KEY, HASH)) == "It relieves pain."
+    assert (cache.hits_memory, cache.hits_persistent) == (1, 0)
+
+
+def test_persistent_tier_hit_fills_memory():
+    db = FakeDB()
+    asyncio.run(ExplanationCache().put(db, KEY, "m1", HASH, "It relieves pain."))
+    cache = ExplanationCache()  # another worker
+    assert asyncio.run(cache.get(db, KEY, HASH)) == "It relieves pain."
+    db.ai_explanations.docs.clear()
+    assert asyncio.run(cache.get(db, KEY, HASH)) == "It relieves pain."
+    assert (cache.hits_persistent, cache.hits_memory) == (1, 1)
+
+
+def test_changed_prompt_is_a_miss_in_both_tiers():
+    db = FakeDB()
+    cache = ExplanationCache()
+    asyncio.run(cache.put(db, KEY, "m1", HASH, "It relieves pain."))
+    renamed = prompt_hash("system", "Tell me about Acetaminophen")
+    assert asyncio.run(cache.get(db, KEY, renamed)) is None
+    assert asyncio.run(ExplanationCache().get(db, KEY, renamed)) is None
+    assert KEY not in cache._lru  # the stale memory entry is dropped
+
+
+def test_expired_memory_entry_falls_through():
+    db = FakeDB()
+    cache = ExplanationCache()
+    cache._lru[KEY] = ({"response": "old", "prompt_hash": HASH},
+                       datetime.utcnow() - timedelta(seconds=ai_cache_module.AI_CACHE_TTL_SECONDS + 1))
+    assert asyncio.run(cache.get(db, KEY, HASH)) is None
+    assert cache.misses == 1
+
+
+def test_invalidate_medication_clears_both_tiers_for_that_medication_only():
+    db = FakeDB()
+    cache = ExplanationCache()
+    other = ExplanationCache.key("m2", "summary", "en")
+    asyncio.run(cache.put(db, KEY, "m1", HASH, "one"))
+    asyncio.run(cache.put(db, ExplanationCache.key("m1", "dosage", "en"), "m1", HASH, "two"))
+    asyncio.run(cache.put(db, other, "m2", HASH, "three"))
+
+    assert asyncio.run(cache.invalidate_medication(db, "m1")) == 2
+    assert list(cache._lru) == [other]
+    assert [d["key"] for d in db.ai_explanations.docs] == [other]
+    assert asyncio.run(cache.get(db, KEY, HASH)) is None
+
+
+@pytest.fixture
+def explain(api, fake_db, monkeypatch):
+    """POST /ai/explain against a fresh cache; returns (body, provider calls)"""
+    fake_db.medications.docs.append({"id": "m1", "name": "Paracetamol", "name_normalized": "paracetamol"})
+    monkeypatch.setattr(server, "explanation_cache", ExplanationCache())
+
+    def post(**query):
+        provider = FakeLLMProvider(first_token_ms=0, token_ms=0, tokens=3)
+        monkeypatch.setattr(server, "llm_gateway", LLMGateway(provider, max_retries=0))
+        body = api.post("/api/ai/explain", json={"medication_id": "m1", **query}).json()
+        return body, provider.calls
+    return post
+
+
+def test_renamed_medication_is_explained_afresh(explain, fake_db):
+    assert explain()[1] == 1
+    body, calls = explain()
+    assert (body["cached"], calls) == (True, 0)
+
+    fake_db.medications.docs[0]["name"] = "Acetaminophen"
+    body, calls = explain()
+    assert calls == 1 and "cached" not in body
+    assert "Acetaminophen" in body["explanation"]
+
+
+def test_generic_name_edit_changes_the_prompt(explain, fake_db):
+    explain()
+    fake_db.medications.docs[0]["generic_name"] = "acetaminophen"
+    assert explain()[1] == 1
+
+
+def test_custom_queries_are_never_cached(explain, fake_db):
+    for _ in range(2):
+        _, calls = explain(query_type="custom", custom_query="Can I take it with coffee?")
+        assert calls == 1
+    assert fake_db.ai_explanations.docs == []
+    assert server.explanation_cache.stats()["entries_memory"] == 0
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+import server
+from ai_cache import ExplanationCache
+from llm import FakeLLMProvider, LLMGateway
+
+
+class BrokenProvider(FakeLLMProvider):
+    async def stream(self, model, system_message, prompt):
+        self.calls += 1
+        yield "Paracetamol "
+        raise ConnectionError("upstream reset")
+
+
+@pytest.fixture
+def explain(api, fake_db, monkeypatch):
+    """POST to the streaming route with a given provider; returns (events, provider)"""
+    fake_db.medications.docs.append({"id": "m1", "name": "Paracetamol", "name_normalized": "paracetamol"})
+    monkeypatch.setattr(server, "explanation_cache", ExplanationCache())
+
+    def post(provider=None, **query):
+        provider = provider or FakeLLMProvider(first_token_ms=0, token_ms=0, tokens=3)
+        monkeypatch.setattr(server, "llm_gateway", LLMGateway(provider, max_retries=0))
+        response = api.post("/api/ai/explain/stream", json={"medication_id": "m1", **query})
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = []
+        for block in response.text.strip().split("\n\n"):
+            event, data = block.split("\n")
+            events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+        return events, provider
+    return post
+
+
+def test_events_arrive_in_order_and_the_answer_is_cached(explain, fake_db):
+    events, provider = explain()
+    names = [name for name, _ in events]
+    assert names == ["meta", "token", "token", "token", "disclaimer", "done"]
+    assert events[0][1] == {"medication": {"name": "Paracetamol", "generic_name": ""}, "cached": False}
+    text = "".join(data["text"] for name, data in events if name == "token")
+
+    (entry,) = fake_db.ai_explanations.docs
+    assert entry["response"] == text and entry["medication_key"] == "m1"
+
+
+def test_cache_hit_replays_without_calling_the_provider(explain):
+    first, _ = explain()
+    events, provider = explain()
+    assert provider.calls == 0
+    assert events[0][1]["cached"] is True
+    assert [name for name, _ in events] == ["meta", "token", "disclaimer", "done"]
+    assert events[1][1]["text"] == "".join(data["text"] for name, data in first if name == "token")
+
+
+def test_gateway_failure_ends_the_stream_with_an_error_event(explain, fake_db):
+    events, _ = explain(BrokenProvider())
+    assert [name for name, _ in events] == ["meta", "token", "error"]
+    assert "upstream reset" in events[-1][1]["detail"]
+    assert fake_db.ai_explanations.docs == []  # a partial answer is never cached
+
+
+def test_custom_questions_stream_but_are_not_cached(explain, fake_db):
+    events, _ = explain(query_type="custom", custom_query="Can I take it with coffee?")
+    assert [name for name, _ in events][-2:] == ["disclaimer", "done"]
+    assert fake_db.ai_explanations.docs == []
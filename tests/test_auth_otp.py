@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+from auth_tokens import TokenService
+from tests.conftest import FakeCollection
+
+
+class Clock(datetime):
+    now = datetime(2026, 10, 12, 9, 0)
+
+    @classmethod
+    def utcnow(cls):
+        return cls.now
+
+
+@pytest.fixture
+def auth(api, fake_db, monkeypatch):
+    fake_db["otp_challenges"] = FakeCollection(unique=("phone",))
+    fake_db["users"] = FakeCollection(unique=("id", "phone"))
+    Clock.now = datetime(2026, 10, 12, 9, 0)
+    monkeypatch.setattr(server, "datetime", Clock)
+    monkeypatch.setattr(server, "token_service", TokenService("secret"))
+
+    def login():
+        return api.post("/api/auth/login", json={"phone": "+15550100"}).json()["otp"]
+
+    def verify(otp):
+        return api.post("/api/auth/verify", json={"phone": "+15550100", "otp": otp})
+    return login, verify, fake_db
+
+
+def test_code_verifies_once(auth):
+    login, verify, db = auth
+    otp = login()
+    response = verify(otp)
+    assert response.status_code == 200
+    assert response.json()["user"]["phone"] == "+15550100"
+    assert verify(otp).status_code == 400
+    assert db.otp_challenges.docs == []
+
+
+def test_expired_code_is_refused(auth):
+    login, verify, _ = auth
+    otp = login()
+    Clock.now += server.OTP_TTL + timedelta(seconds=1)
+    assert verify(otp).status_code == 400
+
+
+def test_a_new_login_replaces_the_pending_code(auth, monkeypatch):
+    login, verify, _ = auth
+    codes = iter(["123456", "654321"])
+    monkeypatch.setattr(server, "generate_otp", lambda: next(codes))
+    first, second = login(), login()
+    assert verify(first).status_code == 400
+    assert verify(second).status_code == 200
+
+
+def test_wrong_guesses_lock_the_challenge_until_a_new_login(auth):
+    login, verify, db = auth
+    otp = login()
+    wrong = "000000" if otp != "000000" else "111111"
+    for _ in range(server.OTP_MAX_ATTEMPTS):
+        assert verify(wrong).status_code == 400
+    # The right code no longer helps once the guesses are used up
+    assert verify(otp).status_code == 400
+
+    otp = login()
+    assert db.otp_challenges.docs[0]["attempts"] == 0
+    assert verify(otp).status_code == 200
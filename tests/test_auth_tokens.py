@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+
+from auth_tokens import ALGORITHM, InvalidTokenError, TokenService
+from tests.conftest import FakeDB
+
+
+def test_verify_caches_decoded_claims():
+    service = TokenService("secret")
+    token, claims = service.issue({"id": "u1", "role": "caregiver"})
+    assert service.verify(token) == claims
+    assert service.verify(token) == claims
+    stats = service.stats()
+    assert (stats["verifications"], stats["cache_hits"]) == (2, 1)
+    assert stats["avg_verify_us"] > 0
+
+
+def test_bad_tokens_are_rejected():
+    service = TokenService("secret")
+    token, _ = service.issue({"id": "u1"})
+    with pytest.raises(InvalidTokenError):
+        TokenService("other secret").verify(token)
+    with pytest.raises(InvalidTokenError):
+        service.verify(token[:-2] + "xx")
+    expired = jwt.encode({"iss": "mediminder", "sub": "u1", "jti": "j", "iat": 1, "exp": 2}, "secret", ALGORITHM)
+    with pytest.raises(InvalidTokenError, match="expired"):
+        service.verify(expired)
+    assert service.stats()["rejected"] == 2
+
+
+def test_cached_claims_still_expire():
+    service = TokenService("secret", ttl_s=60)
+    token, claims = service.issue({"id": "u1"})
+    service.verify(token)
+    service._claims[token] = {**claims, "exp": time.time() - 1}
+    with pytest.raises(InvalidTokenError, match="expired"):
+        service.verify(token)
+
+
+def test_revocation_reaches_other_instances_on_refresh():
+    db = FakeDB()
+    here, there = TokenService("secret"), TokenService("secret")
+    token, claims = here.issue({"id": "u1"})
+    assert there.verify(token)
+
+    asyncio.run(here.revoke(db, claims))
+    with pytest.raises(InvalidTokenError, match="revoked"):
+        here.verify(token)
+    assert there.verify(token)  # until its next refresh
+    asyncio.run(there.refresh(db))
+    with pytest.raises(InvalidTokenError, match="revoked"):
+        there.verify(token)
+
+
+def test_claims_cache_is_bounded():
+    service = TokenService("secret", cache_size=2)
+    for i in range(5):
+        service.verify(service.issue({"id": f"u{i}"})[0])
+    assert service.stats()["cached_claims"] == 2
+
+
+def test_startup_refuses_a_missing_secret(monkeypatch):
+    monkeypatch.delenv("AUTH_TOKEN_SECRET", raising=False)
+    monkeypatch.delenv("AUTH_TOKEN_ALLOW_RANDOM_SECRET", raising=False)
+    with pytest.raises(RuntimeError, match="AUTH_TOKEN_SECRET"):
+        asyncio.run(TokenService.from_env().start(None))
+
+    # Development opt-in: a random per-process key
+    monkeypatch.setenv("AUTH_TOKEN_ALLOW_RANDOM_SECRET", "true")
+    service = TokenService.from_env()
+    token, _ = service.issue({"id": "u1", "role": "patient"})
+    assert service.verify(token)["sub"] == "u1"
@@ -0,0 +1,62 @@
+import asyncio
+
+from fastapi import Response
+from starlette.requests import Request
+
+from conditional import conditional_find_one, document_etag, etag_matches, list_etag
+from tests.conftest import FakeCollection
+
+
+def request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "headers": headers})
+
+
+class Collection(FakeCollection):
+    """Records the projection of every find_one"""
+
+    def __init__(self, doc):
+        super().__init__([doc])
+        self.projections = []
+
+    @property
+    def doc(self):
+        return self.docs[0]
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        self.projections.append(projection)
+        return await super().find_one(query, projection, sort)
+
+
+def test_etags_follow_revision_and_representation():
+    doc = {"id": "p1", "revision": 3}
+    assert document_etag(doc) == '"p1.3"'
+    assert document_etag({"id": "p1"}) == '"p1.0"'
+    assert document_etag(doc, "name") != document_etag(doc, "name,dob") != document_etag(doc)
+    assert list_etag([doc]) != list_etag([{**doc, "revision": 4}]) != list_etag([])
+
+
+def test_if_none_match_parsing():
+    assert etag_matches('"a", W/"p1.3"', '"p1.3"')
+    assert etag_matches("*", '"p1.3"')
+    assert not etag_matches('"p1.2"', '"p1.3"')
+    assert not etag_matches(None, '"p1.3"')
+
+
+def test_matching_revision_answers_304_from_a_projection_only_read():
+    collection = Collection({"id": "p1", "name": "Ada", "revision": 2})
+    response = Response()
+    doc = asyncio.run(conditional_find_one(collection, {"id": "p1"}, {"_id": 0}, request(), response))
+    etag = response.headers["etag"]
+    assert doc["name"] == "Ada"
+
+    collection.projections.clear()
+    result = asyncio.run(conditional_find_one(collection, {"id": "p1"}, {"_id": 0}, request(etag), Response()))
+    assert isinstance(result, Response) and result.status_code == 304
+    assert collection.projections == [{"_id": 0, "id": 1, "revision": 1}]
+
+    # A write bumps the revision: full read, new ETag
+    collection.doc["revision"] = 3
+    response = Response()
+    doc = asyncio.run(conditional_find_one(collection, {"id": "p1"}, {"_id": 0}, request(etag), response))
+    assert doc["revision"] == 3 and response.headers["etag"] != etag
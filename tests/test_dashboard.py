@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import pytest
+
+import server
+from missed_doses import to_minute
+
+NOW = datetime(2026, 10, 12, 12, 0)  # a Monday, 14:00 at UTC+2
+
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def utcnow(cls):
+        return NOW
+
+
+def prescription(id, times, **fields):
+    return {"id": id, "patient_id": "p1", "medication_name": id.title(), "start_date": "2026-10-01",
+            "schedule": {"times": times, **fields.pop("schedule", {})}, "current_stock": 30, **fields}
+
+
+@pytest.fixture
+def dashboard(api, fake_db, monkeypatch):
+    monkeypatch.setattr(server, "datetime", FrozenDatetime)
+
+    def get(patient, query=""):
+        if patient:
+            fake_db.patients.docs.append(patient)
+        fake_db.prescriptions.docs.extend([
+            prescription("aspirin", ["08:00", "20:00"], current_stock=3),
+            prescription("vitamin", []),
+            prescription("weekly", ["09:00"], schedule={"days": ["Tue"]}),
+        ])
+        took = datetime(2026, 10, 12, 6, 5)  # 08:05 local
+        fake_db.reminder_logs.aggregate_result = [
+            {"prescription_id": "aspirin", "action": "took", "ms": to_minute(took) * 60000}
+        ]
+        fake_db.adherence_daily.aggregate_result = [{"w7": [{"total": 4, "took": 3, "missed": 1}]}]
+        return api.get(f"/api/dashboard/p1{query}")
+    return get
+
+
+def test_today_in_the_patients_day_with_dose_statuses(dashboard):
+    body = dashboard({"id": "p1", "utc_offset_minutes": 120}).json()
+    assert body["date"] == "2026-10-12"
+    assert body["utc_offset_minutes"] == body["patient_utc_offset_minutes"] == 120
+    prescriptions = {p["id"]: p for p in body["prescriptions"]}
+    # Not due on Mondays; the one without times can't be scheduled but stays listed
+    assert set(prescriptions) == {"aspirin", "vitamin"}
+    aspirin = prescriptions["aspirin"]
+    assert [d["status"] for d in aspirin["doses"]] == ["taken", "pending"]
+    assert aspirin["low_stock"] and not prescriptions["vitamin"]["low_stock"]
+    assert body["adherence"] == {"total": 4, "took": 3, "missed": 1, "snoozed": 0, "adherence_rate": 75.0}
+
+
+def test_device_offset_overrides_and_unknown_offset_is_reported(dashboard):
+    body = dashboard({"id": "p1"}, "?tz_offset=-600").json()
+    assert body["date"] == "2026-10-12"  # 02:00 at UTC-10
+    assert body["utc_offset_minutes"] == -600
+    assert body["patient_utc_offset_minutes"] is None
+    # 08:00 local is 18:00 UTC, still ahead; the UTC+2 log doesn't answer it
+    (aspirin,) = [p for p in body["prescriptions"] if p["id"] == "aspirin"]
+    assert [d["status"] for d in aspirin["doses"]] == ["pending", "pending"]
+
+
+def test_unknown_patient_is_404(dashboard):
+    assert dashboard(None).status_code == 404
+
+
+@pytest.mark.parametrize("route", ["dashboard", "schedule"])
+@pytest.mark.parametrize("offset", [-721, 841, 10 ** 12])
+def test_offsets_outside_real_time_zones_are_rejected(api, route, offset):
+    # Before any lookup: an overflowing offset used to end in a 500
+    assert api.get(f"/api/{route}/p1?tz_offset={offset}").status_code == 422
+
+
+def test_offsets_at_the_bounds_are_accepted(dashboard, api):
+    assert dashboard({"id": "p1"}, "?tz_offset=840").json()["date"] == "2026-10-13"  # 02:00 at UTC+14
+    assert api.get("/api/dashboard/p1?tz_offset=-720").json()["date"] == "2026-10-12"  # 00:00 at UTC-12
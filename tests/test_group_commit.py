@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from group_commit import GroupCommitWriter
+from tests.conftest import FakeCollection
+
+
+class RecordingCollection(FakeCollection):
+    """Fake collection that records insert_many batch sizes, with some latency"""
+
+    def __init__(self, latency: float = 0.002):
+        super().__init__()
+        self.latency = latency
+        self.batches = []
+
+    async def insert_many(self, docs, ordered=True):
+        await asyncio.sleep(self.latency)
+        self.batches.append(len(docs))
+        await super().insert_many(docs, ordered)
+
+
+def test_concurrent_writes_share_batches():
+    async def scenario():
+        collection = RecordingCollection()
+        writer = GroupCommitWriter(collection, max_batch=100, max_delay_ms=5)
+        writer.start()
+        await asyncio.gather(*[writer.write({"id": str(i)}) for i in range(250)])
+        await writer.close()
+        return collection, writer
+
+    collection, writer = asyncio.run(scenario())
+    assert len(collection.docs) == 250
+    assert max(collection.batches) == 100
+    assert len(collection.batches) <= 4
+    assert writer.stats()["documents"] == 250
+
+
+def test_lone_write_flushes_after_delay():
+    async def scenario():
+        writer = GroupCommitWriter(RecordingCollection(latency=0), max_batch=100, max_delay_ms=20)
+        writer.start()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await writer.write({"id": "a"})
+        waited = loop.time() - started
+        await writer.close()
+        return waited
+
+    assert 0.015 <= asyncio.run(scenario()) < 0.5
+
+
+def test_full_batch_flushes_without_waiting_for_the_interval():
+    async def scenario():
+        collection = RecordingCollection(latency=0)
+        writer = GroupCommitWriter(collection, max_batch=10, max_delay_ms=10_000)
+        writer.start()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await asyncio.gather(*[writer.write({"id": str(i)}) for i in range(10)])
+        waited = loop.time() - started
+        await writer.close()
+        return collection, waited
+
+    collection, waited = asyncio.run(scenario())
+    assert collection.batches == [10]
+    assert waited < 1
+
+
+def test_partial_batch_flushes_on_the_interval():
+    async def scenario():
+        collection = RecordingCollection(latency=0)
+        writer = GroupCommitWriter(collection, max_batch=100, max_delay_ms=30)
+        writer.start()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        first = asyncio.gather(*[writer.write({"id": str(i)}) for i in range(3)])
+        await asyncio.sleep(0.01)
+        late = writer.write({"id": "late"})  # joins the batch still waiting
+        await asyncio.gather(first, late)
+        waited = loop.time() - started
+        await writer.close()
+        return collection, waited
+
+    collection, waited = asyncio.run(scenario())
+    assert collection.batches == [4]
+    assert 0.025 <= waited < 0.5
+
+
+def test_failed_document_fails_only_its_caller():
+    async def scenario():
+        collection = RecordingCollection()
+        collection.docs.append({"id": "taken"})
+        writer = GroupCommitWriter(collection, max_batch=10, max_delay_ms=5)
+        writer.start()
+        results = await asyncio.gather(
+            writer.write({"id": "ok"}), writer.write({"id": "taken"}), return_exceptions=True
+        )
+        await writer.close()
+        return results
+
+    ok, duplicate = asyncio.run(scenario())
+    assert ok is None
+    assert isinstance(duplicate, DuplicateKeyError)
+
+
+def test_after_flush_receives_written_documents():
+    async def scenario():
+        seen = []
+
+        async def after_flush(docs):
+            seen.extend(doc["id"] for doc in docs)
+
+        writer = GroupCommitWriter(RecordingCollection(), max_batch=10, max_delay_ms=5, after_flush=after_flush)
+        writer.start()
+        await asyncio.gather(*[writer.write({"id": str(i)}) for i in range(5)])
+        await writer.close()
+        return seen
+
+    assert sorted(asyncio.run(scenario())) == ["0", "1", "2", "3", "4"]
+
+
+def test_write_requires_running_writer():
+    writer = GroupCommitWriter(RecordingCollection())
+    with pytest.raises(RuntimeError):
+        asyncio.run(writer.write({"id": "x"}))
+
+
+def test_after_flush_failure_fails_the_batch_but_not_the_writer():
+    async def scenario():
+        calls = []
+
+        async def after_flush(docs):
+            calls.append([doc["id"] for doc in docs])
+            if len(calls) == 1:
+                raise RuntimeError("rollup write failed")
+
+        collection = RecordingCollection(latency=0)
+        collection.docs.append({"id": "taken"})
+        writer = GroupCommitWriter(collection, max_batch=10, max_delay_ms=5, after_flush=after_flush)
+        writer.start()
+        failed = await asyncio.gather(
+            writer.write({"id": "a"}), writer.write({"id": "taken"}), return_exceptions=True
+        )
+        await writer.write({"id": "b"})
+        await writer.close()
+        return calls, failed, collection, writer.stats()
+
+    calls, (a, taken), collection, stats = asyncio.run(scenario())
+    assert calls == [["a"], ["b"]]  # only written documents reach after_flush
+    assert isinstance(a, RuntimeError)  # stored, but its caller learns the follow-up failed
+    assert isinstance(taken, DuplicateKeyError)  # keeps its own, more specific error
+    assert {"a", "b"} <= {doc["id"] for doc in collection.docs}
+    assert stats["failures"] == 2 and stats["flushes"] == 2
@@ -0,0 +1,121 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from indexes import (
+    INDEX_SPECS, QUERY_SHAPES, IndexBuildError, QueryPlanError, _plan_stages, ensure_indexes, verify_query_plans
+)
+from migrations import merge_duplicate_phone_users
+from tests.conftest import FakeCollection, FakeDB
+
+IXSCAN = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "probe"}}
+
+
+def test_plan_stages_follow_nested_input_stages():
+    plan = {"stage": "LIMIT", "inputStage": {"stage": "SORT", "inputStage": IXSCAN}}
+    assert _plan_stages(plan) == ["LIMIT", "SORT", "FETCH", "IXSCAN"]
+
+
+def test_plan_stages_follow_every_branch_of_an_or():
+    plan = {"stage": "SUBPLAN", "inputStage": {"stage": "OR", "inputStages": [IXSCAN, {"stage": "COLLSCAN"}]}}
+    assert _plan_stages(plan) == ["SUBPLAN", "OR", "FETCH", "IXSCAN", "COLLSCAN"]
+
+
+def test_plan_stages_unwrap_the_slot_based_engine_shape():
+    plan = {"queryPlan": {"stage": "PROJECTION_SIMPLE", "inputStage": {"stage": "COLLSCAN"}}, "slotBasedPlan": {}}
+    assert _plan_stages(plan) == ["", "PROJECTION_SIMPLE", "COLLSCAN"]
+
+
+class ExplainCursor:
+    def __init__(self, plan):
+        self.plan = plan
+
+    def sort(self, spec):
+        return self
+
+    async def explain(self):
+        return {"queryPlanner": {"winningPlan": self.plan}}
+
+
+class ExplainDB:
+    """find().explain() answers with a canned plan per collection"""
+
+    def __init__(self, plans):
+        self.plans = plans
+
+    def __getitem__(self, collection):
+        plan = self.plans.get(collection, IXSCAN)
+        return type("Collection", (), {"find": lambda _, query: ExplainCursor(plan)})()
+
+
+def test_verify_query_plans_passes_when_every_shape_uses_an_index():
+    plans = asyncio.run(verify_query_plans(ExplainDB({})))
+    assert len(plans) == len({f"{route} ({collection})" for route, collection, _, _ in QUERY_SHAPES})
+    assert all(stages == ["FETCH", "IXSCAN"] for stages in plans.values())
+
+
+def test_verify_query_plans_names_every_collection_scan():
+    db = ExplainDB({"ai_explanations": {"queryPlan": {"stage": "COLLSCAN"}}, "ocr_cache": {"stage": "COLLSCAN"}})
+    with pytest.raises(QueryPlanError) as error:
+        asyncio.run(verify_query_plans(db))
+    assert "explain_medicine (ai_explanations)" in str(error.value)
+    assert "recognize_medicine (ocr_cache)" in str(error.value)
+    assert "get_patient" not in str(error.value)
+
+
+def test_ensure_indexes_creates_every_declared_index_idempotently():
+    db = FakeDB()
+    created = asyncio.run(ensure_indexes(db))
+    assert created == {name: [m.document["name"] for m in models] for name, models in INDEX_SPECS.items()}
+    asyncio.run(ensure_indexes(db))
+    users = db.users.indexes
+    assert set(users) == {"_id_", "id_unique", "phone_unique"}
+    assert users["phone_unique"]["unique"] and users["phone_unique"]["partialFilterExpression"]
+    assert db.otp_challenges.indexes["expires_at_ttl"]["expireAfterSeconds"] == 0
+
+
+class FailingCollection(FakeCollection):
+    def __init__(self, code):
+        super().__init__()
+        self.code = code
+
+    async def create_indexes(self, models):
+        raise OperationFailure("index build failed", code=self.code)
+
+
+def test_option_conflicts_are_logged_and_the_rest_still_built():
+    db = FakeDB(ocr_cache=FailingCollection(85))  # IndexOptionsConflict
+    created = asyncio.run(ensure_indexes(db))
+    assert "ocr_cache" not in created and "users" in created
+
+
+def test_duplicates_blocking_a_unique_index_fail_startup():
+    db = FakeDB(users=FailingCollection(11000))
+    with pytest.raises(IndexBuildError):
+        asyncio.run(ensure_indexes(db))
+
+
+def phone_groups(collection):
+    """The migration's $group: user ids per phone, oldest first, phones with more than one"""
+    def aggregate(pipeline):
+        by_phone = {}
+        for user in sorted(collection.docs, key=lambda u: u["created_at"]):
+            if isinstance(user.get("phone"), str):
+                by_phone.setdefault(user["phone"], []).append(user["id"])
+        return [{"_id": phone, "ids": ids, "count": len(ids)} for phone, ids in by_phone.items() if len(ids) > 1]
+    return aggregate
+
+
+def test_users_sharing_a_phone_are_merged_into_the_oldest():
+    db = FakeDB()
+    for i, (id, phone) in enumerate([("new", "+1555"), ("old", "+1555"), ("other", "+1666"), ("none", None)]):
+        db.users.docs.append({"_id": i, "id": id, "phone": phone, "created_at": datetime(2026, 1, 10 - i)})
+    db.users.aggregate_result = phone_groups(db.users)
+    db.patients.docs.extend([{"_id": 0, "id": "a", "user_id": "new"}, {"_id": 1, "id": "b", "user_id": "other"}])
+
+    assert asyncio.run(merge_duplicate_phone_users(db)) == 1
+    assert [u["id"] for u in db.users.docs] == ["old", "other", "none"]
+    assert [p["user_id"] for p in db.patients.docs] == ["old", "other"]
+    assert asyncio.run(merge_duplicate_phone_users(db)) == 0
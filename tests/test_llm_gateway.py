@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from llm import FakeLLMProvider, LLMGateway, LLMTimeoutError, LLMUnavailableError
+
+
+class FlakyProvider(FakeLLMProvider):
+    """Fake provider that fails its first `failures` calls"""
+
+    def __init__(self, failures: int, **kwargs):
+        super().__init__(first_token_ms=kwargs.pop("first_token_ms", 5), token_ms=0, tokens=3, **kwargs)
+        self.failures = failures
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def complete(self, model, system_message, prompt, image_base64=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.calls < self.failures:
+                self.calls += 1
+                await asyncio.sleep(0.001)
+                raise ConnectionError("upstream reset")
+            return await super().complete(model, system_message, prompt, image_base64)
+        finally:
+            self.in_flight -= 1
+
+
+def gateway_for(provider, **kwargs):
+    options = dict(max_in_flight=4, timeout_s=2, max_retries=2, breaker_threshold=3,
+                   breaker_cooldown_s=60, backoff_base_s=0.001, backoff_cap_s=0.002)
+    options.update(kwargs)
+    return LLMGateway(provider, **options)
+
+
+def test_retries_transient_failures():
+    gateway = gateway_for(FlakyProvider(failures=2))
+    text = asyncio.run(gateway.complete("m", "sys", "hello"))
+    assert text.startswith("hello")
+    stats = gateway.stats()["models"]["m"]
+    assert stats["retries"] == 2
+    assert stats["breaker"] == "closed"
+
+
+def test_bounds_concurrency_per_model():
+    provider = FlakyProvider(failures=0, first_token_ms=20)
+    gateway = gateway_for(provider, max_in_flight=3)
+
+    async def scenario():
+        await asyncio.gather(*[gateway.complete("m", "sys", f"q{i}") for i in range(12)])
+
+    asyncio.run(scenario())
+    assert provider.max_in_flight == 3
+
+
+def test_breaker_opens_and_fails_fast():
+    provider = FlakyProvider(failures=100)
+    gateway = gateway_for(provider, max_retries=0)
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(ConnectionError):
+                await gateway.complete("m", "sys", "q")
+        calls = provider.calls
+        with pytest.raises(LLMUnavailableError):
+            await gateway.complete("m", "sys", "q")
+        return calls
+
+    calls_before = asyncio.run(scenario())
+    assert provider.calls == calls_before
+    assert gateway.stats()["models"]["m"]["breaker"] == "open"
+
+
+def test_half_open_trial_closes_breaker_on_success():
+    provider = FlakyProvider(failures=3)
+    gateway = gateway_for(provider, max_retries=0, breaker_cooldown_s=0.01)
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(ConnectionError):
+                await gateway.complete("m", "sys", "q")
+        await asyncio.sleep(0.02)
+        return await gateway.complete("m", "sys", "recovered")
+
+    assert asyncio.run(scenario()).startswith("recovered")
+    assert gateway.stats()["models"]["m"]["breaker"] == "closed"
+
+
+def test_deadline_raises_timeout():
+    gateway = gateway_for(FlakyProvider(failures=0, first_token_ms=200), timeout_s=0.05)
+    with pytest.raises(LLMTimeoutError):
+        asyncio.run(gateway.complete("m", "sys", "slow"))
+    assert gateway.stats()["models"]["m"]["timeouts"] == 1
+
+
+def test_litellm_provider_streams_chunk_by_chunk(monkeypatch):
+    import litellm
+
+    from llm import LiteLLMProvider
+
+    calls = []
+    acompletion = litellm.acompletion
+
+    async def mocked(**kwargs):
+        calls.append(kwargs)
+        return await acompletion(**kwargs, mock_response="Take it with food, twice a day.")
+
+    monkeypatch.setattr(litellm, "acompletion", mocked)
+    provider = LiteLLMProvider(api_key="test-key", api_base="http://llm.invalid/v1")
+
+    async def collect():
+        return [chunk async for chunk in gateway_for(provider).stream("gpt-4o-mini", "system", "prompt")]
+
+    chunks = asyncio.run(collect())
+    assert len(chunks) > 1 and "".join(chunks) == "Take it with food, twice a day."
+    assert calls[0]["stream"] is True and calls[0]["model"] == "openai/gpt-4o-mini"
+    assert calls[0]["base_url"] == "http://llm.invalid/v1"
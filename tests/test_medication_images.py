@@ -0,0 +1,122 @@
+import asyncio
+import base64
+import io
+
+import pytest
+from gridfs.errors import NoFile
+from PIL import Image
+
+from image_pipeline import InvalidImageError, PreprocessConfig, preprocess_image
+from medication_images import (
+    IMAGE_SIZES, GridFSImageStore, ImageNotFoundError, InvalidRangeError, LocalImageStore, MedicationImages,
+    parse_range, render_variants
+)
+
+
+def photo(width=3000, height=2000):
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 40, 40)).save(out, format="JPEG")
+    return base64.b64encode(out.getvalue()).decode()
+
+
+def test_variants_are_bounded_and_content_addressed():
+    upload = photo()
+    digest, blobs, sizes = render_variants(upload)
+    assert set(blobs) == set(IMAGE_SIZES)
+    for size, edge in IMAGE_SIZES.items():
+        assert max(sizes[size]["width"], sizes[size]["height"]) == edge
+        assert sizes[size]["bytes"] == len(blobs[size])
+    assert render_variants("data:image/jpeg;base64," + upload)[0] == digest
+
+
+def test_small_images_are_not_upscaled():
+    _, _, sizes = render_variants(photo(100, 60))
+    assert (sizes["full"]["width"], sizes["full"]["height"]) == (100, 60)
+    assert (sizes["thumb"]["width"], sizes["thumb"]["height"]) == (100, 60)
+
+
+def test_undecodable_upload():
+    with pytest.raises(InvalidImageError):
+        render_variants(base64.b64encode(b"not an image").decode())
+
+
+@pytest.mark.parametrize("decode", [render_variants, lambda upload: preprocess_image(upload, PreprocessConfig())])
+def test_decompression_bomb_is_an_invalid_image(monkeypatch, decode):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    with pytest.raises(InvalidImageError):
+        decode(photo(100, 60))
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=900-", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("bytes=0-1,5-6", None),   # multi-range: whole body
+    ("items=0-1", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5-2", "bytes=-0"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(InvalidRangeError):
+        parse_range(header, 1000)
+
+
+def test_local_store_round_trip(tmp_path):
+    images = MedicationImages(LocalImageStore(str(tmp_path)), workers=1)
+    try:
+        image = asyncio.run(images.save(None, photo(800, 600)))
+        thumb = asyncio.run(images.load(None, image["hash"], "thumb"))
+        assert Image.open(io.BytesIO(thumb)).size == (128, 96)
+        assert len(thumb) == image["sizes"]["thumb"]["bytes"]
+    finally:
+        images.shutdown()
+
+
+class Bucket:
+    """In-memory stand-in for a Motor GridFS bucket and its files collection"""
+
+    def __init__(self):
+        self.files = {}
+        self.uploads = 0
+
+    async def find_one(self, query, projection=None):
+        return {"_id": 1} if query["filename"] in self.files else None
+
+    async def upload_from_stream(self, name, data, metadata=None):
+        self.uploads += 1
+        self.files[name] = data
+
+    async def open_download_stream_by_name(self, name):
+        if name not in self.files:
+            raise NoFile(name)
+        data = self.files[name]
+
+        class Stream:
+            async def read(self):
+                return data
+        return Stream()
+
+
+def test_gridfs_store_round_trip(monkeypatch):
+    bucket = Bucket()
+    store = GridFSImageStore("medication_images")
+    monkeypatch.setattr(store, "_bucket", lambda db: bucket)
+    db = {"medication_images.files": bucket}
+    images = MedicationImages(store, workers=1)
+    try:
+        image = asyncio.run(images.save(db, photo(800, 600)))
+        assert sorted(bucket.files) == sorted(f"{image['hash']}/{size}.jpg" for size in IMAGE_SIZES)
+        # Same photo again: content-addressed names already exist, nothing is uploaded
+        asyncio.run(images.save(db, photo(800, 600)))
+        assert bucket.uploads == len(IMAGE_SIZES)
+        thumb = asyncio.run(images.load(db, image["hash"], "thumb"))
+        assert Image.open(io.BytesIO(thumb)).size == (128, 96)
+        with pytest.raises(ImageNotFoundError):
+            asyncio.run(images.load(db, "0" * 64, "thumb"))
+    finally:
+        images.shutdown()
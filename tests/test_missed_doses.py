@@ -0,0 +1,169 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from missed_doses import LEASE_SECONDS, STATE_ID, MissedDoseSweeper, retract_superseded_misses, to_minute
+from tests.conftest import FakeDB
+
+
+def logs_by_scheduled_minute(collection):
+    """The sweeper's aggregate: logs of the matched prescriptions, scheduled_at as epoch ms"""
+    def aggregate(pipeline):
+        ids = set(pipeline[0]["$match"]["prescription_id"]["$in"])
+        return [
+            {"prescription_id": d["prescription_id"], "action": d["action"],
+             "ms": to_minute(d["scheduled_at"]) * 60000}
+            for d in collection.docs if d["prescription_id"] in ids
+        ]
+    return aggregate
+
+
+def sweeper_db():
+    db = FakeDB()
+    db.reminder_logs.aggregate_result = logs_by_scheduled_minute(db.reminder_logs)
+    return db
+
+
+def ids(collection):
+    return [d["id"] for d in collection.docs]
+
+
+def prescription(id, times, patient_id="p1"):
+    return {"id": id, "patient_id": patient_id, "schedule": {"times": times}, "start_date": "2026-10-01"}
+
+
+def sweeper_with(db, prescriptions, swept_until, offsets=None, worker_id="w1"):
+    """A sweeper over `prescriptions`, checkpointed at `swept_until`"""
+    db.prescriptions.docs.extend(prescriptions)
+    for patient_id, offset in ({"p1": 0} if offsets is None else offsets).items():
+        db.patients.docs.append({"id": patient_id, "utc_offset_minutes": offset})
+    db.sweeper_state.docs.append({"_id": STATE_ID, "swept_until": swept_until})
+    return MissedDoseSweeper(db, make_log=lambda **fields: fields, grace_minutes=60, worker_id=worker_id)
+
+
+async def cycle(sweeper, now):
+    """One background-loop iteration at `now`, as _run() does it"""
+    if not await sweeper.acquire_lease(now):
+        return None
+    await sweeper.load(to_minute(now))
+    return await sweeper.sweep(to_minute(now))
+
+
+def test_sweep_marks_only_unanswered_doses():
+    db = sweeper_db()
+    db.reminder_logs.docs.append({
+        "id": "t", "prescription_id": "a", "action": "took", "scheduled_at": datetime(2026, 10, 12, 8, 20)
+    })
+    sweeper = sweeper_with(db, [prescription("a", ["08:00", "20:00"]), prescription("b", ["08:00"])],
+                           datetime(2026, 10, 12))
+
+    written = asyncio.run(cycle(sweeper, datetime(2026, 10, 12, 12)))
+    assert written == 1
+    assert "missed:b:" + str(to_minute(datetime(2026, 10, 12, 8))) in ids(db.reminder_logs)
+    assert db.sweeper_state.docs[0]["swept_until"] == datetime(2026, 10, 12, 12)
+
+
+def test_deleted_prescription_is_dropped_on_the_next_cycle_and_sweeps_are_idempotent():
+    db = sweeper_db()
+    sweeper = sweeper_with(db, [prescription("a", ["08:00"]), prescription("b", ["08:00"])],
+                           datetime(2026, 10, 12))
+    # Deleted through another worker: nothing tells this one but the collection
+    db.prescriptions.docs = [d for d in db.prescriptions.docs if d["id"] != "b"]
+    assert asyncio.run(cycle(sweeper, datetime(2026, 10, 12, 12))) == 1
+
+    # Replaying the same window (e.g. after a crash) writes nothing new
+    db.sweeper_state.docs[0]["swept_until"] = datetime(2026, 10, 12)
+    assert asyncio.run(cycle(sweeper, datetime(2026, 10, 12, 12))) == 0
+    assert len(db.reminder_logs.docs) == 1
+
+
+def test_patients_without_a_reported_offset_are_not_swept():
+    db = sweeper_db()
+    sweeper = sweeper_with(db, [prescription("a", ["08:00"]), prescription("b", ["08:00"], patient_id="p2")],
+                           datetime(2026, 10, 12), offsets={"p1": 60, "p2": None})
+    assert asyncio.run(cycle(sweeper, datetime(2026, 10, 12, 12))) == 1
+    assert ids(db.reminder_logs) == ["missed:a:" + str(to_minute(datetime(2026, 10, 12, 7)))]
+    assert sweeper.stats()["patients_without_offset"] == 1
+
+
+def test_doses_inside_their_grace_period_survive_an_offset_change():
+    db = sweeper_db()
+    sweeper = sweeper_with(db, [prescription("a", ["08:00"])], datetime(2026, 10, 12, 6), offsets={"p1": 60})
+    assert asyncio.run(cycle(sweeper, datetime(2026, 10, 12, 7, 45))) == 0  # 07:00 UTC is due at 08:00
+
+    # Now at UTC+00:30, 08:00 local is 07:30 UTC: scheduled before the change, still in its grace period
+    db.patients.docs[0]["utc_offset_minutes"] = 30
+    assert asyncio.run(cycle(sweeper, datetime(2026, 10, 12, 8, 45))) == 1
+    assert ids(db.reminder_logs) == ["missed:a:" + str(to_minute(datetime(2026, 10, 12, 7, 30)))]
+
+
+def test_only_the_lease_holder_sweeps_until_the_lease_expires_or_is_released():
+    db = sweeper_db()
+    first = sweeper_with(db, [prescription("a", ["08:00"])], datetime(2026, 10, 12))
+    second = MissedDoseSweeper(db, make_log=lambda **fields: fields, grace_minutes=60, worker_id="w2")
+    now = datetime(2026, 10, 12, 12)
+
+    assert asyncio.run(first.acquire_lease(now))
+    assert not asyncio.run(second.acquire_lease(now))
+    assert asyncio.run(cycle(second, now)) is None and db.reminder_logs.docs == []
+    assert asyncio.run(first.acquire_lease(now + timedelta(seconds=30)))  # renewal
+
+    # The holder stops renewing (crashed): the lease runs out and the other takes over
+    later = now + timedelta(seconds=30 + LEASE_SECONDS + 1)
+    assert asyncio.run(cycle(second, later)) == 1
+    assert not asyncio.run(first.acquire_lease(later))
+    assert (second.stats()["leader"], first.stats()["leader"]) == (True, False)
+
+    # A clean shutdown hands over at once
+    asyncio.run(second.close())
+    assert asyncio.run(first.acquire_lease(later))
+
+
+def test_sweeper_is_off_unless_enabled(monkeypatch):
+    from missed_doses import sweeper_enabled
+
+    monkeypatch.delenv("MISSED_DOSE_SWEEPER", raising=False)
+    assert not sweeper_enabled()
+    monkeypatch.setenv("MISSED_DOSE_SWEEPER", "true")
+    assert sweeper_enabled()
+
+
+def test_failed_write_keeps_the_doses_and_the_checkpoint():
+    db = sweeper_db()
+    sweeper = sweeper_with(db, [prescription("a", ["08:00"])], datetime(2026, 10, 12))
+    now = datetime(2026, 10, 12, 12)
+
+    async def fail(operations, ordered=True):
+        raise ConnectionError("primary stepped down")
+
+    db.reminder_logs.bulk_write = fail
+    with pytest.raises(ConnectionError):
+        asyncio.run(cycle(sweeper, now))
+    assert db.sweeper_state.docs[0]["swept_until"] == datetime(2026, 10, 12)
+
+    del db.reminder_logs.bulk_write
+    assert asyncio.run(sweeper.sweep(to_minute(now))) == 1
+    assert db.sweeper_state.docs[0]["swept_until"] == now
+
+
+def test_late_answer_retracts_the_nearest_synthetic_miss():
+    db = sweeper_db()
+    for hour in (8, 20):
+        scheduled = datetime(2026, 10, 12, hour)
+        db.reminder_logs.docs.append({
+            "id": f"m{hour}", "patient_id": "p1", "prescription_id": "a", "scheduled_at": scheduled,
+            "action": "missed", "source": "sweeper", "created_at": scheduled,
+        })
+    db.adherence_daily.docs.append({
+        "patient_id": "p1", "prescription_id": "a", "day": "2026-10-12", "counts": {"missed": 2}, "total": 2
+    })
+    took = {"id": "t", "patient_id": "p1", "prescription_id": "a", "scheduled_at": datetime(2026, 10, 12, 10, 30),
+            "action": "took", "created_at": datetime(2026, 10, 12, 10, 30)}
+    snoozed = {**took, "id": "s", "action": "snoozed"}
+
+    assert asyncio.run(retract_superseded_misses(db, [took, snoozed])) == 1
+    assert ids(db.reminder_logs) == ["m20"]
+    assert (db.adherence_daily.docs[0]["counts"], db.adherence_daily.docs[0]["total"]) == ({"missed": 1}, 1)
+    # Already retracted: a resend finds nothing more to take back
+    assert asyncio.run(retract_superseded_misses(db, [took])) == 0
@@ -0,0 +1,115 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+from PIL import Image
+
+import ocr_cache as ocr_cache_module
+from ocr_cache import BANDS, OCRResultCache, dhash, hamming, hash_bands
+from tests.conftest import FakeDB, project
+
+BASE = 0x0123456789ABCDEF
+
+
+def flip(value, *bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def cache_db():
+    """The lookup pipeline run in memory: $in on the bands, then the shared-band threshold"""
+    db = FakeDB()
+
+    def aggregate(pipeline):
+        bands = set(pipeline[0]["$match"]["bands"]["$in"])
+        needed = pipeline[1]["$match"]["$expr"]["$gte"][1]
+        return [
+            project(d, pipeline[2]["$project"]) for d in db.ocr_cache.docs
+            if len(bands & set(d["bands"])) >= needed
+        ]
+    db.ocr_cache.aggregate_result = aggregate
+    return db
+
+
+def test_bands_are_position_tagged_bytes():
+    assert hash_bands(0x0102030405060708) == ["0:08", "1:07", "2:06", "3:05", "4:04", "5:03", "6:02", "7:01"]
+    assert hash_bands(0)[3] != hash_bands(0)[4]  # same byte, different position
+
+
+def test_hamming_counts_differing_bits():
+    assert hamming(BASE, BASE) == 0
+    assert hamming(0b1011, 0b0001) == 2
+    assert hamming(BASE, flip(BASE, 0, 9, 63)) == 3
+
+
+def test_hashes_within_distance_d_share_at_least_bands_minus_d():
+    rng = random.Random(7)
+    for _ in range(200):
+        bits = rng.sample(range(64), rng.randint(0, BANDS - 1))
+        near = flip(BASE, *bits)
+        shared = len(set(hash_bands(BASE)) & set(hash_bands(near)))
+        assert shared >= BANDS - hamming(BASE, near)
+
+
+def test_dhash_tolerates_a_slightly_different_shot():
+    img = Image.linear_gradient("L").resize((90, 80))
+    brighter = img.point(lambda p: min(255, p + 3))
+    assert dhash(img) == dhash(img.copy())
+    assert hamming(dhash(img), dhash(brighter)) <= 6
+
+
+def test_near_duplicate_hits_the_persistent_tier_and_fills_memory():
+    db = cache_db()
+    asyncio.run(OCRResultCache(max_distance=6).put(db, BASE, {"text": "Aspirin"}))
+    cache = OCRResultCache(max_distance=6)  # another worker: empty memory tier
+    near = flip(BASE, 1, 20, 40)
+    assert asyncio.run(cache.get(db, near)) == {"text": "Aspirin"}
+    assert asyncio.run(cache.get(db, near)) == {"text": "Aspirin"}
+    assert (cache.hits_persistent, cache.hits_memory) == (1, 1)
+    # The server only kept documents sharing at least 8 - 6 bands
+    assert db.ocr_cache.pipelines[0][1]["$match"]["$expr"]["$gte"][1] == 2
+
+
+def test_nearest_of_many_candidates_wins_without_a_cap():
+    db = cache_db()
+    writer = OCRResultCache(max_distance=6)
+    # Far more same-band entries than the old 100-document cap, the match stored last
+    for i in range(150):
+        asyncio.run(writer.put(db, flip(BASE, 8 + i % 56, 8 + (i * 7 + 3) % 56, 0, 1, 2, 3, 4), {"n": i}))
+    asyncio.run(writer.put(db, flip(BASE, 5), {"n": "nearest"}))
+    assert asyncio.run(OCRResultCache(max_distance=6).get(db, BASE)) == {"n": "nearest"}
+
+
+def test_distance_cutoff():
+    db = cache_db()
+    asyncio.run(OCRResultCache(max_distance=3).put(db, BASE, {"text": "Aspirin"}))
+    at_cutoff, beyond = flip(BASE, 0, 10, 20), flip(BASE, 0, 10, 20, 30)
+    assert asyncio.run(OCRResultCache(max_distance=3).get(db, at_cutoff)) == {"text": "Aspirin"}
+    cache = OCRResultCache(max_distance=3)
+    assert asyncio.run(cache.get(db, beyond)) is None
+    assert cache.misses == 1
+
+
+def test_max_distance_is_capped_at_what_the_bands_guarantee():
+    assert OCRResultCache(max_distance=20).max_distance == BANDS - 1
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = OCRResultCache(max_distance=0, lru_size=2)
+    now = datetime.utcnow()
+    cache._remember(1, {"n": 1}, now)
+    cache._remember(2, {"n": 2}, now)
+    assert cache._lookup_memory(1) == {"n": 1}  # 1 is now the most recent
+    cache._remember(3, {"n": 3}, now)
+    assert list(cache._lru) == [1, 3]
+    assert cache._lookup_memory(2) is None
+
+
+def test_memory_tier_entries_expire_with_the_ttl():
+    cache = OCRResultCache(max_distance=6)
+    expired = datetime.utcnow() - timedelta(seconds=ocr_cache_module.OCR_CACHE_TTL_SECONDS + 1)
+    cache._remember(BASE, {"text": "old"}, expired)
+    assert cache._lookup_memory(BASE) is None
+    cache._remember(flip(BASE, 1), {"text": "fresh"}, datetime.utcnow())
+    assert cache._lookup_memory(BASE) == {"text": "fresh"}
@@ -0,0 +1,38 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from pagination import InvalidCursorError, decode_cursor, encode_cursor, fetch_page
+from tests.conftest import FakeCollection
+
+
+def test_cursor_round_trip_truncates_to_milliseconds():
+    cursor = encode_cursor({"created_at": datetime(2026, 10, 12, 8, 0, 0, 123456), "id": "abc"})
+    assert decode_cursor(cursor) == (datetime(2026, 10, 12, 8, 0, 0, 123000), "abc")
+
+
+@pytest.mark.parametrize("cursor", ["", "!!!", "bm90IGpzb24", "WzFd", "WzEsMl0"])
+def test_garbage_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_cover_ties_without_gaps_or_repeats(descending):
+    # Several documents share a created_at, so id has to break the tie
+    docs = [
+        {"id": f"{i:03d}", "patient_id": "p1", "created_at": datetime(2026, 10, 12, 8, i // 3)}
+        for i in range(10)
+    ]
+    collection = FakeCollection(docs)
+    seen, cursor = [], None
+    while True:
+        page, cursor = asyncio.run(
+            fetch_page(collection, {"patient_id": "p1"}, {}, 4, cursor, descending=descending)
+        )
+        seen.extend(d["id"] for d in page)
+        if cursor is None:
+            break
+    assert seen == sorted(seen, reverse=descending)
+    assert sorted(seen) == [d["id"] for d in docs]
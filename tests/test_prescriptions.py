@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+import server
+from ai_cache import ExplanationCache
+from search_index import MedicationSearchIndex
+from tests.conftest import FakeCollection
+
+
+@pytest.fixture
+def medications(fake_db, monkeypatch):
+    fake_db["medications"] = FakeCollection(unique=("id", "name_normalized"))
+    monkeypatch.setattr(server, "db", fake_db)
+    monkeypatch.setattr(server, "medication_index", MedicationSearchIndex())
+    monkeypatch.setattr(server, "explanation_cache", ExplanationCache())
+    return fake_db.medications
+
+
+def prescription(name, **fields):
+    return {"patient_id": "p1", "medication_name": name, "dosage": "1 tablet", "frequency": "daily",
+            "schedule": {"times": ["08:00"]}, "start_date": "2026-10-01", **fields}
+
+
+def test_new_name_is_created_once_and_indexed(medications):
+    medication = asyncio.run(server.resolve_medication("Paracetamol", "For pain"))
+    assert medications.docs[0]["name_normalized"] == "paracetamol"
+    assert (medication["name"], medication["description"]) == ("Paracetamol", "For pain")
+    assert [doc["id"] for doc in server.medication_index.search("paracet")] == [medication["id"]]
+
+
+def test_spellings_differing_in_case_or_whitespace_share_one_record(medications):
+    ids = {asyncio.run(server.resolve_medication(name))["id"]
+           for name in ["Paracetamol", "  PARACETAMOL ", "paracetamol\t"]}
+    assert len(ids) == 1 and len(medications.docs) == 1
+    assert medications.docs[0]["name"] == "Paracetamol"  # the first spelling is kept
+
+
+def test_first_record_for_a_name_drops_explanations_cached_under_it(medications, fake_db):
+    fake_db.ai_explanations.docs.append(
+        {"key": "name:paracetamol|summary|en|v1", "medication_key": "name:paracetamol"}
+    )
+    asyncio.run(server.resolve_medication("Paracetamol"))
+    assert fake_db.ai_explanations.docs == []
+
+
+def test_lost_insert_race_retries_and_matches_the_winner(medications):
+    upsert = medications.find_one_and_update
+    calls = []
+
+    async def racing(query, update, **kwargs):
+        calls.append(query)
+        if len(calls) == 1:
+            # Another request inserts the same name between our match and our insert
+            medications.docs.append(
+                {"_id": 1, "id": "winner", "name": "PARACETAMOL", "name_normalized": "paracetamol"}
+            )
+            raise DuplicateKeyError("E11000 duplicate key error name_normalized", 11000)
+        return await upsert(query, update, **kwargs)
+
+    medications.find_one_and_update = racing
+    assert asyncio.run(server.resolve_medication("Paracetamol"))["id"] == "winner"
+    assert len(calls) == 2 and len(medications.docs) == 1
+
+
+def test_second_duplicate_key_error_propagates(medications):
+    async def always_duplicate(query, update, **kwargs):
+        raise DuplicateKeyError("E11000 duplicate key error name_normalized", 11000)
+
+    medications.find_one_and_update = always_duplicate
+    with pytest.raises(DuplicateKeyError):
+        asyncio.run(server.resolve_medication("Paracetamol"))
+
+
+@pytest.mark.parametrize("name", ["", "   ", " -?- "])
+def test_name_without_letters_or_digits_is_refused(medications, name):
+    with pytest.raises(ValueError):
+        asyncio.run(server.resolve_medication(name))
+    assert medications.docs == []
+
+
+@pytest.mark.parametrize("name", ["", " -?- "])
+def test_add_prescription_rejects_an_unkeyable_name_with_400(api, medications, fake_db, name):
+    response = api.post("/api/prescriptions", json=prescription(name))
+    assert response.status_code == 400
+    assert medications.docs == [] and fake_db.prescriptions.docs == []
+
+
+def test_add_prescription_reuses_the_medication_across_spellings(api, medications, fake_db):
+    first = api.post("/api/prescriptions", json=prescription("Paracetamol", description="For pain")).json()
+    second = api.post("/api/prescriptions", json=prescription(" paracetamol ", patient_id="p2")).json()
+    assert first["prescription"]["medication_id"] == second["prescription"]["medication_id"]
+    assert len(medications.docs) == 1 and len(fake_db.prescriptions.docs) == 2
+    # The description falls back to the shared medication's
+    assert second["prescription"]["description"] == "For pain"
@@ -0,0 +1,30 @@
+import pytest
+
+from projections import InvalidFieldsError, Resource
+
+MEDICATION = Resource("medication", ["id", "name", "strength", "image_base64", "description"],
+                      heavy=["image_base64", "description"])
+LOG = Resource("reminder log", ["id", "action", "note", "created_at"], required=("id", "created_at"))
+
+
+def test_default_projections():
+    assert MEDICATION.projection(None) == {"_id": 0}
+    assert MEDICATION.projection("", list_view=True) == {"_id": 0, "description": 0, "image_base64": 0}
+
+
+def test_fields_become_an_inclusion_projection_with_required_keys():
+    assert MEDICATION.projection(" name, strength,name") == {"_id": 0, "id": 1, "name": 1, "strength": 1}
+    # Pagination cursors need created_at even when the client didn't ask for it
+    assert LOG.projection("action", list_view=True) == {"_id": 0, "id": 1, "created_at": 1, "action": 1}
+
+
+def test_unknown_fields_are_rejected():
+    with pytest.raises(InvalidFieldsError, match="password"):
+        MEDICATION.projection("name,password")
+
+
+def test_select_matches_projection_in_memory():
+    doc = {"id": "m1", "name": "Ibuprofen", "strength": "200mg", "image_base64": "...", "description": "..."}
+    assert MEDICATION.select(doc, None, list_view=True) == {"id": "m1", "name": "Ibuprofen", "strength": "200mg"}
+    assert MEDICATION.select(doc, "image_base64") == {"id": "m1", "image_base64": "..."}
+    assert MEDICATION.select(doc, None) is doc
@@ -0,0 +1,91 @@
+import pytest
+
+import server
+
+
+@pytest.fixture
+def db(fake_db):
+    fake_db.prescriptions.docs.append({"_id": 0, "id": "rx1", "current_stock": 9})
+    return fake_db
+
+
+def log(action):
+    return {"prescription_id": "rx1", "patient_id": "p1", "action": action}
+
+
+def test_log_counts_the_action_in_its_rollup(api, db):
+    response = api.post("/api/reminders/log", json=log("took"))
+    assert response.status_code == 200
+    assert response.json()["current_stock"] == 8
+    assert [d["action"] for d in db.reminder_logs.docs] == ["took"]
+    (rollup,) = db.adherence_daily.docs
+    assert (rollup["counts"], rollup["total"]) == ({"took": 1}, 1)
+
+
+@pytest.mark.parametrize("action", ["", "skipped", "took.x", "$set"])
+def test_unknown_action_is_rejected_before_anything_is_written(api, db, action):
+    response = api.post("/api/reminders/log", json=log(action))
+    assert response.status_code == 400
+    assert db.reminder_logs.docs == [] and db.adherence_daily.docs == []
+
+
+def test_logs_retract_sweeper_misses_only_when_the_sweeper_runs(api, db, monkeypatch):
+    retracted = []
+
+    async def retract(db, logs):
+        retracted.append([log["action"] for log in logs])
+
+    monkeypatch.setattr(server, "retract_superseded_misses", retract)
+    api.post("/api/reminders/log", json=log("took"))
+    assert retracted == []
+
+    monkeypatch.setattr(server, "missed_dose_sweeper", object())
+    api.post("/api/reminders/log", json=log("took"))
+    api.post("/api/reminders/log/batch", json=batch({"action": "missed"}))
+    assert retracted == [["took"], ["missed"]]
+
+
+def batch(*items):
+    return {"items": [{"prescription_id": "rx1", "patient_id": "p1", **item} for item in items]}
+
+
+def test_batch_reports_each_item_and_writes_once(api, db):
+    response = api.post("/api/reminders/log/batch", json=batch(
+        {"id": "a", "action": "took", "action_at": "2024-03-10T08:05:00+01:00"},
+        {"id": "b", "action": "took"},
+        {"id": "c", "action": "exploded"},
+        {"action": "missed"},
+    ))
+    body = response.json()
+    assert response.status_code == 200
+    assert [r["status"] for r in body["results"]] == ["created", "created", "invalid", "created"]
+    assert body["summary"] == {"created": 3, "invalid": 1}
+    assert body["current_stock"] == {"rx1": 7}
+
+    first = db.reminder_logs.docs[0]
+    assert first["action_at"].isoformat() == "2024-03-10T07:05:00"  # stored as naive UTC
+    assert first["created_at"] == first["action_at"]
+    # One bulk write each for rollups and stock; logs land on their own days
+    assert len(db.adherence_daily.bulk_writes) == len(db.prescriptions.bulk_writes) == 1
+    counts = {d["day"]: d["counts"] for d in db.adherence_daily.docs}
+    assert counts["2024-03-10"] == {"took": 1}
+    assert sum(c.get("took", 0) for c in counts.values()) == 2
+
+
+def test_resent_items_are_duplicates_and_change_nothing(api, db):
+    api.post("/api/reminders/log/batch", json=batch({"id": "a", "action": "took"}))
+    response = api.post("/api/reminders/log/batch", json=batch(
+        {"id": "a", "action": "took"}, {"id": "b", "action": "snoozed"}
+    ))
+    assert [r["status"] for r in response.json()["results"]] == ["duplicate", "created"]
+    assert [d["id"] for d in db.reminder_logs.docs] == ["a", "b"]
+    (rollup,) = db.adherence_daily.docs
+    assert rollup["counts"] == {"took": 1, "snoozed": 1}
+    assert db.prescriptions.docs[0]["current_stock"] == 8  # only the first batch took a dose
+
+
+def test_oversized_batch_is_rejected(api, db, monkeypatch):
+    monkeypatch.setattr(server, "REMINDER_BATCH_MAX", 2)
+    response = api.post("/api/reminders/log/batch", json=batch(*[{"action": "took"}] * 3))
+    assert response.status_code == 400
+    assert db.reminder_logs.docs == []
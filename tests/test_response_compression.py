@@ -0,0 +1,74 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response
+from fastapi.testclient import TestClient
+
+from response_compression import CompressionMiddleware, ResponseCompressor, choose_encoding
+
+BODY = "dose taken with food; " * 200
+
+
+def client(**options):
+    compressor = ResponseCompressor(**options)
+    app = FastAPI()
+
+    @app.get("/history/{patient_id}")
+    async def history(patient_id: str):
+        return PlainTextResponse(BODY, headers={"ETag": '"h.1"'})
+
+    @app.get("/tiny")
+    async def tiny():
+        return PlainTextResponse("ok")
+
+    @app.get("/photo")
+    async def photo():
+        return Response(b"\xff\xd8" + b"\x00" * 5000, media_type="image/jpeg")
+
+    app.add_middleware(CompressionMiddleware, compressor=compressor)
+    return TestClient(app), compressor
+
+
+def test_negotiation_honours_q_values_then_server_preference():
+    available = ("zstd", "br", "gzip")
+    assert choose_encoding("gzip, br", available) == "br"
+    assert choose_encoding("gzip;q=1, br;q=0.5", available) == "gzip"
+    assert choose_encoding("zstd;q=0, *", available) == "br"
+    assert choose_encoding("identity", available) is None
+    assert choose_encoding(None, available) is None
+
+
+def test_gzip_above_threshold_with_weak_etag_and_vary():
+    api, compressor = client(offload_bytes=1)
+    response = api.get("/history/p1", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"h.1"'
+    assert response.text == BODY  # httpx decodes it transparently
+    route = compressor.stats()["routes"]["/history/{patient_id}"]
+    assert route["compressed"] == 1 and route["ratio"] > 10
+    assert compressor.stats()["offloaded"] == 1
+
+
+def test_small_and_precompressed_bodies_pass_through():
+    api, compressor = client()
+    for path in ("/tiny", "/photo"):
+        response = api.get(path, headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+    photo = compressor.stats()["routes"]["/photo"]
+    assert (photo["responses"], photo["compressed"]) == (1, 0)
+
+
+def decompress(coding, codec, body):
+    if coding == "zstd":
+        return codec.ZstdDecompressor().decompress(body)
+    return codec.decompress(body)
+
+
+@pytest.mark.parametrize("coding, module", [("br", "brotli"), ("zstd", "zstandard")])
+def test_optional_codings(coding, module):
+    codec = pytest.importorskip(module)
+    api, _ = client()
+    with api.stream("GET", "/history/p1", headers={"Accept-Encoding": f"gzip;q=0.5, {coding}"}) as response:
+        assert response.headers["content-encoding"] == coding
+        raw = b"".join(response.iter_raw())
+    assert decompress(coding, codec, raw).decode() == BODY
@@ -0,0 +1,92 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from schedule import (
+    ScheduleRangeError, expand_schedules, log_minutes, match_logs, occurrence_statuses,
+    parse_bound, parse_time, summarize_statuses
+)
+
+
+def prescription(id, times, days=None, start="2026-10-01", end=None):
+    return {"id": id, "schedule": {"times": times, "days": days or []}, "start_date": start, "end_date": end}
+
+
+def as_strings(occurrences):
+    return [str(t) for t in occurrences.scheduled_at]
+
+
+def test_parse_time_formats():
+    assert parse_time("08:00") == 480
+    assert parse_time("8:05 PM") == 20 * 60 + 5
+    assert parse_time("12:00 am") == 0
+    assert parse_time("25:00") is None
+    assert parse_time("soon") is None
+
+
+def test_expansion_is_time_ordered_across_prescriptions():
+    occurrences = expand_schedules(
+        [prescription("a", ["20:00", "08:00"]), prescription("b", ["12:00"])],
+        datetime(2026, 10, 12), datetime(2026, 10, 14)
+    )
+    assert as_strings(occurrences) == [
+        "2026-10-12T08:00", "2026-10-12T12:00", "2026-10-12T20:00",
+        "2026-10-13T08:00", "2026-10-13T12:00", "2026-10-13T20:00",
+    ]
+    assert [occurrences.prescription_ids[p] for p in occurrences.prescription] == ["a", "b", "a"] * 2
+
+
+def test_weekdays_dates_and_offset():
+    occurrences = expand_schedules(
+        [prescription("a", ["08:00"], days=["Mon", "Thu"], start="2026-10-13", end="2026-10-19")],
+        datetime(2026, 10, 1), datetime(2026, 11, 1), utc_offset_minutes=120
+    )
+    # Mon 12th is before the start date, Thu 15th and Mon 19th are in; 08:00 local is 06:00 UTC
+    assert as_strings(occurrences) == ["2026-10-15T06:00", "2026-10-19T06:00"]
+
+
+def test_range_is_half_open_and_bounded():
+    occurrences = expand_schedules([prescription("a", ["08:00"])], datetime(2026, 10, 12, 8), datetime(2026, 10, 13, 8))
+    assert as_strings(occurrences) == ["2026-10-12T08:00"]
+    with pytest.raises(ScheduleRangeError):
+        expand_schedules([], datetime(2026, 1, 1), datetime(2028, 1, 1))
+    with pytest.raises(ScheduleRangeError):
+        expand_schedules([], datetime(2026, 1, 2), datetime(2026, 1, 1))
+
+
+def test_parse_bound_dates_are_local_days():
+    assert parse_bound("2026-10-12", 120, end=False) == datetime(2026, 10, 11, 22)
+    assert parse_bound("2026-10-12", 120, end=True) == datetime(2026, 10, 12, 22)
+    assert parse_bound("2026-10-12T10:00:00+02:00", 0, end=False) == datetime(2026, 10, 12, 8)
+    with pytest.raises(ScheduleRangeError):
+        parse_bound("yesterday", 0, end=False)
+
+
+def test_logs_mark_nearest_occurrence():
+    occurrences = expand_schedules(
+        [prescription("a", ["08:00", "20:00"]), prescription("b", ["08:00"])],
+        datetime(2026, 10, 12), datetime(2026, 10, 13)
+    )
+    logs = [
+        ("a", datetime(2026, 10, 12, 8, 40), "snoozed"),
+        ("a", datetime(2026, 10, 12, 9, 10), "took"),    # beats the snooze on the same dose
+        ("b", datetime(2026, 10, 12, 7, 0), "missed"),
+        ("a", datetime(2026, 10, 12, 14, 0), "took"),    # outside the match window of both doses
+        ("zzz", datetime(2026, 10, 12, 8, 0), "took"),   # unknown prescription
+    ]
+    ranks = match_logs(
+        occurrences, [l[0] for l in logs], log_minutes(l[1] for l in logs), [l[2] for l in logs]
+    )
+    statuses = occurrence_statuses(occurrences, ranks, now=datetime(2026, 10, 12, 21))
+    assert summarize_statuses(statuses) == {"total": 3, "taken": 1, "missed": 1, "pending": 1}
+
+    # Once the grace period has passed the unanswered 20:00 dose counts as missed
+    statuses = occurrence_statuses(occurrences, ranks, now=datetime(2026, 10, 13, 1))
+    assert summarize_statuses(statuses)["missed"] == 2
+
+
+def test_empty_inputs():
+    occurrences = expand_schedules([prescription("a", [])], datetime(2026, 10, 12), datetime(2026, 10, 13))
+    assert len(occurrences.scheduled_at) == 0
+    assert match_logs(occurrences, [], np.empty(0, np.int64), []).size == 0
@@ -0,0 +1,77 @@
+import asyncio
+
+from migrations import renormalize_names
+from search_index import MedicationSearchIndex, normalize
+from tests.conftest import FakeCollection, FakeDB
+
+
+def med(id, name, generic_name=None):
+    return {"id": id, "name": name, "generic_name": generic_name}
+
+
+def names(results):
+    return [doc["name"] for doc in results]
+
+
+def test_ranks_exact_then_prefix_then_word_then_substring():
+    index = MedicationSearchIndex()
+    for i, name in enumerate(["Aspirin Plus", "Baby Aspirin", "Aspirin", "Paspirinol"]):
+        index.add(med(str(i), name))
+    assert names(index.search("aspirin")) == ["Aspirin", "Aspirin Plus", "Baby Aspirin", "Paspirinol"]
+
+
+def test_reindexing_replaces_the_old_entry_without_growing():
+    index = MedicationSearchIndex()
+    index.add(med("1", "Ibuprofen", "Advil"))
+    index.add(med("2", "Paracetamol"))
+    sizes = (len(index._docs), len(index._keys[0]), len(index._keys[1]), len(index._postings))
+
+    for name in ["Ibuprofen Forte", "Ibuprofen Extra", "Ibuprofen"]:
+        index.add(med("1", name, "Advil"))
+    assert (len(index._docs), len(index._keys[0]), len(index._keys[1]), len(index._postings)) == sizes
+
+    index.add(med("1", "Nurofen"))
+    assert index.search("ibuprofen") == [] and index.search("advil") == []
+    assert names(index.search("nuro")) == ["Nurofen"]
+    assert names(index.search("urofe")) == ["Nurofen"]
+    assert "pro" not in index._postings
+
+
+def test_reindexing_before_a_flush():
+    index = MedicationSearchIndex()
+    index.add(med("1", "Metformin"), sort=False)
+    index.add(med("1", "Metformin XR"), sort=False)
+    index.flush()
+    assert names(index.search("metformin")) == ["Metformin XR"]
+    assert len(index._keys[0]) == 1
+
+
+def test_normalize_keeps_every_script():
+    assert normalize("Paracétamol_500mg") == "paracetamol 500mg"
+    assert normalize("STRAẞE") == normalize("straße") == "strasse"
+    keys = {normalize(name) for name in ["पैरासिटामोल", "क्रीम", "Парацетамол", "对乙酰氨基酚", "Ibuprofen"]}
+    assert len(keys) == 5 and "" not in keys
+    assert normalize("पैरासिटामोल") == "पैरासिटामोल"  # vowel signs stay attached
+    assert normalize(" -?- ") == ""
+
+
+def test_non_latin_names_are_searchable():
+    index = MedicationSearchIndex()
+    index.add(med("1", "Парацетамол"))
+    index.add(med("2", "पैरासिटामोल"))
+    assert names(index.search("парацет")) == ["Парацетамол"]
+    assert names(index.search("सिटा")) == ["पैरासिटामोल"]
+
+
+def test_shared_empty_key_is_split_up():
+    docs = [
+        {"id": "shared", "name": "Парацетамол", "name_normalized": ""},
+        {"id": "latin", "name": "Ibuprofen", "name_normalized": "ibuprofen"},
+        {"id": "blank", "name": "???", "name_normalized": "x"},
+    ]
+    explanations = [{"key": f"{key}|summary|en|v1", "medication_key": key} for key in ("shared", "name:", "latin")]
+    db = FakeDB(medications=FakeCollection(docs, unique=("id", "name_normalized")),
+                ai_explanations=FakeCollection(explanations))
+    assert asyncio.run(renormalize_names(db)) == 2
+    assert [d.get("name_normalized") for d in db.medications.docs] == ["парацетамол", "ibuprofen", None]
+    assert [d["medication_key"] for d in db.ai_explanations.docs] == ["latin"]
@@ -0,0 +1,43 @@
+import uuid
+from datetime import datetime
+
+import numpy as np
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from serialization import APIResponse, JSONObject, JSONObjectRoute, dumps
+
+
+def client(router):
+    app = FastAPI(default_response_class=APIResponse)
+    app.include_router(router)
+    return TestClient(app)
+
+
+def test_unannotated_routes_get_a_type_adapter_and_responses_pass_through():
+    router = APIRouter(route_class=JSONObjectRoute)
+    moment = datetime(2026, 10, 12, 8, 30, 0, 250000)
+    ident = uuid.UUID(int=1)
+
+    @router.get("/doc")
+    async def doc():
+        return {"at": moment, "id": ident, "tags": {"a"}}
+
+    @router.get("/stream")
+    async def stream():
+        return StreamingResponse(iter([b"data: 1\n\n"]), media_type="text/event-stream")
+
+    @router.get("/raw", response_model=None)
+    async def raw():
+        return {"ok": True}
+
+    assert [r.response_model for r in router.routes] == [JSONObject, JSONObject, None]
+    api = client(router)
+    assert api.get("/doc").json() == {"at": "2026-10-12T08:30:00.250000", "id": str(ident), "tags": ["a"]}
+    assert api.get("/stream").text == "data: 1\n\n"
+    assert api.get("/raw").json() == {"ok": True}
+
+
+def test_dumps_handles_numpy_and_non_string_keys():
+    assert dumps({"n": np.int64(3), 1: [np.float32(0.5)]}) == b'{"n":3,"1":[0.5]}'
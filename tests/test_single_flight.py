@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight, fingerprint
+
+
+class StubLLM:
+    """Local stand-in for the upstream model: counts calls, answers after a delay"""
+
+    def __init__(self, delay: float = 0.05, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def complete(self, prompt: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream unavailable")
+        return f"answer to {prompt}"
+
+
+def test_concurrent_identical_requests_make_one_upstream_call():
+    async def scenario():
+        flight, llm = SingleFlight("test"), StubLLM()
+        key = fingerprint("explain", "gpt-4o-mini", "Explain Metformin")
+        results = await asyncio.gather(*[
+            flight.do(key, lambda: llm.complete("Explain Metformin")) for _ in range(50)
+        ])
+        return flight, llm, results
+
+    flight, llm, results = asyncio.run(scenario())
+    assert llm.calls == 1
+    assert set(results) == {"answer to Explain Metformin"}
+    stats = flight.stats()
+    assert stats["executions"] == 1
+    assert stats["collapsed"] == 49
+    assert stats["collapse_ratio"] == 0.98
+    assert stats["max_waiters"] == 49
+    assert stats["in_flight"] == 0
+
+
+def test_distinct_prompts_are_not_collapsed():
+    async def scenario():
+        flight, llm = SingleFlight("test"), StubLLM()
+        await asyncio.gather(*[
+            flight.do(fingerprint(p), lambda p=p: llm.complete(p)) for p in ("a", "b", "c")
+        ])
+        return llm
+
+    assert asyncio.run(scenario()).calls == 3
+
+
+def test_sequential_requests_start_fresh_executions():
+    async def scenario():
+        flight, llm = SingleFlight("test"), StubLLM(delay=0)
+        for _ in range(3):
+            await flight.do("same", lambda: llm.complete("x"))
+        return llm
+
+    assert asyncio.run(scenario()).calls == 3
+
+
+def test_failure_is_shared_by_all_waiters():
+    async def scenario():
+        flight, llm = SingleFlight("test"), StubLLM(fail=True)
+        results = await asyncio.gather(
+            *[flight.do("k", lambda: llm.complete("x")) for _ in range(5)],
+            return_exceptions=True
+        )
+        return flight, llm, results
+
+    flight, llm, results = asyncio.run(scenario())
+    assert llm.calls == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    async def scenario():
+        flight, llm = SingleFlight("test"), StubLLM(delay=0.05)
+        first = asyncio.ensure_future(flight.do("k", lambda: llm.complete("x")))
+        second = asyncio.ensure_future(flight.do("k", lambda: llm.complete("x")))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return llm, await second
+
+    llm, result = asyncio.run(scenario())
+    assert llm.calls == 1
+    assert result == "answer to x"
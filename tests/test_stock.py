@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def db(fake_db):
+    fake_db.prescriptions.docs.append({"_id": 0, "id": "rx1", "current_stock": 2, "revision": 1})
+    return fake_db
+
+
+def put_stock(api, prescription_id="rx1", **fields):
+    return api.put(f"/api/prescriptions/{prescription_id}/stock",
+                   json={"prescription_id": prescription_id, **fields})
+
+
+def stock(db):
+    return db.prescriptions.docs[0]["current_stock"]
+
+
+def test_adjustment_echoes_the_new_level(api, db):
+    response = put_stock(api, adjustment=-1)
+    assert response.status_code == 200
+    assert response.json()["current_stock"] == stock(db) == 1
+    assert db.prescriptions.docs[0]["revision"] == 2
+
+
+def test_refill_adds_to_the_stock(api, db):
+    assert put_stock(api, adjustment=30).json()["current_stock"] == stock(db) == 32
+
+
+def test_absolute_level_is_set_and_echoed(api, db):
+    assert put_stock(api, new_stock=60).json()["current_stock"] == stock(db) == 60
+
+
+def test_decrement_below_zero_is_refused_and_leaves_the_stock(api, db):
+    db.prescriptions.docs[0]["current_stock"] = 0
+    response = put_stock(api, adjustment=-1)
+    assert response.status_code == 409
+    assert stock(db) == 0
+    # Partial decrements are refused too, not clamped
+    db.prescriptions.docs[0]["current_stock"] = 2
+    assert put_stock(api, adjustment=-3).status_code == 409
+    assert stock(db) == 2
+
+
+@pytest.mark.parametrize("fields", [{}, {"new_stock": 5, "adjustment": 1}])
+def test_exactly_one_of_new_stock_or_adjustment(api, db, fields):
+    assert put_stock(api, **fields).status_code == 400
+    assert stock(db) == 2
+
+
+@pytest.mark.parametrize("fields", [{"adjustment": -1}, {"adjustment": 5}, {"new_stock": 5}])
+def test_unknown_prescription_is_404_not_409(api, db, fields):
+    assert put_stock(api, "nope", **fields).status_code == 404
+
+
+def test_took_at_zero_stock_reports_the_level_unchanged(api, db):
+    db.prescriptions.docs[0]["current_stock"] = 0
+    response = api.post("/api/reminders/log", json={"prescription_id": "rx1", "patient_id": "p1", "action": "took"})
+    assert response.status_code == 200
+    assert response.json()["current_stock"] == stock(db) == 0
+
+
+def test_concurrent_took_logs_at_stock_one_decrement_once(db, monkeypatch):
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "reminder_log_writer", None)
+    monkeypatch.setattr(server, "missed_dose_sweeper", None)
+    db.prescriptions.docs[0]["current_stock"] = 1
+    request = server.LogReminderRequest(prescription_id="rx1", patient_id="p1", action="took")
+    find_one_and_update = db.prescriptions.find_one_and_update
+
+    async def after_the_other_request(*args, **kwargs):
+        await asyncio.sleep(0)  # let both requests reach the update before either applies
+        return await find_one_and_update(*args, **kwargs)
+
+    db.prescriptions.find_one_and_update = after_the_other_request
+
+    async def both():
+        return await asyncio.gather(server.log_reminder_action(request), server.log_reminder_action(request))
+
+    results = asyncio.run(both())
+    assert [r["current_stock"] for r in results] == [0, 0]
+    assert stock(db) == 0
+    assert len(db.reminder_logs.docs) == 2  # both doses are logged; only the stock is floored